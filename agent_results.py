@@ -0,0 +1,194 @@
+"""
+Compact agent tool results, with the full results kept in-process behind handles
+
+The agent tool functions used to hand the model the whole nested result as
+indented JSON: every searched URL, every code each site matched with its
+pattern, and up to five web search snippets per code. A summary keeps what
+the model acts on (the top candidate codes, each code's verdict, each site's
+status) plus a handle:
+
+    {"handle":"r3","product":"Space Marine Captain","status":"validated",
+     "validated_codes":["5011921000036"],"top_codes":[...],"sites":{...}}
+
+The full result stays in a process-wide ResultStore. get_details pages through
+any part of it, addressed by a path of keys and list indexes separated by '/',
+e.g. "site_search/site_results" or "0/web_validation/codes_validated/10-13".
+The store keeps the most recent max_results results, so old handles expire.
+"""
+
+import itertools
+import json
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+# Candidate codes listed in a search summary
+DEFAULT_TOP_CODES = 5
+# Items returned per page of details
+DEFAULT_PAGE_SIZE = 10
+# Results kept for details before the oldest are dropped
+DEFAULT_MAX_RESULTS = 256
+
+
+class ResultStore:
+    """Thread-safe LRU store of full results, keyed by short handles"""
+
+    def __init__(self, max_results: int = DEFAULT_MAX_RESULTS):
+        self.max_results = max(1, max_results)
+        self._lock = threading.Lock()
+        self._results: OrderedDict = OrderedDict()
+        self._ids = itertools.count(1)
+
+    def put(self, result: Any) -> str:
+        """Keep a result and return its handle"""
+        with self._lock:
+            handle = f"r{next(self._ids)}"
+            self._results[handle] = result
+            while len(self._results) > self.max_results:
+                self._results.popitem(last=False)
+            return handle
+
+    def get(self, handle: str) -> Optional[Any]:
+        """Return the result behind a handle, or None if it has expired"""
+        with self._lock:
+            result = self._results.get(handle)
+            if result is not None:
+                self._results.move_to_end(handle)
+            return result
+
+
+_store = ResultStore()
+
+
+def result_store() -> ResultStore:
+    """The process-wide store the agent tool functions keep their results in"""
+    return _store
+
+
+def to_json(payload: Any) -> str:
+    """Serialize a payload for the model without indentation or padding"""
+    return json.dumps(payload, separators=(',', ':'), ensure_ascii=False)
+
+
+def compact_search(result: Dict[str, Any], top: int = DEFAULT_TOP_CODES) -> Dict[str, Any]:
+    """
+    Summarize a site search: the best candidate codes and each site's status
+
+    Codes come from the ranked 'candidates' when pruning ran, otherwise from
+    'found_codes' in the order found.
+    """
+    candidates = result.get('candidates')
+    if candidates is not None:
+        top_codes = [{'code': candidate['code'], 'score': candidate['score'], 'sites': len(candidate['sites'])}
+                     for candidate in candidates[:top]]
+    else:
+        top_codes = [{'code': code} for code in result.get('found_codes', [])[:top]]
+
+    summary = {
+        'product': result.get('product_name'),
+        'codes_found': len(result.get('found_codes', [])),
+        'top_codes': top_codes,
+        'sites': {site: site_result.get('status') for site, site_result in result.get('site_results', {}).items()},
+    }
+    if result.get('from_index'):
+        summary['from_index'] = True
+    return summary
+
+
+def compact_validation(result: Dict[str, Any]) -> Dict[str, Any]:
+    """Summarize a web validation: the verdict and each code's match count"""
+    summary = {
+        'product': result.get('product_name'),
+        'status': result.get('status'),
+        'validated_codes': result.get('validated_codes', []),
+        'codes': {code: {'matches': entry['matches_found'], 'validated': entry['is_validated']}
+                  for code, entry in result.get('codes_validated', {}).items()},
+    }
+    for key in ('message', 'error'):
+        if result.get(key):
+            summary[key] = result[key]
+    return summary
+
+
+def compact_product(result: Dict[str, Any], top: int = DEFAULT_TOP_CODES) -> Dict[str, Any]:
+    """Summarize one product's search and validation (a process_product result)"""
+    if 'error' in result:
+        # The pipeline reports a product whose stage raised with just its name and the error
+        return {'product': result['product_name'], 'status': 'error', 'error': result['error']}
+    search = compact_search(result['site_search'], top)
+    validation = compact_validation(result['web_validation'])
+    summary = {
+        'product': result['product_name'],
+        'status': validation['status'],
+        'validated_codes': validation['validated_codes'],
+        'top_codes': search['top_codes'],
+        'codes': validation['codes'],
+        'sites': search['sites'],
+    }
+    for key in ('message', 'error'):
+        if key in validation:
+            summary[key] = validation[key]
+    return summary
+
+
+def summary_payload(result: Any, summary: Dict[str, Any]) -> str:
+    """Keep a result in the store and return its summary, with the handle first, as JSON"""
+    return to_json({'handle': result_store().put(result), **summary})
+
+
+def get_details(handle: str, path: str = "", offset: int = 0, limit: int = DEFAULT_PAGE_SIZE) -> Dict[str, Any]:
+    """
+    Return one page of the part of a stored result a path points at
+
+    Lists are paged by index and dicts by key. Within the page, containers
+    nested more than one level down, or longer than a page, are shown as their
+    sizes (to be opened with a longer path). Scalars are returned whole.
+
+    Raises:
+        KeyError: If the handle has expired or the path leads nowhere
+    """
+    value = result_store().get(handle)
+    if value is None:
+        raise KeyError(f"Unknown or expired handle: {handle}")
+
+    for part in [part for part in path.split('/') if part]:
+        if isinstance(value, dict) and part in value:
+            value = value[part]
+        elif isinstance(value, list) and part.lstrip('-').isdigit() and -len(value) <= int(part) < len(value):
+            value = value[int(part)]
+        else:
+            raise KeyError(f"No '{part}' in {path!r}")
+
+    details = {'handle': handle, 'path': path}
+    if isinstance(value, dict):
+        keys = list(value)
+        page = {key: _preview(value[key]) for key in keys[offset:offset + limit]}
+    elif isinstance(value, list):
+        keys = value
+        page = [_preview(item) for item in value[offset:offset + limit]]
+    else:
+        details['value'] = value
+        return details
+
+    details.update(total=len(keys), offset=offset, items=page)
+    if offset + limit < len(keys):
+        details['next_offset'] = offset + limit
+    return details
+
+
+def _preview(value: Any, depth: int = 1) -> Any:
+    """
+    Show a page item with its scalars and short flat containers, and longer or
+    deeper containers (below depth levels) as their sizes
+    """
+    if isinstance(value, list):
+        if len(value) <= DEFAULT_PAGE_SIZE and all(not isinstance(item, (dict, list)) for item in value):
+            return value
+        return f"[{len(value)} items]"
+    if isinstance(value, dict):
+        if len(value) > DEFAULT_PAGE_SIZE:
+            return f"{{{len(value)} keys}}"
+        if depth <= 0:
+            return value if all(not isinstance(item, (dict, list)) for item in value.values()) else f"{{{len(value)} keys}}"
+        return {key: _preview(item, depth - 1) for key, item in value.items()}
+    return value
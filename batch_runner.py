@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+"""
+Streaming batch mode for the product validation pipeline
+
+Reads product names from a file or stdin one at a time, runs each through the
+scrape + validate pipeline, and writes one JSON line per product as soon as it
+finishes. Completed products are recorded in a checkpoint file, so a restarted
+run skips everything that is already done.
+
+Input lines can be plain product names or JSON (an object with a
+'product_name', 'product' or 'name' field, or a bare JSON string). Blank lines
+and lines starting with '#' are ignored.
+
+Usage:
+    python batch_runner.py products.txt -o results.jsonl
+    cat products.jsonl | python batch_runner.py - -o results.jsonl --min-matches 2
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import sys
+from typing import IO, Iterator, Optional, Set
+
+from candidates import DEFAULT_MAX_CANDIDATES
+from code_patterns import stop_after_matches
+from pipeline import ProductPipeline
+from product_validator import ProductValidator
+from validation_store import normalize_product_name
+from validator_pool import ValidatorPool
+
+PRODUCT_FIELDS = ('product_name', 'product', 'name')
+
+
+def iter_products(stream: IO[str], field: Optional[str] = None) -> Iterator[str]:
+    """
+    Yield product names from a text stream one line at a time
+
+    Args:
+        stream: Text stream of product names or JSON lines
+        field: JSON field holding the product name (tries product_name, product, name if None)
+    """
+    fields = (field,) if field else PRODUCT_FIELDS
+
+    for line_number, line in enumerate(stream, 1):
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+
+        if line[0] in '{"':
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                print(f"Skipping line {line_number}: invalid JSON", file=sys.stderr)
+                continue
+
+            if isinstance(record, dict):
+                record = next((record[name] for name in fields if record.get(name)), None)
+            if not isinstance(record, str) or not record.strip():
+                print(f"Skipping line {line_number}: no product name", file=sys.stderr)
+                continue
+            line = record.strip()
+
+        yield line
+
+
+class Checkpoint:
+    """Append-only record of products that have been written to the output"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.done: Set[str] = set()
+
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                self.done.update(line.rstrip('\n') for line in f if line.strip())
+
+        self._file = open(path, 'a', encoding='utf-8')
+
+    def is_done(self, product_name: str) -> bool:
+        return normalize_product_name(product_name) in self.done
+
+    def mark_done(self, product_name: str):
+        key = normalize_product_name(product_name)
+        self.done.add(key)
+        self._file.write(key + '\n')
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        self._file.close()
+
+
+def _process_each(validator: ProductValidator, products: Iterator[str], target_sites, code_patterns,
+                  min_matches: int) -> Iterator[dict]:
+    for product_name in products:
+        print(f"Processing: {product_name}", file=sys.stderr)
+        try:
+            yield validator.process_product(product_name, target_sites, code_patterns, min_matches)
+        except Exception as e:
+            yield {'product_name': product_name, 'error': str(e)}
+
+
+def _unfinished(result: dict) -> bool:
+    """Whether a result is worth retrying: the product failed, or its web validation could not be done"""
+    return 'error' in result or result.get('web_validation', {}).get('status') == 'error'
+
+
+def run_batch(validator: Optional[ProductValidator], products: Iterator[str], output: IO[str],
+              checkpoint: Optional[Checkpoint], target_sites, code_patterns, min_matches: int = 3,
+              metrics_file: Optional[str] = None, pipeline: Optional[ProductPipeline] = None) -> dict:
+    """
+    Process products, writing a JSONL result line for each as it completes
+
+    Products already in the checkpoint (by normalized name) are skipped. A
+    product is checkpointed only after its result line has been flushed to
+    disk, so a crash can at worst repeat the products that were in progress.
+    Products that failed, or whose web validation could not be done (the
+    search engine was down, say), are counted as failed and not checkpointed.
+
+    Products go through validator one by one, or through pipeline (in which
+    case validator may be None) with several in flight at once; pipelined
+    results are written in whatever order they finish.
+
+    If metrics_file is given, the validator's metrics are rewritten there
+    (Prometheus textfile for .prom, JSON otherwise) after every product.
+
+    Returns counts of processed, skipped and failed products.
+    """
+    summary = {'processed': 0, 'skipped': 0, 'failed': 0}
+
+    def pending() -> Iterator[str]:
+        for product_name in products:
+            if checkpoint is not None and checkpoint.is_done(product_name):
+                summary['skipped'] += 1
+                continue
+            yield product_name
+
+    if pipeline is None:
+        results = _process_each(validator, pending(), target_sites, code_patterns, min_matches)
+        metrics = validator.metrics
+    else:
+        results = pipeline.run(pending())
+        metrics = pipeline.pool.metrics
+
+    for result in results:
+        product_name = result['product_name']
+        summary['failed' if _unfinished(result) else 'processed'] += 1
+
+        output.write(json.dumps(result) + '\n')
+        output.flush()
+        if output.seekable():
+            os.fsync(output.fileno())
+
+        # Failed products are left out of the checkpoint so a restart retries them
+        if checkpoint is not None and not _unfinished(result):
+            checkpoint.mark_done(product_name)
+
+        if metrics_file:
+            metrics.write(metrics_file)
+
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('input', help="File of product names or JSON lines ('-' for stdin)")
+    parser.add_argument('-o', '--output', default='-', help="JSONL file to append results to ('-' for stdout)")
+    parser.add_argument('--checkpoint', help='Checkpoint file (defaults to OUTPUT.checkpoint when writing to a file)')
+    parser.add_argument('--field', help='JSON field holding the product name')
+    parser.add_argument('--sites', help='Comma-separated list of URLs to search (defaults to the built-in sites)')
+    parser.add_argument('--patterns', help='Comma-separated list of code patterns (defaults to the built-in patterns)')
+    parser.add_argument('--min-matches', type=int, default=3, help='Minimum number of web matches required')
+    parser.add_argument('--async-fetch', action='store_true', help='Search all sites concurrently')
+    parser.add_argument('--response-cache', help='SQLite file for the HTTP response cache')
+    parser.add_argument('--validation-store', help='SQLite file for remembered validation outcomes')
+    parser.add_argument('--metrics-file', help='Write metrics here after each product (.prom for a Prometheus textfile, else JSON)')
+    parser.add_argument('--include-metrics', action='store_true', help="Add a 'metrics' section to every result line")
+    parser.add_argument('--stream-pages', action='store_true', help='Scan store pages chunk by chunk as they download')
+    parser.add_argument('--max-page-bytes', type=int, default=2 * 1024 * 1024, help='Byte budget per store page when streaming')
+    parser.add_argument('--max-candidates', type=int, default=DEFAULT_MAX_CANDIDATES,
+                        help='Plausible codes validated per product after pruning')
+    parser.add_argument('--no-prune', action='store_true', help='Validate every code found instead of the top candidates')
+    parser.add_argument('--batch-validation', action='store_true', help='Validate several codes per web search')
+    parser.add_argument('--stop-after', type=int, help='Stop reading a store page once this many distinct codes were found (streaming)')
+    parser.add_argument('--page-archive', help='Directory to archive every fetched store page in (see page_archive.py)')
+    parser.add_argument('--pipeline', action='store_true',
+                        help='Overlap scraping and validation of different products (results are written as they finish)')
+    parser.add_argument('--scrape-workers', type=int, default=4, help='Products scraped at once (pipeline)')
+    parser.add_argument('--validate-workers', type=int, default=2, help='Products validated at once (pipeline)')
+    parser.add_argument('--validate-rate', type=float, default=0,
+                        help='Products per second entering validation (pipeline, 0 = unlimited)')
+    args = parser.parse_args()
+
+    validator_kwargs = dict(
+        async_fetch=args.async_fetch,
+        include_metrics=args.include_metrics,
+        stream_pages=args.stream_pages,
+        max_page_bytes=args.max_page_bytes,
+        stop_condition=stop_after_matches(args.stop_after) if args.stop_after else None,
+        prune_candidates=not args.no_prune,
+        max_candidates=args.max_candidates,
+        batch_validation=args.batch_validation,
+        page_archive=args.page_archive
+    )
+    pool = pipeline = None
+    if args.pipeline:
+        pool = ValidatorPool(size=args.scrape_workers + args.validate_workers, response_cache=args.response_cache,
+                             validation_store=args.validation_store, **validator_kwargs)
+        validator = None
+        with pool.validator() as defaults:
+            default_sites, default_patterns = defaults.default_sites, defaults.default_code_patterns
+    else:
+        validator = ProductValidator(response_cache=args.response_cache, validation_store=args.validation_store,
+                                     **validator_kwargs)
+        default_sites, default_patterns = validator.default_sites, validator.default_code_patterns
+    sites = [site.strip() for site in args.sites.split(',')] if args.sites else default_sites
+    patterns = [pattern.strip() for pattern in args.patterns.split(',')] if args.patterns else default_patterns
+    if pool is not None:
+        pipeline = ProductPipeline(pool, sites, patterns, args.min_matches, scrape_workers=args.scrape_workers,
+                                   validate_workers=args.validate_workers, validate_rate=args.validate_rate,
+                                   ordered=False)
+
+    checkpoint_path = args.checkpoint
+    if checkpoint_path is None and args.output != '-':
+        checkpoint_path = args.output + '.checkpoint'
+    checkpoint = Checkpoint(checkpoint_path) if checkpoint_path else None
+
+    input_stream = sys.stdin if args.input == '-' else open(args.input, 'r', encoding='utf-8')
+    output_stream = sys.stdout if args.output == '-' else open(args.output, 'a', encoding='utf-8')
+
+    try:
+        # Progress and error prints go to stderr so stdout stays valid JSONL
+        with contextlib.redirect_stdout(sys.stderr):
+            summary = run_batch(validator, iter_products(input_stream, args.field), output_stream, checkpoint,
+                                sites, patterns, args.min_matches, args.metrics_file, pipeline)
+    finally:
+        if pool is not None:
+            pool.close()
+        if validator is not None:
+            validator.close()
+        if input_stream is not sys.stdin:
+            input_stream.close()
+        if output_stream is not sys.stdout:
+            output_stream.close()
+        if checkpoint is not None:
+            checkpoint.close()
+
+    print(f"Done: {summary['processed']} processed, {summary['skipped']} skipped, {summary['failed']} failed",
+          file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark: compiled pattern sets vs the original _extract_codes_from_text
+
+Builds category-page text of realistic sizes (a few hundred product tiles with
+names, prices, dates, SKUs and barcodes) and times both extractors on it.
+
+Usage:
+    python bench_extraction.py [--repeat N] [--pages DIR]
+
+--pages points at a directory of saved HTML pages to use instead of the
+generated text.
+
+The code counts differ with literal labels: the original's greedy
+'label.{0,50}' window reports the last four digits of each barcode after a
+label (e.g. '7029' from 'Barcode: 5011921457029') as a code of its own, and
+the compiled set only reports whole codes containing a digit.
+"""
+
+import argparse
+import os
+import random
+import re
+import time
+from typing import List
+
+from code_patterns import CodePatternSet, get_pattern_set
+
+DEFAULT_PATTERNS = [
+    "regex:[0-9]{2}-[0-9]{2}",
+    "regex:[0-9]{3}-[0-9]{2}",
+    "regex:[0-9]{2}-[0-9]{3}",
+    "regex:5011921[0-9]{6}",
+]
+
+LITERAL_PATTERNS = DEFAULT_PATTERNS + ["SKU", "Barcode", "Part Number", "Item #"]
+
+PRODUCT_WORDS = [
+    "Space", "Marine", "Intercessors", "Necron", "Warriors", "Ork", "Boyz", "Tyranid",
+    "Termagants", "Aeldari", "Guardians", "Combat", "Patrol", "Start", "Collecting",
+    "Citadel", "Paint", "Set", "Kill", "Team", "Battleforce", "Stormcast", "Eternals",
+]
+
+
+def legacy_extract_codes_from_text(text: str, code_patterns: List[str]) -> List[str]:
+    """The original ProductValidator._extract_codes_from_text, kept as the baseline"""
+    found_codes = []
+
+    for pattern in code_patterns:
+        try:
+            if pattern.startswith('regex:'):
+                regex_pattern = pattern[6:]
+                matches = re.findall(regex_pattern, text, re.IGNORECASE)
+                found_codes.extend(matches)
+            else:
+                if pattern.lower() in text.lower():
+                    context_pattern = f"{re.escape(pattern)}.{{0,50}}([A-Z0-9]{{4,15}})"
+                    matches = re.findall(context_pattern, text, re.IGNORECASE)
+                    found_codes.extend(matches)
+
+                    reverse_pattern = f"([A-Z0-9]{{4,15}}).{{0,50}}{re.escape(pattern)}"
+                    matches = re.findall(reverse_pattern, text, re.IGNORECASE)
+                    found_codes.extend(matches)
+        except Exception as e:
+            print(f"Error processing pattern '{pattern}': {e}")
+            continue
+
+    return found_codes
+
+
+def generate_category_page(tiles: int, seed: int = 0) -> str:
+    """Return the visible text of a storefront category page with the given number of tiles"""
+    rng = random.Random(seed)
+    lines = ["Home | Shop | Games Workshop | New Arrivals | Pre-orders | Basket (0)"]
+
+    for _ in range(tiles):
+        name = " ".join(rng.choice(PRODUCT_WORDS) for _ in range(rng.randint(2, 5)))
+        lines.append(name)
+        lines.append(f"£{rng.randint(5, 180)}.{rng.randint(0, 99):02d}   RRP £{rng.randint(5, 200)}.00")
+        lines.append(f"SKU: {rng.randint(10, 999)}-{rng.randint(10, 999)}   Barcode: 5011921{rng.randint(0, 999999):06d}")
+        lines.append(f"Released {rng.randint(1, 28):02d}-{rng.randint(1, 12):02d}-20{rng.randint(10, 25)} | In stock: {rng.randint(0, 40)}")
+        lines.append(rng.choice([
+            "Add to basket", "Sold out - notify me", "Pre-order now",
+            "Free UK delivery on orders over £50", "Reward points: earn 12 points",
+        ]))
+        lines.append(" ".join(rng.choice(PRODUCT_WORDS).lower() for _ in range(rng.randint(10, 40))))
+
+    lines.append("Page 1 of 24 | Showing 1-48 of 1,152 results | Call us on 0115 916-8000")
+    return "\n".join(lines)
+
+
+def load_saved_pages(directory: str) -> List[str]:
+    """Return the visible text of every saved HTML page in a directory"""
+    from bs4 import BeautifulSoup
+
+    texts = []
+    for name in sorted(os.listdir(directory)):
+        with open(os.path.join(directory, name), 'rb') as f:
+            texts.append(BeautifulSoup(f.read(), 'html.parser').get_text())
+    return texts
+
+
+def time_call(func, repeat: int) -> float:
+    """Return the best wall-clock time of several runs"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def run(texts: List[str], patterns: List[str], repeat: int, label: str):
+    pattern_set = get_pattern_set(patterns)
+
+    print(f"\n{label}")
+    print(f"{'page size':>12} {'legacy ms':>12} {'compiled ms':>12} {'speedup':>9} {'codes (legacy/compiled)':>26}")
+
+    for text in texts:
+        legacy = time_call(lambda: legacy_extract_codes_from_text(text, patterns), repeat)
+        compiled = time_call(lambda: pattern_set.extract(text), repeat)
+        legacy_codes = set(legacy_extract_codes_from_text(text, patterns))
+        compiled_codes = set(pattern_set.extract(text))
+
+        print(f"{len(text) // 1024:>10}KB {legacy * 1000:>12.2f} {compiled * 1000:>12.2f} "
+              f"{legacy / compiled:>8.1f}x {len(legacy_codes):>12}/{len(compiled_codes):<12}")
+
+    # Building the set is a one-off cost amortised over every page
+    build = time_call(lambda: CodePatternSet(patterns), repeat)
+    print(f"pattern set build: {build * 1000:.3f} ms (cached per pattern tuple)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=5, help='Runs per measurement (best is reported)')
+    parser.add_argument('--pages', help='Directory of saved HTML pages to benchmark on')
+    args = parser.parse_args()
+
+    if args.pages:
+        texts = load_saved_pages(args.pages)
+    else:
+        texts = [generate_category_page(tiles, seed=tiles) for tiles in (48, 240, 1200)]
+
+    run(texts, DEFAULT_PATTERNS, args.repeat, "Default patterns (regex only)")
+    run(texts, LITERAL_PATTERNS, args.repeat, "Default patterns + literal labels")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Benchmark: lxml parsing backend vs the BeautifulSoup html.parser path
+
+Times visible-text extraction on storefront pages and result parsing on
+DuckDuckGo HTML result pages, and checks that both backends agree.
+
+Usage:
+    python bench_parsing.py [--repeat N] [--pages DIR] [--results DIR]
+
+--pages and --results point at directories of saved storefront pages and
+saved DuckDuckGo result pages. Without them, pages of typical sizes are
+generated.
+"""
+
+import argparse
+import os
+import random
+import time
+from typing import List
+
+from page_parsing import HAVE_LXML, html_to_text, parse_search_results
+
+PRODUCT_WORDS = [
+    "Space", "Marine", "Intercessors", "Necron", "Warriors", "Ork", "Boyz", "Tyranid",
+    "Termagants", "Aeldari", "Guardians", "Combat", "Patrol", "Citadel", "Paint", "Kill", "Team",
+]
+
+
+def generate_storefront_page(tiles: int, seed: int = 0) -> bytes:
+    """Return a storefront category page with navigation, scripts and product tiles"""
+    rng = random.Random(seed)
+    parts = [
+        "<!DOCTYPE html><html><head><meta charset='utf-8'><title>Warhammer 40,000 | Store</title>",
+        "<style>" + ".tile{margin:4px}" * 200 + "</style>",
+        "<script>window.dataLayer=[" + ",".join('{"sku":"%d-%d"}' % (i, i) for i in range(300)) + "];</script>",
+        "</head><body><nav><ul>" + "".join(f"<li><a href='/c/{i}'>Category {i}</a></li>" for i in range(80)) + "</ul></nav>",
+        "<main><div class='grid'>",
+    ]
+    for i in range(tiles):
+        name = " ".join(rng.choice(PRODUCT_WORDS) for _ in range(rng.randint(2, 5)))
+        parts.append(
+            f"<div class='tile card product' data-id='{i}'><a href='/p/{i}'><img src='/img/{i}.jpg' alt='{name}'>"
+            f"<h4 class='card-title'>{name}</h4></a><span class='price'>&pound;{rng.randint(5, 180)}.00</span>"
+            f"<p class='sku'>SKU: {rng.randint(10, 999)}-{rng.randint(10, 99)}</p>"
+            f"<p class='barcode'>Barcode: 5011921{rng.randint(0, 999999):06d}</p>"
+            f"<button class='add'>Add to basket</button></div>"
+        )
+    parts.append("</div></main><footer>" + "<p>Terms &amp; conditions</p>" * 40 + "</footer></body></html>")
+    return "".join(parts).encode('utf-8')
+
+
+def generate_results_page(results: int, seed: int = 0) -> bytes:
+    """Return a page shaped like DuckDuckGo's HTML results"""
+    rng = random.Random(seed)
+    parts = ["<html><head><title>search at DuckDuckGo</title></head><body><div id='links' class='results'>"]
+    for i in range(results):
+        name = " ".join(rng.choice(PRODUCT_WORDS) for _ in range(4))
+        parts.append(
+            f"<div class='result results_links results_links_deep web-result'><div class='links_main links_deep result__body'>"
+            f"<h2 class='result__title'><a rel='nofollow' class='result__a' href='https://shop{i}.example/p/{i}'>{name}</a></h2>"
+            f"<div class='result__extras'><a class='result__url' href='https://shop{i}.example/p/{i}'>shop{i}.example</a></div>"
+            f"<div class='result__snippet'>{name} 5011921{rng.randint(0, 999999):06d} in stock now</div></div></div>"
+        )
+    parts.append("</div></body></html>")
+    return "".join(parts).encode('utf-8')
+
+
+def load_pages(directory: str) -> List[bytes]:
+    pages = []
+    for name in sorted(os.listdir(directory)):
+        with open(os.path.join(directory, name), 'rb') as f:
+            pages.append(f.read())
+    return pages
+
+
+def time_call(func, repeat: int) -> float:
+    """Return the best wall-clock time of several runs"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def compare(label: str, pages: List[bytes], parse, repeat: int, same):
+    print(f"\n{label}")
+    print(f"{'page size':>12} {'bs4 ms':>10} {'lxml ms':>10} {'speedup':>9} {'same output':>12}")
+
+    for page in pages:
+        bs4_time = time_call(lambda: parse(page, backend='bs4'), repeat)
+        lxml_time = time_call(lambda: parse(page, backend='lxml'), repeat)
+        agrees = same(parse(page, backend='bs4'), parse(page, backend='lxml'))
+        print(f"{len(page) // 1024:>10}KB {bs4_time * 1000:>10.2f} {lxml_time * 1000:>10.2f} "
+              f"{bs4_time / lxml_time:>8.1f}x {str(agrees):>12}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=5, help='Runs per measurement (best is reported)')
+    parser.add_argument('--pages', help='Directory of saved storefront pages')
+    parser.add_argument('--results', help='Directory of saved DuckDuckGo result pages')
+    args = parser.parse_args()
+
+    if not HAVE_LXML:
+        parser.error("lxml is not installed (pip install lxml)")
+
+    storefront = load_pages(args.pages) if args.pages else [generate_storefront_page(n, n) for n in (24, 120, 600, 2400)]
+    results = load_pages(args.results) if args.results else [generate_results_page(n, n) for n in (10, 30)]
+
+    compare("Visible text of storefront pages", storefront, html_to_text, args.repeat,
+            lambda a, b: a.split() == b.split())
+    compare("DuckDuckGo result parsing", results, parse_search_results, args.repeat,
+            lambda a, b: a == b)
+
+
+if __name__ == "__main__":
+    main()
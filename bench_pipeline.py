@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""
+Offline throughput benchmark for the validation pipeline
+
+Starts local storefront and search engine stand-ins (fake_storefront.py),
+points the shared validator pool at them and runs batches of several sizes
+through process_product_list, the real entry point: its fetch plan, staged
+pipeline and pool.
+
+Reports products/sec, exact p50/p95 latency per stage (from every stage
+observation the pool's metrics receive during the batch, not their
+histograms), store downloads against the reads the fetch plan saved, CPU time
+and peak memory, and writes them to a JSON file so results from different
+versions can be diffed.
+
+Usage:
+    python bench_pipeline.py --batch-sizes 1,10,50 --latency 0.05 -o bench_results.json
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import platform
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+from collections import defaultdict
+from typing import Dict, Iterator, List
+
+from fake_storefront import FakeWeb
+from metrics import Metrics
+from product_validator import process_product_list
+from validator_pool import ValidatorPool, close_shared_pool, configure_shared_pool
+
+# Validators process_product_list's pipeline holds at once (4 scrape + 2 validate workers)
+PIPELINE_VALIDATORS = 6
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of raw values"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, int(round(pct / 100 * len(ordered) + 0.5)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def summarize_stage(durations: List[float]) -> Dict[str, float]:
+    """Count, p50/p95 and mean of a stage's observed durations"""
+    return {
+        'count': len(durations),
+        'p50_ms': round(percentile(durations, 50) * 1000, 3),
+        'p95_ms': round(percentile(durations, 95) * 1000, 3),
+        'mean_ms': round(sum(durations) / len(durations) * 1000, 3) if durations else 0.0,
+    }
+
+
+@contextlib.contextmanager
+def recording_stages(metrics: Metrics) -> Iterator[Dict[str, List[float]]]:
+    """Keep the raw duration of every stage observation made while the block runs, by stage"""
+    durations = defaultdict(list)
+    observe = metrics.observe
+
+    def record(stage: str, host: str, seconds: float):
+        durations[stage].append(seconds)
+        observe(stage, host, seconds)
+
+    # The pipeline's worker threads do not share a context, so the pool's Metrics is wrapped for the batch
+    metrics.observe = record
+    try:
+        yield durations
+    finally:
+        del metrics.observe
+
+
+def rss_mb(usage) -> float:
+    """Convert ru_maxrss (KB on Linux, bytes on macOS) to MB"""
+    divisor = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    return round(usage.ru_maxrss / divisor, 2)
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              timeout=5).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return ''
+
+
+def make_pool(args, web: FakeWeb) -> ValidatorPool:
+    """Configure the shared pool process_product_list uses and point its validators at the fake web"""
+    pool = configure_shared_pool(size=PIPELINE_VALIDATORS, async_fetch=args.async_fetch,
+                                 max_concurrency=args.concurrency, host_rate=args.host_rate,
+                                 parser_backend=args.parser)
+    # Validators are created on demand, so create them all now to set what the constructor does not take
+    validators = [pool.acquire() for _ in range(pool.size)]
+    for validator in validators:
+        validator.web_search_url = web.search_url
+        if not args.delays:
+            # The fixed politeness sleeps would otherwise dominate every number
+            validator.request_delay = 0
+            validator.web_search_delay = 0
+    for validator in validators:
+        pool.release(validator)
+    return pool
+
+
+def run_batch(pool: ValidatorPool, products: List[str], sites: List[str], patterns: List[str], min_matches: int,
+              trace_memory: bool = False) -> dict:
+    """Run one batch through process_product_list, recording per-stage timings from the pool's metrics"""
+    metrics_before = pool.metrics.snapshot()
+    cpu_start = resource.getrusage(resource.RUSAGE_SELF)
+    if trace_memory:
+        tracemalloc.start()
+    wall_start = time.perf_counter()
+
+    with recording_stages(pool.metrics) as durations:
+        results = json.loads(process_product_list('\n'.join(products), ','.join(sites), ','.join(patterns),
+                                                  min_matches, detail="full"))
+
+    wall = time.perf_counter() - wall_start
+    peak_bytes = None
+    if trace_memory:
+        _, peak_bytes = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    cpu_end = resource.getrusage(resource.RUSAGE_SELF)
+    metrics = Metrics.delta(metrics_before, pool.metrics.snapshot())
+
+    def total(counter: str) -> float:
+        return sum(metrics['counters'].get(counter, {}).values())
+
+    cpu_seconds = (cpu_end.ru_utime - cpu_start.ru_utime) + (cpu_end.ru_stime - cpu_start.ru_stime)
+    result = {
+        'batch_size': len(products),
+        'wall_seconds': round(wall, 3),
+        'products_per_second': round(len(products) / wall, 3) if wall else 0.0,
+        'validated_products': sum(bool(r.get('web_validation', {}).get('overall_validation')) for r in results),
+        'failed_products': sum('error' in r for r in results),
+        'stages': {stage: summarize_stage(values) for stage, values in sorted(durations.items())},
+        'fetch_plan': {name: int(total(f'fetch_plan_{name}'))
+                       for name in ('planned', 'unique', 'fetched', 'shared', 'unplanned')},
+        'requests': int(total('requests')),
+        'cpu_seconds': round(cpu_seconds, 3),
+        'cpu_seconds_per_product': round(cpu_seconds / len(products), 4),
+        # ru_maxrss is the process high-water mark so far
+        'peak_rss_mb': rss_mb(cpu_end),
+    }
+    if peak_bytes is not None:
+        result['peak_traced_memory_mb'] = round(peak_bytes / 1024 / 1024, 2)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--batch-sizes', default='1,10,50', help='Comma-separated batch sizes')
+    parser.add_argument('--stores', type=int, default=3, help='Number of fake storefronts')
+    parser.add_argument('--catalog', type=int, default=500, help='Products in the fake catalog')
+    parser.add_argument('--latency', type=float, default=0.05, help='Mean storefront latency (seconds)')
+    parser.add_argument('--search-latency', type=float, default=0.1, help='Mean search engine latency (seconds)')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests failing with 503')
+    parser.add_argument('--pages', help='Directory of recorded storefront pages to serve')
+    parser.add_argument('--min-matches', type=int, default=3)
+    parser.add_argument('--async-fetch', action='store_true', help='Use the async fetch mode')
+    parser.add_argument('--concurrency', type=int, default=8, help='Global concurrency cap in async mode')
+    parser.add_argument('--host-rate', type=float, default=0, help='Per-host requests/second in async mode (0 = unlimited)')
+    parser.add_argument('--parser', default='lxml', choices=['lxml', 'bs4'], help='HTML parsing backend')
+    parser.add_argument('--delays', action='store_true', help='Keep the fixed politeness sleeps')
+    parser.add_argument('--trace-memory', action='store_true',
+                        help='Also report tracemalloc peaks (slows Python down, so CPU numbers are inflated)')
+    parser.add_argument('-o', '--output', default='bench_results.json', help='Where to write the JSON report')
+    args = parser.parse_args()
+
+    batch_sizes = [int(size) for size in args.batch_sizes.split(',') if size.strip()]
+
+    with FakeWeb(args.stores, args.catalog, args.latency, args.search_latency, args.error_rate, args.pages) as web:
+        pool = make_pool(args, web)
+        with pool.validator() as validator:
+            patterns = validator.default_code_patterns
+            # Warm up connections and compiled patterns outside the measurements
+            validator.search_product_codes_on_sites(web.catalog[-1].name, web.store_urls, patterns)
+        products = [product.name for product in web.catalog[:-1]]
+
+        batches = []
+        offset = 0
+        try:
+            for size in batch_sizes:
+                batch = [products[(offset + i) % len(products)] for i in range(size)]
+                offset += size
+                # Progress prints from the pipeline would drown the report lines
+                with contextlib.redirect_stdout(io.StringIO()):
+                    result = run_batch(pool, batch, web.store_urls, patterns, args.min_matches, args.trace_memory)
+                batches.append(result)
+                stages = result['stages']
+                print(f"batch {size:>5}: {result['products_per_second']:>8.2f} products/s  "
+                      f"fetch p50 {stages.get('fetch', {}).get('p50_ms', 0):.1f} ms  "
+                      f"validate p50 {stages.get('validate', {}).get('p50_ms', 0):.1f} ms  "
+                      f"store downloads {result['fetch_plan']['fetched']}/{result['fetch_plan']['planned']}  "
+                      f"cpu {result['cpu_seconds_per_product'] * 1000:.1f} ms/product  "
+                      f"peak rss {result['peak_rss_mb']:.1f} MB")
+        finally:
+            close_shared_pool()
+
+    report = {
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'settings': {k: v for k, v in vars(args).items() if k != 'output'},
+        'max_rss_mb': rss_mb(resource.getrusage(resource.RUSAGE_SELF)),
+        'batches': batches,
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"Report written to {args.output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
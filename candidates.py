@@ -0,0 +1,285 @@
+"""
+Candidate pruning between site scraping and web validation
+
+Every code a pattern matches on a store page used to be sent to web
+validation, which costs a search engine query (and a politeness sleep) per
+code. Many of those matches are not product codes at all: '[0-9]{2}-[0-9]{2}'
+also matches dates, page ranges and pieces of phone numbers, and 13-digit
+strings can have invalid check digits. This module:
+
+- checks EAN-13/UPC-A/EAN-8/GTIN-14 check digits and folds the different
+  GTIN forms into one (UPC-A 012345678905 and EAN-13 0012345678905 are the same item)
+  for grouping and scoring, while the code reported (and searched for during
+  web validation) stays as the pages printed it
+- rejects matches whose surrounding text shows they are dates, prices, page
+  numbers, phone numbers or pieces of a longer number
+- scores what is left (valid GTIN, a 'SKU'/'Barcode' label nearby, the product
+  name nearby, how many pages and sites show it) so that only the best few
+  codes per product are validated
+"""
+
+import re
+from collections import Counter
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+from code_patterns import CodeMatch
+from validation_store import normalize_product_name
+
+# Characters of page text kept on each side of a match; enough to reach back
+# past a price and a SKU to the product name on a typical product tile
+CONTEXT_CHARS = 100
+
+# Codes validated per product by default
+DEFAULT_MAX_CANDIDATES = 5
+
+GTIN_LENGTHS = (8, 12, 13, 14)
+
+_GTIN_SEPARATORS = re.compile(r'[\s-]')
+_DIGITS = re.compile(r'[0-9]+')
+
+# Text right next to a match that makes it part of a longer number
+_NUMBER_BEFORE = re.compile(r'(?:[0-9]|[0-9][-/.,:])$')
+_NUMBER_AFTER = re.compile(r'^(?:[0-9]|[-/.,:][0-9])')
+
+_MONTHS = r'jan|feb|mar|apr|may|jun|jul|aug|sep|sept|oct|nov|dec|january|february|march|april|june|july|august|september|october|november|december'
+_DATE_WORDS = re.compile(rf'\b(?:{_MONTHS}|date|dated|released?|posted|updated|published|expires?|on)\b\W*$', re.IGNORECASE)
+_PRICE_BEFORE = re.compile(r'(?:[£$€¥]|\b(?:gbp|usd|eur|price|rrp|was|now))\s*$', re.IGNORECASE)
+_PAGE_BEFORE = re.compile(r'\b(?:page|pages|pp\.?|showing|results|items|viewing)\s*$', re.IGNORECASE)
+_PAGE_AFTER = re.compile(r'^\s*(?:of\s+[0-9]|results|items|products|per page)\b', re.IGNORECASE)
+_PHONE_BEFORE = re.compile(r'\b(?:tel|telephone|phone|call|fax|ph)\b\.?:?[\s0-9()+]*$', re.IGNORECASE)
+
+# Labels that product codes are usually printed next to. No leading \b:
+# extracted text often runs the previous value into the label ('10-29Barcode:')
+_LABEL_BEFORE = re.compile(
+    r'(?:sku|code|item|product\s*(?:code|no|number)|part|model|barcode|ean|gtin|upc|mpn|ref|cat(?:alogue)?\s*(?:no|number))\b[\s.:#-]*$|#\s*$',
+    re.IGNORECASE
+)
+
+# Words that appear between a product's name and its codes on a product tile
+_TILE_WORDS = frozenset([
+    'sku', 'code', 'item', 'product', 'part', 'model', 'barcode', 'ean', 'gtin', 'upc', 'mpn', 'ref',
+    'price', 'rrp', 'was', 'now', 'gbp', 'usd', 'eur', 'from', 'each', 'stock', 'out', 'number', 'cat',
+])
+_WORD = re.compile(r'[a-z]{3,}')
+
+
+class CodeEvidence(NamedTuple):
+    """One sighting of a code on a store page"""
+    code: str
+    pattern: str
+    before: str
+    after: str
+    site: str
+    page: str
+
+
+def gtin_check_digit(body: str) -> int:
+    """Return the GS1 check digit for the digits of a GTIN without its check digit"""
+    total = 0
+    # Weights alternate 3, 1, ... starting from the rightmost digit of the body
+    for position, digit in enumerate(reversed(body)):
+        total += int(digit) * (3 if position % 2 == 0 else 1)
+    return (10 - total % 10) % 10
+
+
+def is_valid_gtin(digits: str) -> bool:
+    """Whether a string of 8, 12, 13 or 14 digits has a correct check digit"""
+    if not digits.isdigit() or len(digits) not in GTIN_LENGTHS:
+        return False
+    return gtin_check_digit(digits[:-1]) == int(digits[-1])
+
+
+def gtin_digits(code: str) -> Optional[str]:
+    """Return a code's digits if it is shaped like a GTIN (spaces and hyphens allowed), else None"""
+    digits = _GTIN_SEPARATORS.sub('', code)
+    if digits.isdigit() and len(digits) in GTIN_LENGTHS:
+        return digits
+    return None
+
+
+def normalize_gtin(code: str) -> Optional[str]:
+    """
+    Return the canonical form of a GTIN, or None if the code is not one
+
+    UPC-A (12 digits) and GTIN-14 with a leading zero are folded into EAN-13,
+    the form European retailers print; EAN-8 and other GTIN-14s are kept.
+    """
+    digits = gtin_digits(code)
+    if digits is None:
+        return None
+    if len(digits) == 12:
+        return '0' + digits
+    if len(digits) == 14 and digits.startswith('0'):
+        return digits[1:]
+    return digits
+
+
+def collect_evidence(text: str, matches: Iterable[CodeMatch], site: str, page: str) -> List[CodeEvidence]:
+    """Keep the text around each match so it can be judged after the page is gone"""
+    return [
+        CodeEvidence(
+            match.code, match.pattern,
+            text[max(0, match.start - CONTEXT_CHARS):match.start],
+            text[match.end:match.end + CONTEXT_CHARS],
+            site, page
+        )
+        for match in matches
+    ]
+
+
+def _looks_like_day_month(code: str) -> bool:
+    parts = _DIGITS.findall(code)
+    if len(parts) != 2 or not all(len(part) <= 2 for part in parts):
+        return False
+    first, second = int(parts[0]), int(parts[1])
+    return (1 <= first <= 31 and 1 <= second <= 12) or (1 <= first <= 12 and 1 <= second <= 31)
+
+
+def reject_reason(code: str, before: str, after: str) -> Optional[str]:
+    """
+    Return why a match is not a plausible product code, or None if it is
+
+    The before/after text is what surrounded the match on the page.
+    """
+    digits = gtin_digits(code)
+    if digits is not None and len(digits) >= 12 and not is_valid_gtin(digits):
+        return 'invalid_checksum'
+
+    if _NUMBER_BEFORE.search(before) or _NUMBER_AFTER.search(after):
+        return 'part_of_longer_number'
+
+    if _PRICE_BEFORE.search(before):
+        return 'price'
+
+    if _PHONE_BEFORE.search(before[-25:]):
+        return 'phone_number'
+
+    if _PAGE_BEFORE.search(before) or _PAGE_AFTER.search(after):
+        return 'page_number'
+
+    if _looks_like_day_month(code) and _DATE_WORDS.search(before):
+        return 'date'
+
+    return None
+
+
+def _exact_name_before(before: str, normalized_name: str) -> bool:
+    index = before.rfind(normalized_name)
+    if index == -1:
+        return False
+    between = before[index + len(normalized_name):]
+    return not any(word not in _TILE_WORDS for word in _WORD.findall(between))
+
+
+def _score(evidence: Sequence[CodeEvidence], gtin: Optional[str], normalized_name: str,
+           product_tokens: Sequence[str]) -> Tuple[float, List[str]]:
+    """Score the sightings of one code; higher is more likely the product's code"""
+    score = 1.0
+    reasons = []
+
+    if gtin is not None and is_valid_gtin(gtin):
+        score += 2
+        reasons.append('valid_gtin')
+
+    if any(_LABEL_BEFORE.search(item.before[-25:]) for item in evidence):
+        score += 1
+        reasons.append('labelled')
+
+    # Listings show many products, so what ties a code to this one is the
+    # product name printed just before it (the text after a code usually
+    # belongs to the next product). Words are matched as substrings because
+    # extracted text often runs neighbouring elements together.
+    if product_tokens:
+        befores = [normalize_product_name(item.before) for item in evidence]
+        coverage = max(sum(token in before for token in product_tokens) / len(product_tokens) for before in befores)
+        score += 4 * coverage
+        if coverage >= 0.5:
+            reasons.append('near_product_name')
+
+        # The full name with nothing but labels and prices between it and the
+        # code, rather than a longer name that merely contains it
+        if any(_exact_name_before(before, normalized_name) for before in befores):
+            score += 3
+            reasons.append('exact_product_name')
+
+    pages = {item.page for item in evidence}
+    sites = {item.site for item in evidence}
+    if len(pages) > 1:
+        score += min(len(pages) - 1, 3) * 0.5
+        reasons.append(f'{len(pages)}_pages')
+    if len(sites) > 1:
+        score += len(sites) - 1
+        reasons.append(f'{len(sites)}_sites')
+
+    # Codes seen only on homepages belong to featured products, not search results
+    if all(item.page.rstrip('/') == item.site.rstrip('/') for item in evidence):
+        score -= 2
+        reasons.append('homepage_only')
+
+    return score, reasons
+
+
+def rank_candidates(evidence: Iterable[CodeEvidence], product_name: str,
+                    limit: Optional[int] = DEFAULT_MAX_CANDIDATES) -> Tuple[List[Dict], Dict[str, str]]:
+    """
+    Prune and rank the codes found for a product
+
+    Args:
+        evidence: Every sighting of every code on the pages searched
+        product_name: The product that was searched for
+        limit: Number of candidates to keep (all plausible ones if None)
+
+    Returns:
+        (candidates, pruned): candidates are dicts with 'code' (the form the
+        pages printed most often), 'forms' (every printed form, most often
+        first), 'key' (the folded GTIN form sightings were grouped under),
+        'score', 'reasons', 'occurrences' and 'sites', best first; pruned maps
+        each dropped code, as printed, to the reason it was dropped.
+    """
+    normalized_name = normalize_product_name(product_name)
+    product_tokens = [token for token in normalized_name.split() if len(token) >= 3]
+
+    # Group sightings under one key per code, folding GTIN forms together
+    grouped: Dict[str, List[CodeEvidence]] = {}
+    rejections: Dict[str, Dict[str, int]] = {}
+    # Printed forms per key, in the order first seen (Counter.most_common keeps it for ties)
+    forms: Dict[str, Counter] = {}
+    for item in evidence:
+        key = normalize_gtin(item.code) or item.code
+        forms.setdefault(key, Counter())[item.code] += 1
+        reason = reject_reason(item.code, item.before, item.after)
+        if reason is not None:
+            counts = rejections.setdefault(key, {})
+            counts[reason] = counts.get(reason, 0) + 1
+            continue
+        grouped.setdefault(key, []).append(item)
+
+    candidates = []
+    for key, items in grouped.items():
+        gtin = normalize_gtin(items[0].code)
+        score, reasons = _score(items, gtin, normalized_name, product_tokens)
+        printed = [code for code, _ in Counter(item.code for item in items).most_common()]
+        candidates.append({
+            'code': printed[0],
+            'forms': printed,
+            'key': key,
+            'score': round(score, 2),
+            'reasons': reasons,
+            'occurrences': len(items),
+            'sites': sorted({item.site for item in items})
+        })
+
+    # Best score first; ties go to the code seen more often, then the earlier one
+    candidates.sort(key=lambda candidate: (-candidate['score'], -candidate['occurrences']))
+
+    pruned = {
+        forms[key].most_common(1)[0][0]: max(counts, key=counts.get)
+        for key, counts in rejections.items()
+        if key not in grouped
+    }
+    if limit is not None:
+        for candidate in candidates[limit:]:
+            pruned[candidate['code']] = 'below_top_k'
+        candidates = candidates[:limit]
+
+    return candidates, pruned
@@ -0,0 +1,342 @@
+#!/usr/bin/env python3
+"""
+Full-catalog crawl of the target stores into the page index
+
+The search path guesses a search URL per product per store. Crawl mode instead
+pulls each store's whole catalog once and puts every product's codes into the
+PageIndex, after which ProductValidator.search_index (and so
+search_with_defaults and the agent functions) answers lookups locally.
+
+Products are discovered, per store, from:
+
+- a Shopify-style feed (/products.json), which lists titles, SKUs and
+  barcodes directly, so no product page needs to be fetched
+- otherwise the sitemaps named in robots.txt, plus /sitemap.xml and
+  BigCommerce's /xmlsitemap.php. Sitemap indexes are followed; when some of
+  their children are product sitemaps (sitemap_products_1.xml,
+  xmlsitemap.php?type=products), only those are read.
+
+The store's robots.txt is read once per crawl: its Crawl-delay paces the
+store and its Disallow rules are honoured for feeds, sitemaps and product
+pages. Product pages are then fetched with bounded concurrency and the
+per-host rate limit of the validator, and scanned with the usual code
+patterns. A recrawl is
+incremental: pages whose sitemap or feed lastmod is unchanged since the last
+crawl are not fetched again, only marked fresh in the index.
+
+Usage:
+    python catalog_crawler.py --index .cache/page_index.sqlite
+    python catalog_crawler.py --index .cache/page_index.sqlite --sites https://store.example/ --max-pages 500
+"""
+
+import argparse
+import gzip
+import json
+import sys
+import xml.etree.ElementTree as ElementTree
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, List, NamedTuple, Optional
+from urllib.parse import urljoin
+from urllib.robotparser import RobotFileParser
+
+from candidates import CodeEvidence
+from code_patterns import get_pattern_set
+from host_health import HostUnavailable
+from product_validator import ProductValidator
+from rate_limit import HostRateLimiter
+
+SITEMAP_PATHS = ('sitemap.xml', 'xmlsitemap.php')
+FEED_PATH = 'products.json?limit={limit}&page={page}'
+FEED_PAGE_SIZE = 250
+
+# Sitemaps read per store, to bound crawls of stores with huge blog or tag sitemaps
+MAX_SITEMAPS = 50
+# Feed pages read per store, in case a store keeps answering past its last product
+MAX_FEED_PAGES = 400
+
+
+class CatalogPage(NamedTuple):
+    """A product page listed by a store's sitemap"""
+    url: str
+    lastmod: Optional[str]
+
+
+def _local_name(tag: str) -> str:
+    """Strip the XML namespace from a tag ('{http://www.sitemaps.org/...}loc' -> 'loc')"""
+    return tag.rsplit('}', 1)[-1]
+
+
+def parse_sitemap(content: bytes) -> Dict[str, List[CatalogPage]]:
+    """
+    Parse a sitemap or sitemap index
+
+    Returns:
+        {'sitemaps': [...], 'pages': [...]}, both as CatalogPage(url, lastmod)
+    """
+    if content[:2] == b'\x1f\x8b':
+        content = gzip.decompress(content)
+
+    root = ElementTree.fromstring(content)
+    kind = 'sitemaps' if _local_name(root.tag) == 'sitemapindex' else 'pages'
+    entries = []
+    for element in root:
+        fields = {_local_name(child.tag): (child.text or '').strip() for child in element}
+        if fields.get('loc'):
+            entries.append(CatalogPage(fields['loc'], fields.get('lastmod') or None))
+
+    result = {'sitemaps': [], 'pages': []}
+    result[kind] = entries
+    return result
+
+
+def _is_product_sitemap(url: str) -> bool:
+    return 'product' in url.lower()
+
+
+class CatalogCrawler:
+    """Crawls store catalogs into a validator's page index"""
+
+    def __init__(self, validator: ProductValidator, code_patterns: Optional[List[str]] = None,
+                 max_concurrency: int = 4, max_pages: Optional[int] = None):
+        """
+        Args:
+            validator: Fetches and scans pages; must have a page_index to crawl into
+            code_patterns: Patterns codes are extracted with (the validator's defaults if None)
+            max_concurrency: Product pages fetched at once (the per-host rate limit still applies)
+            max_pages: Product pages fetched per store per crawl (no limit if None)
+        """
+        if validator.page_index is None:
+            raise ValueError("CatalogCrawler needs a validator with a page_index")
+
+        self.validator = validator
+        self.page_index = validator.page_index
+        self.code_patterns = code_patterns if code_patterns is not None else validator.default_code_patterns
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_pages = max_pages
+        self.user_agent = validator.session.headers.get('User-Agent', '*')
+        self._robots: Dict[str, RobotFileParser] = {}
+
+    def _get(self, url: str):
+        """Fetch a discovery URL (robots, sitemap, feed), politely, returning None on failure"""
+        try:
+            # Every crawl request waits for the host's token, unless the response cache answers it
+            return self.validator.fetch(url, wait=True)
+        except Exception:
+            return None
+
+    def robots(self, site_url: str) -> RobotFileParser:
+        """Read a store's robots.txt once per crawl, pacing the store by its Crawl-delay"""
+        parser = self._robots.get(site_url)
+        if parser is None:
+            parser = RobotFileParser(urljoin(site_url, '/robots.txt'))
+            response = self._get(parser.url)
+            if response is not None and response.status_code < 400:
+                self.validator.note_robots(site_url, response.text)
+                parser.parse(response.text.splitlines())
+            else:
+                # No robots.txt: everything is allowed
+                parser.parse([])
+            self._robots[site_url] = parser
+        return parser
+
+    def allowed(self, site_url: str, url: str) -> bool:
+        """Whether the store's robots.txt lets us fetch a URL"""
+        return self.robots(site_url).can_fetch(self.user_agent, url)
+
+    def crawl(self, sites: Optional[List[str]] = None) -> Dict[str, Dict[str, int]]:
+        """
+        Crawl every store's catalog
+
+        Returns:
+            Per-site counts: 'listed', 'fetched', 'unchanged', 'disallowed' (by robots.txt), 'failed', 'codes'
+        """
+        return {site_url: self.crawl_site(site_url) for site_url in (sites or self.validator.default_sites)}
+
+    def crawl_site(self, site_url: str) -> Dict[str, int]:
+        """Crawl one store's catalog (see crawl for the counts returned)"""
+        known = self.page_index.site_pages(site_url)
+        # Read robots.txt afresh on every crawl
+        self._robots.pop(site_url, None)
+
+        summary = self._crawl_feed(site_url, known)
+        if summary is not None:
+            return summary
+
+        pages = list(self.sitemap_pages(site_url))
+        summary = {'listed': len(pages), 'fetched': 0, 'unchanged': 0, 'disallowed': 0, 'failed': 0, 'codes': 0}
+
+        # Unchanged pages keep their indexed codes; everything else is (re)fetched
+        unchanged = {page.url for page in pages if page.lastmod is not None and known.get(page.url) == page.lastmod}
+        to_fetch = [page for page in pages if page.url not in unchanged and self.allowed(site_url, page.url)]
+        summary['disallowed'] = len(pages) - len(unchanged) - len(to_fetch)
+        if self.max_pages is not None:
+            to_fetch = to_fetch[:self.max_pages]
+        if unchanged:
+            self.page_index.touch(list(unchanged))
+        summary['unchanged'] = len(unchanged)
+
+        def fetch(page: CatalogPage):
+            try:
+                return self.validator.index_catalog_page(site_url, page.url, self.code_patterns, page.lastmod, wait=True)
+            except HostUnavailable:
+                # The store stopped answering; the rest of its pages are skipped without a request
+                self.validator.metrics.inc('skipped_pages', HostRateLimiter.host_for(page.url))
+                return None
+            except Exception as e:
+                print(f"Error crawling {page.url}: {e}")
+                self.validator.metrics.inc('errors', HostRateLimiter.host_for(page.url))
+                return None
+
+        with ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix='crawl') as executor:
+            for codes in executor.map(fetch, to_fetch):
+                if codes is None:
+                    summary['failed'] += 1
+                else:
+                    summary['fetched'] += 1
+                    summary['codes'] += len(codes)
+
+        self.validator.metrics.inc('catalog_pages', HostRateLimiter.host_for(site_url), summary['fetched'])
+        return summary
+
+    def sitemap_pages(self, site_url: str) -> Iterator[CatalogPage]:
+        """Yield the product pages listed by a store's sitemaps (each URL once)"""
+        queue = list(self.robots(site_url).site_maps() or [])
+        queue.extend(urljoin(site_url, path) for path in SITEMAP_PATHS)
+
+        seen_sitemaps = set()
+        seen_pages = set()
+        while queue and len(seen_sitemaps) < MAX_SITEMAPS:
+            sitemap_url = queue.pop(0)
+            if sitemap_url in seen_sitemaps or not self.allowed(site_url, sitemap_url):
+                continue
+            seen_sitemaps.add(sitemap_url)
+
+            response = self._get(sitemap_url)
+            if response is None:
+                continue
+            try:
+                parsed = parse_sitemap(response.content)
+            except (ElementTree.ParseError, OSError, EOFError):
+                continue
+
+            children = [child.url for child in parsed['sitemaps']]
+            product_children = [url for url in children if _is_product_sitemap(url)]
+            queue.extend(product_children or children)
+
+            for page in parsed['pages']:
+                if page.url.rstrip('/') == site_url.rstrip('/') or page.url in seen_pages:
+                    continue
+                seen_pages.add(page.url)
+                yield page
+
+    def _crawl_feed(self, site_url: str, known: Dict[str, Optional[str]]) -> Optional[Dict[str, int]]:
+        """
+        Index a store's products.json feed; None if the store has no such feed
+
+        Pages are read until one comes back short or empty, brings no product
+        not seen on an earlier page (a store ignoring the page parameter), or
+        max_pages products have been indexed.
+        """
+        pattern_set = get_pattern_set(self.code_patterns)
+        summary = {'listed': 0, 'fetched': 0, 'unchanged': 0, 'disallowed': 0, 'failed': 0, 'codes': 0}
+        unchanged = []
+        seen = set()
+
+        for page_number in range(1, MAX_FEED_PAGES + 1):
+            feed_url = urljoin(site_url, FEED_PATH.format(limit=FEED_PAGE_SIZE, page=page_number))
+            if not self.allowed(site_url, feed_url):
+                return summary if page_number > 1 else None
+            response = self._get(feed_url)
+            try:
+                products = response.json()['products'] if response is not None else None
+            except (ValueError, KeyError, TypeError):
+                products = None
+            if products is None:
+                # A store without a feed; one whose feed broke part way keeps what was read
+                return summary if page_number > 1 else None
+
+            new_products = 0
+            for product in products:
+                if not product.get('handle'):
+                    continue
+                product_id = product.get('id') or product['handle']
+                if product_id in seen:
+                    continue
+                seen.add(product_id)
+                new_products += 1
+
+                url = urljoin(site_url, f"products/{product['handle']}")
+                lastmod = product.get('updated_at')
+                summary['listed'] += 1
+                if lastmod is not None and known.get(url) == lastmod:
+                    unchanged.append(url)
+                    continue
+                if self.max_pages is not None and summary['fetched'] >= self.max_pages:
+                    continue
+
+                codes = self._index_feed_product(site_url, url, product, pattern_set, lastmod)
+                summary['fetched'] += 1
+                summary['codes'] += codes
+
+            if len(products) < FEED_PAGE_SIZE or not new_products:
+                break
+            if self.max_pages is not None and summary['fetched'] >= self.max_pages:
+                break
+
+        if unchanged:
+            self.page_index.touch(unchanged)
+        summary['unchanged'] = len(unchanged)
+        self.validator.metrics.inc('catalog_pages', HostRateLimiter.host_for(site_url), summary['fetched'])
+        return summary
+
+    def _index_feed_product(self, site_url: str, url: str, product: dict, pattern_set, lastmod: Optional[str]) -> int:
+        """Index one feed product; its codes are the variant SKUs and barcodes the code patterns accept"""
+        title = str(product.get('title') or '').strip()
+        evidence = []
+        lines = [title]
+        for variant in product.get('variants') or []:
+            for field in ('sku', 'barcode'):
+                value = str(variant.get(field) or '').strip()
+                if not value:
+                    continue
+                lines.append(f"{field.upper()}: {value}")
+                for match in pattern_set.find_all(value):
+                    if match.code == value:
+                        # The feed ties the code to the product, so its title is the context
+                        evidence.append(CodeEvidence(match.code, match.pattern, f"{title} {field.upper()}: ", '',
+                                                     site_url, url))
+
+        self.page_index.add_page(url, site_url, '\n'.join(lines), evidence, lastmod)
+        return len({item.code for item in evidence})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--index', default='.cache/page_index.sqlite', help='PageIndex SQLite file to crawl into')
+    parser.add_argument('--sites', help='Comma-separated list of store URLs (defaults to the built-in sites)')
+    parser.add_argument('--patterns', help='Comma-separated list of code patterns (defaults to the built-in patterns)')
+    parser.add_argument('--response-cache', help='SQLite file for the HTTP response cache')
+    parser.add_argument('--concurrency', type=int, default=4, help='Product pages fetched at once')
+    parser.add_argument('--host-rate', type=float, default=1.0, help='Requests per second allowed to each store')
+    parser.add_argument('--max-pages', type=int, help='Product pages fetched per store per crawl')
+    args = parser.parse_args()
+
+    validator = ProductValidator(page_index=args.index, response_cache=args.response_cache, host_rate=args.host_rate,
+                                 pool_maxsize=max(10, args.concurrency))
+    sites = [site.strip() for site in args.sites.split(',')] if args.sites else None
+    patterns = [pattern.strip() for pattern in args.patterns.split(',')] if args.patterns else None
+
+    try:
+        crawler = CatalogCrawler(validator, patterns, args.concurrency, args.max_pages)
+        summary = crawler.crawl(sites)
+    finally:
+        validator.close()
+
+    print(json.dumps(summary, indent=2))
+    for site_url, counts in summary.items():
+        print(f"{site_url}: {counts['listed']} listed, {counts['fetched']} indexed, {counts['unchanged']} unchanged, "
+              f"{counts['disallowed']} disallowed, {counts['failed']} failed", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,364 @@
+#!/usr/bin/env python3
+"""
+Local stand-ins for storefronts and DuckDuckGo, for offline benchmarking
+
+FakeWeb starts one HTTP server per storefront plus one search engine server in
+a child process, so the servers' CPU time does not count against the code
+being measured. Every server adds a configurable latency and fails a
+configurable fraction of requests with 503.
+
+Storefronts answer their homepage and the '/search?q=' template with product
+tiles from a deterministic catalog (or with recorded pages from a directory).
+They also serve robots.txt, a sitemap index with a product sitemap, one page
+per product under /products/ (with a JSON-LD Product block), and optionally
+a Shopify-style /products.json feed, for catalog crawls.
+The search engine answers '/html/?q=' with DuckDuckGo-style result blocks:
+results mention a code only when it really belongs to the quoted product.
+
+Run standalone to poke at it by hand:
+    python fake_storefront.py --stores 3 --latency 0.05
+"""
+
+import argparse
+import hashlib
+import html
+import json
+import multiprocessing
+import os
+import random
+import re
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, NamedTuple, Optional
+from urllib.parse import parse_qs, urlparse
+
+from candidates import gtin_check_digit
+from validation_store import normalize_product_name
+
+CATALOG_WORDS = [
+    "Space", "Marine", "Intercessors", "Necron", "Warriors", "Ork", "Boyz", "Tyranid",
+    "Termagants", "Aeldari", "Guardians", "Combat", "Patrol", "Citadel", "Paint", "Kill",
+    "Team", "Battleforce", "Stormcast", "Eternals", "Skaven", "Clanrats", "Gloomspite",
+    "Gitz", "Death", "Guard", "Custodes", "Chaos", "Knights", "Sisters", "Battle",
+]
+
+_QUOTED = re.compile(r'"([^"]+)"')
+
+# Search engine results per page
+RESULTS_PER_PAGE = 30
+
+# lastmod given for every product in the fake sitemaps and feeds
+CATALOG_LASTMOD = "2026-01-01"
+
+
+class CatalogProduct(NamedTuple):
+    name: str
+    sku: str
+    barcode: str
+
+
+def build_catalog(size: int, seed: int = 0) -> List[CatalogProduct]:
+    """Return a deterministic catalog of products with SKUs and barcodes"""
+    rng = random.Random(seed)
+    catalog = []
+    names = set()
+    while len(catalog) < size:
+        name = " ".join(rng.sample(CATALOG_WORDS, rng.randint(2, 4)))
+        if name in names:
+            continue
+        names.add(name)
+        index = len(catalog)
+        barcode_body = f"5011921{index:05d}"
+        catalog.append(CatalogProduct(
+            name=name,
+            sku=f"{10 + index // 90:02d}-{10 + index % 90:02d}",
+            barcode=barcode_body + str(gtin_check_digit(barcode_body))
+        ))
+    return catalog
+
+
+def _page(title: str, body: str, padding: int) -> bytes:
+    """Wrap content in storefront chrome (navigation, scripts, footer)"""
+    nav = "".join(f"<li><a href='/c/{i}'>Category {i}</a></li>" for i in range(padding))
+    footer = "<p>Free delivery over &pound;50 | Call 0115 916-8000 | Terms &amp; conditions</p>" * max(1, padding // 4)
+    return (
+        f"<!DOCTYPE html><html><head><meta charset='utf-8'><title>{html.escape(title)}</title>"
+        f"<script>window.dataLayer=[];</script><style>.tile{{margin:4px}}</style></head>"
+        f"<body><nav><ul>{nav}</ul></nav><main>{body}</main><footer>{footer}</footer></body></html>"
+    ).encode('utf-8')
+
+
+def product_slug(product: CatalogProduct) -> str:
+    return normalize_product_name(product.name).replace(' ', '-')
+
+
+def _tiles(products: List[CatalogProduct]) -> str:
+    return "".join(
+        f"<div class='tile product'><h4>{html.escape(p.name)}</h4><span class='price'>&pound;25.00</span>"
+        f"<p>SKU: {p.sku}</p><p>Barcode: {p.barcode}</p><button>Add to basket</button></div>"
+        for p in products
+    )
+
+
+class _FakeHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server_version = 'FakeStorefront/1.0'
+
+    def setup(self):
+        super().setup()
+        # Headers and body go out in separate writes; without this, delayed ACKs add ~40 ms per keep-alive request
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        config = self.server.config
+        if config['latency']:
+            time.sleep(random.uniform(0.5, 1.5) * config['latency'])
+
+        if config['error_rate'] and random.random() < config['error_rate']:
+            self._send(503, b'Service Unavailable', {'Retry-After': '1'})
+            return
+
+        parsed = urlparse(self.path)
+        query = parse_qs(parsed.query)
+        body = self.server.route(parsed.path, query)
+        if body is None:
+            self._send(404, b'Not Found')
+        else:
+            self._send(200, body, {'Content-Type': 'text/html; charset=utf-8'})
+
+    def _send(self, status: int, body: bytes, headers: Dict[str, str] = None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class StorefrontServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, catalog: List[CatalogProduct], latency: float, error_rate: float,
+                 pages_dir: Optional[str] = None, padding: int = 60, feed: bool = False):
+        super().__init__(('127.0.0.1', 0), _FakeHandler)
+        self.catalog = catalog
+        self.by_slug = {product_slug(p): p for p in catalog}
+        self.config = {'latency': latency, 'error_rate': error_rate}
+        self.padding = padding
+        self.feed = feed
+        self.recorded = []
+        if pages_dir:
+            for name in sorted(os.listdir(pages_dir)):
+                with open(os.path.join(pages_dir, name), 'rb') as f:
+                    self.recorded.append(f.read())
+
+    def route(self, path: str, query: Dict[str, List[str]]) -> Optional[bytes]:
+        if path in ('', '/') and not query:
+            return _page("Home", "<h2>Featured</h2>" + _tiles(self.catalog[:12]), self.padding)
+
+        terms = query.get('q') or query.get('search')
+        if path in ('/', '/search') and terms:
+            if self.recorded:
+                digest = int(hashlib.md5(terms[0].encode('utf-8')).hexdigest(), 16)
+                return self.recorded[digest % len(self.recorded)]
+
+            words = normalize_product_name(terms[0]).split()
+            hits = [p for p in self.catalog if all(w in p.name.lower() for w in words)][:24]
+            return _page(f"Search results for {terms[0]}", f"<h2>{len(hits)} results</h2>" + _tiles(hits), self.padding)
+
+        return self._catalog_route(path, query)
+
+    def _catalog_route(self, path: str, query: Dict[str, List[str]]) -> Optional[bytes]:
+        base = f"http://127.0.0.1:{self.server_port}"
+        if path == '/robots.txt':
+            return f"User-agent: *\nDisallow: /checkout\nSitemap: {base}/sitemap.xml\n".encode('utf-8')
+
+        if path == '/sitemap.xml':
+            children = "".join(f"<sitemap><loc>{base}/{name}</loc></sitemap>"
+                               for name in ('sitemap_pages_1.xml', 'sitemap_products_1.xml'))
+            return (f"<?xml version='1.0' encoding='UTF-8'?>"
+                    f"<sitemapindex xmlns='http://www.sitemaps.org/schemas/sitemap/0.9'>{children}</sitemapindex>").encode('utf-8')
+
+        if path in ('/sitemap_pages_1.xml', '/sitemap_products_1.xml'):
+            if path == '/sitemap_pages_1.xml':
+                urls = [(f"{base}/pages/about", None)]
+            else:
+                urls = [(f"{base}/products/{product_slug(p)}", CATALOG_LASTMOD) for p in self.catalog]
+            entries = "".join(
+                f"<url><loc>{url}</loc>" + (f"<lastmod>{lastmod}</lastmod>" if lastmod else "") + "</url>"
+                for url, lastmod in urls
+            )
+            return (f"<?xml version='1.0' encoding='UTF-8'?>"
+                    f"<urlset xmlns='http://www.sitemaps.org/schemas/sitemap/0.9'>{entries}</urlset>").encode('utf-8')
+
+        if path.startswith('/products/') and path[len('/products/'):] in self.by_slug:
+            product = self.by_slug[path[len('/products/'):]]
+            index = self.catalog.index(product)
+            related = [self.catalog[(index + step) % len(self.catalog)] for step in (1, 2)]
+            structured = json.dumps({
+                '@context': 'https://schema.org', '@type': 'Product', 'name': product.name, 'sku': product.sku,
+                'gtin13': product.barcode, 'offers': {'@type': 'Offer', 'price': '25.00', 'priceCurrency': 'GBP'}
+            })
+            body = (f"<script type='application/ld+json'>{structured}</script>"
+                    f"<div class='product-view'><h1>{html.escape(product.name)}</h1>"
+                    f"<span class='price'>&pound;25.00</span><p>SKU: {product.sku}</p>"
+                    f"<p>Barcode: {product.barcode}</p><button>Add to basket</button></div>"
+                    f"<h3>You may also like</h3>" + _tiles(related))
+            return _page(product.name, body, self.padding)
+
+        if path == '/products.json' and self.feed:
+            limit = int(query.get('limit', ['30'])[0])
+            page = int(query.get('page', ['1'])[0])
+            products = self.catalog[(page - 1) * limit:page * limit]
+            return json.dumps({'products': [
+                {'title': p.name, 'handle': product_slug(p), 'updated_at': CATALOG_LASTMOD,
+                 'variants': [{'sku': p.sku, 'barcode': p.barcode}]}
+                for p in products
+            ]}).encode('utf-8')
+
+        return None
+
+
+class SearchEngineServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, catalog: List[CatalogProduct], latency: float, error_rate: float, results_per_code: int = 4):
+        super().__init__(('127.0.0.1', 0), _FakeHandler)
+        self.config = {'latency': latency, 'error_rate': error_rate}
+        self.results_per_code = results_per_code
+        self.codes_by_product = {
+            normalize_product_name(p.name): {p.sku, p.barcode} for p in catalog
+        }
+
+    def route(self, path: str, query: Dict[str, List[str]]) -> Optional[bytes]:
+        if path.rstrip('/') != '/html' or 'q' not in query:
+            return None
+
+        quoted = _QUOTED.findall(query['q'][0])
+        product = quoted[0] if quoted else query['q'][0]
+        known = self.codes_by_product.get(normalize_product_name(product), set())
+
+        blocks = []
+        for code in quoted[1:]:
+            if code in known:
+                for i in range(self.results_per_code):
+                    blocks.append((f"{product} {code} | Shop {i}", f"https://shop{i}.example/p/{code}",
+                                   f"Buy {product} ({code}) today, in stock."))
+        # Loosely related noise that mentions the product but no code
+        blocks.append((f"{product} review", "https://blog.example/review", f"Our thoughts on {product}."))
+
+        # Pages of RESULTS_PER_PAGE, later ones selected with '&s=<offset>' like DuckDuckGo's
+        offset = int(query.get('s', ['0'])[0] or 0)
+        blocks = blocks[offset:offset + RESULTS_PER_PAGE]
+
+        results = "".join(
+            f"<div class='result results_links web-result'><div class='links_main result__body'>"
+            f"<h2 class='result__title'><a class='result__a' href='{html.escape(url)}'>{html.escape(title)}</a></h2>"
+            f"<div class='result__snippet'>{html.escape(snippet)}</div></div></div>"
+            for title, url, snippet in blocks
+        )
+        return f"<html><head><title>search at DuckDuckGo</title></head><body><div id='links'>{results}</div></body></html>".encode('utf-8')
+
+
+def _serve(config: dict, ready):
+    catalog = build_catalog(config['products'], config['seed'])
+    random.seed(config['seed'])
+
+    # Every second store also has a products.json feed, like a Shopify store
+    servers = [
+        StorefrontServer(catalog, config['latency'], config['error_rate'], config.get('pages_dir'), feed=index % 2 == 1)
+        for index in range(config['stores'])
+    ]
+    search = SearchEngineServer(catalog, config['search_latency'], config['error_rate'])
+
+    for server in servers + [search]:
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    ready.send({
+        'store_urls': [f"http://127.0.0.1:{s.server_port}/" for s in servers],
+        'search_url': f"http://127.0.0.1:{search.server_port}/html/?q={{query}}"
+    })
+    ready.recv()  # Block until the parent asks us to stop
+
+
+class FakeWeb:
+    """Storefront and search engine stand-ins running in a child process"""
+
+    def __init__(self, stores: int = 3, products: int = 500, latency: float = 0.05, search_latency: float = 0.1,
+                 error_rate: float = 0.0, pages_dir: Optional[str] = None, seed: int = 0):
+        """
+        Args:
+            stores: Number of storefronts (each gets its own port, so its own host)
+            products: Catalog size
+            latency: Mean storefront response delay in seconds
+            search_latency: Mean search engine response delay in seconds
+            error_rate: Fraction of requests answered with 503
+            pages_dir: Directory of recorded storefront pages served for searches
+            seed: Seed for the catalog and for latency/error randomness
+        """
+        self.config = {
+            'stores': stores, 'products': products, 'latency': latency, 'search_latency': search_latency,
+            'error_rate': error_rate, 'pages_dir': pages_dir, 'seed': seed,
+        }
+        self.catalog = build_catalog(products, seed)
+        self.store_urls: List[str] = []
+        self.search_url = ''
+        self._process = None
+        self._pipe = None
+
+    def start(self) -> 'FakeWeb':
+        self._pipe, child = multiprocessing.Pipe()
+        self._process = multiprocessing.Process(target=_serve, args=(self.config, child), daemon=True)
+        self._process.start()
+        endpoints = self._pipe.recv()
+        self.store_urls = endpoints['store_urls']
+        self.search_url = endpoints['search_url']
+        return self
+
+    def stop(self):
+        if self._process is not None:
+            try:
+                self._pipe.send('stop')
+            except OSError:
+                pass
+            self._process.join(timeout=5)
+            if self._process.is_alive():
+                self._process.terminate()
+            self._process = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--stores', type=int, default=3)
+    parser.add_argument('--products', type=int, default=500)
+    parser.add_argument('--latency', type=float, default=0.05)
+    parser.add_argument('--search-latency', type=float, default=0.1)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--pages', help='Directory of recorded storefront pages')
+    args = parser.parse_args()
+
+    web = FakeWeb(args.stores, args.products, args.latency, args.search_latency, args.error_rate, args.pages).start()
+    print("Storefronts:", ", ".join(web.store_urls))
+    print("Search engine:", web.search_url)
+    print("Sample products:", "; ".join(p.name for p in web.catalog[:5]))
+    print("Ctrl+C to stop")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        web.stop()
+
+
+if __name__ == "__main__":
+    main()
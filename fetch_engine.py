@@ -0,0 +1,134 @@
+"""
+Concurrent fetch engine used by ProductValidator's async fetch mode
+"""
+
+import asyncio
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Optional
+
+from rate_limit import HostRateLimiter
+
+
+class AsyncFetchEngine:
+    """
+    Runs blocking fetches concurrently from asyncio
+
+    The blocking fetch function (normally ProductValidator._fetch, which goes
+    through the shared requests.Session) runs on a worker thread pool. A global
+    cap limits how many fetches are in flight at once, and a per-host token
+    bucket replaces the fixed sleeps between requests.
+    """
+
+    def __init__(self, fetch: Callable[[str], Any], max_concurrency: int = 8,
+                 rate_limiter: Optional[HostRateLimiter] = None,
+                 on_wait: Optional[Callable[[str, float], None]] = None,
+                 is_cached: Optional[Callable[[str], bool]] = None):
+        """
+        Args:
+            fetch: Blocking function that takes a URL and returns a response
+            max_concurrency: Maximum number of fetches in flight at once
+            rate_limiter: Per-host politeness limiter (1 request/second per host if None)
+            on_wait: Called with (host, seconds) whenever a fetch waits for its host's token
+            is_cached: Blocking function telling whether a URL will be answered
+                without a request (from a response cache), so it needs no token
+        """
+        self._fetch = fetch
+        self.on_wait = on_wait
+        self.is_cached = is_cached
+        self.max_concurrency = max(1, max_concurrency)
+        self.rate_limiter = rate_limiter if rate_limiter is not None else HostRateLimiter()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._executor_lock = threading.Lock()
+        # Semaphores are bound to the event loop they were created on
+        self._semaphores = {}
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_concurrency,
+                    thread_name_prefix='fetch'
+                )
+            return self._executor
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._semaphores = {loop: semaphore}
+        return semaphore
+
+    async def run_blocking(self, func: Callable, *args) -> Any:
+        """Run a blocking callable on the engine's worker threads, in the caller's context"""
+        loop = asyncio.get_running_loop()
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(self._get_executor(), context.run, func, *args)
+
+    async def fetch(self, url: str, handler: Optional[Callable[[str], Any]] = None) -> Any:
+        """
+        Fetch a URL once the host's politeness budget and the global cap allow it
+
+        handler, if given, is a blocking function of the URL that replaces the
+        engine's fetch function for this request (e.g. one that streams and
+        scans the body on the worker thread).
+        """
+        # A cached page costs the host nothing: no token, and no slot since it makes no request
+        if self.is_cached is not None and await self.run_blocking(self.is_cached, url):
+            return await self.run_blocking(handler or self._fetch, url)
+
+        # Wait for the host's token before taking a concurrency slot so that
+        # slots are never held by requests that are only waiting to be polite
+        delay = await self.rate_limiter.wait_async(url)
+        if delay > 0 and self.on_wait is not None:
+            self.on_wait(self.rate_limiter.host_for(url), delay)
+
+        return await self.run_limited(handler or self._fetch, url)
+
+    async def run_limited(self, func: Callable, *args) -> Any:
+        """
+        Run a blocking callable that makes requests within the global concurrency cap
+
+        Unlike fetch it does not wait for a host token; func is expected to
+        take care of politeness itself.
+        """
+        async with self._get_semaphore():
+            return await self.run_blocking(func, *args)
+
+    def close(self):
+        """Shut down the worker threads"""
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
+
+
+def run_sync(coro: Awaitable) -> Any:
+    """
+    Run a coroutine to completion from synchronous code
+
+    Works whether or not the caller is already inside a running event loop; in
+    the latter case the coroutine runs on its own loop in a helper thread.
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+
+    outcome = {}
+
+    def runner():
+        try:
+            outcome['result'] = asyncio.run(coro)
+        except BaseException as e:
+            outcome['error'] = e
+
+    thread = threading.Thread(target=runner, name='run-sync')
+    thread.start()
+    thread.join()
+
+    if 'error' in outcome:
+        raise outcome['error']
+    return outcome['result']
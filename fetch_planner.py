@@ -0,0 +1,170 @@
+"""
+Run-scoped fetch plan: fetch each store URL once per batch of products
+
+Searching a list of products one by one downloads the same pages over and
+over: every search starts with the store's homepage, and products whose names
+normalize alike share search URLs. A FetchPlan is built from the whole product
+list before anything is fetched:
+
+    plan = FetchPlan.build(validator, products, target_sites)
+    validator.search_product_codes_on_sites(product, target_sites, code_patterns, fetch_plan=plan)
+
+It knows every (product, site) search and how many of them need each URL. The
+first search to ask for a URL fetches it; searches asking while that fetch is
+in flight wait for it, and later ones get the stored page. The parsed text and
+the codes found in it do not depend on the product, so they are worked out
+once per URL as well (structured-data scans, which do, still run per product).
+
+A page is dropped as soon as the last search that planned to read it is done,
+so memory follows the searches in flight rather than the size of the batch.
+URLs nobody planned for (a site profile learned mid-run, say) are fetched
+directly, as without a plan, and a failed fetch is not kept: the next search
+asking for the URL tries it again. stats() tells how many downloads the plan
+saved; process_product_list adds them to the pool's metrics as
+fetch_plan_* counters.
+"""
+
+import threading
+from collections import Counter
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Tuple
+
+
+class _Page:
+    __slots__ = ('ready', 'content', 'error', 'scans')
+
+    def __init__(self):
+        self.ready = threading.Event()
+        self.content = None
+        self.error = None
+        self.scans = {}
+
+
+class FetchPlan:
+    """Thread-safe single-flight page store for the searches of one batch"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._searches: Dict[Tuple[str, str], List[str]] = {}
+        self._uses: Counter = Counter()
+        self._pages: Dict[str, _Page] = {}
+        self._counts = Counter()
+
+    @classmethod
+    def build(cls, validator, products: Iterable[str], target_sites: List[str]) -> 'FetchPlan':
+        """
+        Plan the searches of a product list against a list of sites
+
+        Args:
+            validator: ProductValidator whose search plan (and site profiles) pick the URLs
+            products: Product names, in any order (repeats are planned once per occurrence)
+            target_sites: List of URLs to search
+        """
+        plan = cls()
+        for product_name in products:
+            for site_url in target_sites:
+                key = (product_name, site_url)
+                urls = plan._searches.get(key)
+                if urls is None:
+                    search_plan, _ = validator._search_plan(site_url, product_name)
+                    # A URL listed twice for one site is still read once by that search
+                    urls = list(dict.fromkeys(url for _, url in search_plan))
+                    plan._searches[key] = urls
+                plan._uses.update(urls)
+                plan._counts['planned'] += len(urls)
+        plan._counts['unique'] = len(plan._uses)
+        return plan
+
+    def page(self, url: str, fetch: Callable[[str], Any]) -> Tuple[Any, bool]:
+        """
+        Return a URL's page, fetching it only if no other search has
+
+        Args:
+            url: URL to read
+            fetch: Called with the URL to download it (returning its body or response) when this
+                caller is the first to ask
+
+        Returns:
+            (what fetch returned, True if this call fetched it)
+
+        Raises:
+            Whatever the fetch raised, for the searches that were waiting on it
+        """
+        with self._lock:
+            if not self._uses.get(url):
+                self._counts['unplanned'] += 1
+                entry = None
+            else:
+                entry = self._pages.get(url)
+                owner = entry is None
+                if owner:
+                    entry = self._pages[url] = _Page()
+                else:
+                    self._counts['shared'] += 1
+        if entry is None:
+            return fetch(url), True
+
+        if not owner:
+            entry.ready.wait()
+            if entry.error is not None:
+                raise entry.error
+            return entry.content, False
+
+        try:
+            entry.content = fetch(url)
+        except Exception as e:
+            # Searches already waiting share the failure, but it is not remembered:
+            # the next search to ask tries the URL again
+            entry.error = e
+            with self._lock:
+                if self._pages.get(url) is entry:
+                    del self._pages[url]
+            raise
+        finally:
+            entry.ready.set()
+        with self._lock:
+            self._counts['fetched'] += 1
+        return entry.content, True
+
+    def scanned(self, url: str, key: Hashable) -> Any:
+        """Return the scan kept for a page under key (the code patterns, say), or None"""
+        with self._lock:
+            entry = self._pages.get(url)
+            return entry.scans.get(key) if entry is not None else None
+
+    def keep_scan(self, url: str, key: Hashable, scan: Any):
+        """
+        Keep a product-independent scan of a page (its text and codes) for the other searches reading it
+
+        Two searches reading a page at the same moment may both scan it; either result will do.
+        """
+        with self._lock:
+            entry = self._pages.get(url)
+            if entry is not None:
+                entry.scans[key] = scan
+
+    def done(self, product_name: str, site_url: str):
+        """Mark one planned search finished, dropping the pages no other search still needs"""
+        with self._lock:
+            for url in self._searches.get((product_name, site_url), ()):
+                remaining = self._uses.get(url, 0) - 1
+                if remaining > 0:
+                    self._uses[url] = remaining
+                    continue
+                self._uses.pop(url, None)
+                self._pages.pop(url, None)
+
+    def record(self, metrics):
+        """Add the plan's stats to a Metrics as fetch_plan_<name> counters"""
+        for name, value in self.stats().items():
+            metrics.inc(f'fetch_plan_{name}', '', value)
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Return how many fetches the plan saved
+
+        'planned' URL reads across all searches, 'unique' URLs among them,
+        'fetched' downloads, 'shared' reads served from another search's
+        download and 'unplanned' URLs fetched outside the plan.
+        """
+        with self._lock:
+            return {name: self._counts[name] for name in ('planned', 'unique', 'fetched', 'shared', 'unplanned')}
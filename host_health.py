@@ -0,0 +1,291 @@
+"""
+Per-host health: adaptive pacing, Retry-After, crawl-delay, retries and circuit breaking
+
+HostHealth watches every response from a host and decides how the next
+request to it is sent:
+
+- Pacing: each host has a minimum interval between requests, on top of the
+  rate limiter. It starts at the host's robots.txt Crawl-delay (or zero),
+  doubles on every 429/503 and grows on responses slower than slow_seconds,
+  then halves with every healthy response.
+- Retry-After: a 429/503 carrying Retry-After holds the host until then.
+  A hold longer than max_retry_wait is not waited out by a retry; the
+  request fails and the host is skipped until the hold ends.
+- Retries: connection errors, 429 and 502-504 are retried up to max_retries
+  times, after the Retry-After delay or a jittered exponential backoff. Only
+  GETs go through here, so every retry is idempotent. Timeouts are not
+  retried (they have already cost the full timeout) but count as failures.
+- Circuit breaker: after failure_threshold consecutive failures a host is
+  skipped (HostUnavailable is raised without sending anything) for a
+  cool-down that doubles each time the host fails again, up to max_cooldown.
+  Once it passes, one probe request is let through; success closes the
+  circuit, failure opens it again.
+
+One HostHealth is meant to be shared by every validator in a process, so one
+dead store is found out once rather than once per validator.
+"""
+
+import email.utils
+import random
+import threading
+import time
+from typing import Any, Dict, Optional
+
+# Statuses worth another attempt: throttling and gateway/overload errors
+RETRYABLE_STATUSES = frozenset([429, 502, 503, 504])
+# Statuses that ask us to slow down
+THROTTLE_STATUSES = frozenset([429, 503])
+
+
+class HostUnavailable(Exception):
+    """Raised instead of sending a request to a host whose circuit is open"""
+
+    def __init__(self, host: str, retry_in: float):
+        super().__init__(f"{host} skipped after repeated failures (retrying in {retry_in:.0f}s)")
+        self.host = host
+        self.retry_in = retry_in
+
+
+def parse_retry_after(value: Optional[str], now: Optional[float] = None) -> Optional[float]:
+    """Return the seconds a Retry-After header (delta-seconds or HTTP date) asks to wait, or None"""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError, IndexError):
+        return None
+    if when is None:
+        return None
+    return max(0.0, when.timestamp() - (now if now is not None else time.time()))
+
+
+def parse_crawl_delay(robots_txt: str, user_agent: str) -> Optional[float]:
+    """
+    Return the Crawl-delay robots.txt sets for a user agent, or None
+
+    The first group naming a product token contained in user_agent wins;
+    otherwise the '*' group applies.
+    """
+    agent = user_agent.lower()
+    delays: Dict[str, float] = {}
+    group_agents = []
+    in_rules = False
+
+    for line in robots_txt.splitlines():
+        name, _, value = line.split('#', 1)[0].partition(':')
+        name = name.strip().lower()
+        value = value.strip()
+        if name == 'user-agent':
+            # Consecutive User-agent lines share one group of rules
+            if in_rules:
+                group_agents = []
+                in_rules = False
+            group_agents.append(value.lower())
+        elif name:
+            in_rules = True
+            if name == 'crawl-delay':
+                try:
+                    delay = float(value)
+                except ValueError:
+                    continue
+                for token in group_agents:
+                    delays.setdefault(token, delay)
+
+    for token, delay in delays.items():
+        if token != '*' and token and token in agent:
+            return delay
+    return delays.get('*')
+
+
+class _HostState:
+    __slots__ = ('interval', 'crawl_delay', 'next_allowed', 'failures', 'open_until', 'cooldown',
+                 'probing', 'latency', 'robots_checked')
+
+    def __init__(self, cooldown: float):
+        self.interval = 0.0
+        self.crawl_delay = 0.0
+        self.next_allowed = 0.0
+        self.failures = 0
+        self.open_until = 0.0
+        self.cooldown = cooldown
+        self.probing = False
+        self.latency = None
+        self.robots_checked = False
+
+
+class HostHealth:
+    """Thread-safe per-host pacing, retry policy and circuit breakers"""
+
+    def __init__(self, failure_threshold: int = 3, cooldown: float = 60, max_cooldown: float = 900,
+                 max_interval: float = 30, slow_seconds: float = 5.0, max_retries: int = 2,
+                 retry_backoff: float = 0.5, max_retry_wait: float = 10, check_robots: bool = True):
+        """
+        Args:
+            failure_threshold: Consecutive failures that open a host's circuit
+            cooldown: Seconds a circuit first stays open (doubles on each reopening)
+            max_cooldown: Longest a circuit stays open
+            max_interval: Longest pacing interval between requests to a host
+            slow_seconds: Response time above which a host is paced more slowly
+            max_retries: Extra attempts for a failed or throttled request
+            retry_backoff: Base of the jittered exponential backoff between attempts
+            max_retry_wait: Longest Retry-After a retry waits out; longer ones skip the host instead
+            check_robots: Read each store's robots.txt once for its Crawl-delay
+        """
+        self.failure_threshold = max(1, failure_threshold)
+        self.cooldown = cooldown
+        self.max_cooldown = max(cooldown, max_cooldown)
+        self.max_interval = max_interval
+        self.slow_seconds = slow_seconds
+        self.max_retries = max(0, max_retries)
+        self.retry_backoff = retry_backoff
+        self.max_retry_wait = max_retry_wait
+        self.check_robots = check_robots
+        self._lock = threading.Lock()
+        self._hosts: Dict[str, _HostState] = {}
+
+    def _state(self, host: str) -> _HostState:
+        state = self._hosts.get(host)
+        if state is None:
+            state = _HostState(self.cooldown)
+            self._hosts[host] = state
+        return state
+
+    def check(self, host: str):
+        """Raise HostUnavailable if requests to a host are currently being skipped, without reserving a slot"""
+        with self._lock:
+            state = self._hosts.get(host)
+            if state is None:
+                return
+            now = time.time()
+            if now < state.open_until:
+                raise HostUnavailable(host, state.open_until - now)
+            if state.probing:
+                raise HostUnavailable(host, 0)
+
+    def before_request(self, host: str) -> float:
+        """
+        Reserve the next request slot for a host and return the seconds to wait before sending
+
+        Raises:
+            HostUnavailable: If the host's circuit is open (or its one probe request is in flight)
+        """
+        with self._lock:
+            state = self._state(host)
+            now = time.time()
+            if now < state.open_until:
+                raise HostUnavailable(host, state.open_until - now)
+            if state.open_until:
+                # The cool-down has passed: let exactly one probe through
+                if state.probing:
+                    raise HostUnavailable(host, 0)
+                state.probing = True
+
+            interval = max(state.interval, state.crawl_delay)
+            start = max(now, state.next_allowed)
+            state.next_allowed = start + interval
+            return start - now
+
+    def record(self, host: str, status: Optional[int] = None, latency: Optional[float] = None,
+               retry_after: Optional[float] = None, error: bool = False, final: bool = True):
+        """
+        Record how a request to a host went
+
+        Args:
+            host: Host the request went to
+            status: HTTP status received (None if there was no response)
+            latency: Seconds until the response arrived
+            retry_after: Seconds the host's Retry-After header asked for
+            error: The request failed without a response (connection error, timeout)
+            final: False for an attempt that is about to be retried; it paces the host but
+                only a request's final failure counts toward opening its circuit
+
+        A call with neither status nor error (a response served from cache, say)
+        tells nothing about the host and only ends a probe.
+        """
+        with self._lock:
+            state = self._state(host)
+            now = time.time()
+
+            if retry_after is not None:
+                state.next_allowed = max(state.next_allowed, now + retry_after)
+                if retry_after > self.max_retry_wait:
+                    # Asked to stay away for longer than a retry would wait: skip the host until then
+                    state.open_until = max(state.open_until, now + min(retry_after, self.max_cooldown))
+
+            if status is None and not error:
+                state.probing = False
+                return
+
+            if status in THROTTLE_STATUSES:
+                state.interval = min(self.max_interval, max(state.interval * 2, 0.5))
+
+            if error or status in RETRYABLE_STATUSES or (status is not None and status >= 500):
+                if not final:
+                    return
+                state.failures += 1
+                if state.probing or state.failures >= self.failure_threshold:
+                    state.open_until = max(state.open_until, now + state.cooldown)
+                    state.cooldown = min(self.max_cooldown, state.cooldown * 2)
+                state.probing = False
+                return
+
+            # A response (404s included): the host is up
+            state.failures = 0
+            if state.probing or (state.open_until and now >= state.open_until):
+                state.open_until = 0.0
+                state.cooldown = self.cooldown
+            state.probing = False
+            if latency is not None:
+                state.latency = latency if state.latency is None else 0.8 * state.latency + 0.2 * latency
+                if latency > self.slow_seconds:
+                    state.interval = min(self.max_interval, max(state.interval * 1.5, 1.0))
+                    return
+            state.interval = state.interval * 0.5 if state.interval > 0.05 else 0.0
+
+    def retry_delay(self, attempt: int, retry_after: Optional[float] = None) -> Optional[float]:
+        """
+        Return the seconds to wait before retrying a failed attempt (0 = the first), or None to give up
+
+        A Retry-After delay is already enforced by before_request, so it only decides whether to retry.
+        """
+        if attempt >= self.max_retries:
+            return None
+        if retry_after is not None:
+            return None if retry_after > self.max_retry_wait else 0.0
+        # Full jitter, so retries from many workers do not arrive together
+        return random.uniform(0, self.retry_backoff * 2 ** attempt)
+
+    def should_check_robots(self, host: str) -> bool:
+        """True the first time it is asked about a host, when robots.txt is to be read"""
+        if not self.check_robots:
+            return False
+        with self._lock:
+            state = self._state(host)
+            if state.robots_checked:
+                return False
+            state.robots_checked = True
+            return True
+
+    def set_crawl_delay(self, host: str, seconds: Optional[float]):
+        """Pace a host at least seconds apart (robots.txt Crawl-delay), capped at max_interval"""
+        with self._lock:
+            state = self._state(host)
+            state.crawl_delay = min(self.max_interval, max(0.0, seconds or 0.0))
+            state.robots_checked = True
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """Return each host's pacing interval, latency, failure count and circuit state"""
+        now = time.time()
+        with self._lock:
+            return {
+                host: {
+                    'interval': max(state.interval, state.crawl_delay),
+                    'latency': state.latency,
+                    'failures': state.failures,
+                    'circuit': 'open' if now < state.open_until else 'half-open' if state.open_until else 'closed',
+                }
+                for host, state in self._hosts.items()
+            }
@@ -0,0 +1,299 @@
+"""
+Disk-backed HTTP response cache for the shared requests.Session
+
+ResponseCache stores GET responses in a SQLite file keyed by URL. Entries are
+fresh for a TTL (from Cache-Control max-age when the server sends one,
+otherwise the cache default). Stale entries that carry an ETag or
+Last-Modified header are revalidated with a conditional request, and a 304
+reply refreshes the stored copy without downloading the body again. Responses
+answered from the cache alone have from_cache set; revalidated ones went to
+the store, so they have revalidated set instead. The total
+body size is bounded and the least recently used entries are evicted first.
+
+CachingAdapter plugs the cache into a requests.Session:
+
+    cache = ResponseCache('.cache/responses.sqlite')
+    session.mount('http://', CachingAdapter(cache))
+    session.mount('https://', CachingAdapter(cache))
+"""
+
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, NamedTuple, Optional
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+_MAX_AGE = re.compile(r'max-age\s*=\s*(\d+)', re.IGNORECASE)
+
+COUNTER_NAMES = ('hits', 'misses', 'revalidated', 'stored', 'evicted')
+
+# (cache, counters) pairs open in the current context, innermost last
+_scopes: ContextVar[tuple] = ContextVar('response_cache_scopes', default=())
+
+
+class CachedResponse(NamedTuple):
+    """A stored response"""
+    url: str
+    status: int
+    headers: Dict[str, str]
+    body: bytes
+    stored_at: float
+    expires_at: float
+    etag: Optional[str]
+    last_modified: Optional[str]
+
+    def is_fresh(self, now: float = None) -> bool:
+        return (now if now is not None else time.time()) < self.expires_at
+
+    def can_revalidate(self) -> bool:
+        return bool(self.etag or self.last_modified)
+
+
+class ResponseCache:
+    """Size-bounded LRU cache of HTTP responses in a SQLite file"""
+
+    def __init__(self, path: str, default_ttl: float = 6 * 3600, max_bytes: int = 256 * 1024 * 1024,
+                 ttl_overrides: Dict[str, float] = None):
+        """
+        Args:
+            path: SQLite file to store responses in (parent directories are created)
+            default_ttl: Seconds a response stays fresh when the server gives no max-age
+            max_bytes: Upper bound on the total size of stored bodies
+            ttl_overrides: Per-host TTLs that take precedence over the default
+        """
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+        self.path = path
+        self.default_ttl = default_ttl
+        self.max_bytes = max_bytes
+        self.ttl_overrides = dict(ttl_overrides or {})
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                url TEXT PRIMARY KEY,
+                status INTEGER NOT NULL,
+                headers TEXT NOT NULL,
+                body BLOB NOT NULL,
+                stored_at REAL NOT NULL,
+                expires_at REAL NOT NULL,
+                etag TEXT,
+                last_modified TEXT,
+                size INTEGER NOT NULL,
+                last_access REAL NOT NULL
+            )
+        """)
+        self._conn.execute('CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)')
+        self._total_bytes = self._conn.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+
+        self._counters = dict.fromkeys(COUNTER_NAMES, 0)
+
+    # Counters
+
+    def count(self, name: str):
+        with self._lock:
+            self._count_locked(name)
+
+    def _count_locked(self, name: str):
+        self._counters[name] += 1
+        for owner, counters in _scopes.get():
+            if owner is self:
+                counters[name] += 1
+
+    def counters(self) -> Dict[str, int]:
+        """Return a snapshot of the hit/miss counters"""
+        with self._lock:
+            return dict(self._counters)
+
+    @contextmanager
+    def scope(self) -> Iterator[Dict[str, int]]:
+        """
+        Count the enclosed block's hits and misses separately as well
+
+        The yielded dict holds only the counts made in the block's context (see
+        Metrics.scope), not those of other threads sharing the cache.
+        """
+        counters = dict.fromkeys(COUNTER_NAMES, 0)
+        token = _scopes.set(_scopes.get() + ((self, counters),))
+        try:
+            yield counters
+        finally:
+            _scopes.reset(token)
+
+    # Storage
+
+    def get(self, url: str) -> Optional[CachedResponse]:
+        """Return the stored response for a URL, marking it as recently used"""
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT url, status, headers, body, stored_at, expires_at, etag, last_modified '
+                'FROM responses WHERE url = ?', (url,)
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute('UPDATE responses SET last_access = ? WHERE url = ?', (time.time(), url))
+
+        url, status, headers, body, stored_at, expires_at, etag, last_modified = row
+        return CachedResponse(url, status, json.loads(headers), bytes(body), stored_at, expires_at, etag, last_modified)
+
+    def ttl_for(self, url: str, headers: Dict[str, str]) -> Optional[float]:
+        """Return how long a response stays fresh, or None if it must not be stored"""
+        cache_control = headers.get('Cache-Control', '')
+        if 'no-store' in cache_control.lower():
+            return None
+        if 'no-cache' in cache_control.lower():
+            return 0.0
+
+        host = urlparse(url).netloc.lower()
+        if host in self.ttl_overrides:
+            return self.ttl_overrides[host]
+
+        max_age = _MAX_AGE.search(cache_control)
+        if max_age:
+            return float(max_age.group(1))
+        return self.default_ttl
+
+    def put(self, url: str, status: int, headers: Dict[str, str], body: bytes) -> bool:
+        """Store a response, returning False if its headers forbid caching"""
+        headers = CaseInsensitiveDict(headers)
+        ttl = self.ttl_for(url, headers)
+        if ttl is None:
+            return False
+
+        now = time.time()
+        size = len(body)
+        if size > self.max_bytes:
+            return False
+
+        with self._lock:
+            previous = self._conn.execute('SELECT size FROM responses WHERE url = ?', (url,)).fetchone()
+            self._conn.execute(
+                'INSERT OR REPLACE INTO responses '
+                '(url, status, headers, body, stored_at, expires_at, etag, last_modified, size, last_access) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (url, status, json.dumps(dict(headers)), sqlite3.Binary(body), now, now + ttl,
+                 headers.get('ETag'), headers.get('Last-Modified'), size, now)
+            )
+            self._total_bytes += size - (previous[0] if previous else 0)
+            self._count_locked('stored')
+            self._evict_locked()
+        return True
+
+    def refresh(self, entry: CachedResponse, headers: Dict[str, str]):
+        """Extend a stored response's freshness after a 304 Not Modified reply"""
+        merged = CaseInsensitiveDict(entry.headers)
+        merged.update({k: v for k, v in headers.items() if k.lower() in ('cache-control', 'etag', 'last-modified', 'expires', 'date')})
+        ttl = self.ttl_for(entry.url, merged)
+        now = time.time()
+
+        with self._lock:
+            self._conn.execute(
+                'UPDATE responses SET headers = ?, expires_at = ?, etag = ?, last_modified = ?, last_access = ? WHERE url = ?',
+                (json.dumps(dict(merged)), now + (ttl or 0.0), merged.get('ETag'), merged.get('Last-Modified'), now, entry.url)
+            )
+
+    def _evict_locked(self):
+        """Drop least recently used entries until the size bound holds"""
+        while self._total_bytes > self.max_bytes:
+            rows = self._conn.execute(
+                'SELECT url, size FROM responses ORDER BY last_access ASC LIMIT 32'
+            ).fetchall()
+            if not rows:
+                self._total_bytes = 0
+                break
+            for url, size in rows:
+                self._conn.execute('DELETE FROM responses WHERE url = ?', (url,))
+                self._total_bytes -= size
+                self._count_locked('evicted')
+                if self._total_bytes <= self.max_bytes:
+                    break
+
+    def clear(self):
+        """Remove every stored response"""
+        with self._lock:
+            self._conn.execute('DELETE FROM responses')
+            self._total_bytes = 0
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def build_cached_response(entry: CachedResponse, request: requests.PreparedRequest) -> requests.Response:
+    """Turn a stored entry back into a requests.Response"""
+    response = requests.Response()
+    response.status_code = entry.status
+    response.headers = CaseInsensitiveDict(entry.headers)
+    response.encoding = get_encoding_from_headers(response.headers)
+    response.url = entry.url
+    response.request = request
+    response.reason = 'OK'
+    response._content = entry.body
+    response._content_consumed = True
+    response.from_cache = True
+    return response
+
+
+class CachingAdapter(HTTPAdapter):
+    """Transport adapter that answers GET requests from a ResponseCache when it can"""
+
+    def __init__(self, cache: ResponseCache, **kwargs):
+        """
+        Args:
+            cache: Where responses are stored
+            kwargs: Passed to HTTPAdapter (pool_connections, pool_maxsize, max_retries, ...)
+        """
+        super().__init__(**kwargs)
+        self.cache = cache
+
+    def send(self, request: requests.PreparedRequest, **kwargs) -> requests.Response:
+        if request.method != 'GET':
+            return super().send(request, **kwargs)
+
+        entry = self.cache.get(request.url)
+
+        if entry is not None and entry.is_fresh():
+            self.cache.count('hits')
+            return build_cached_response(entry, request)
+
+        if entry is not None and entry.can_revalidate():
+            conditional = request.copy()
+            if entry.etag:
+                conditional.headers['If-None-Match'] = entry.etag
+            if entry.last_modified:
+                conditional.headers['If-Modified-Since'] = entry.last_modified
+
+            response = super().send(conditional, **kwargs)
+            if response.status_code == 304:
+                self.cache.count('revalidated')
+                self.cache.refresh(entry, response.headers)
+                response.close()
+                # The store was asked, so callers pace and count it as a request (just without the body)
+                revalidated = build_cached_response(entry, request)
+                revalidated.from_cache = False
+                revalidated.revalidated = True
+                return revalidated
+        else:
+            response = super().send(request, **kwargs)
+
+        self.cache.count('misses')
+        response.from_cache = False
+
+        # Streamed bodies may be abandoned part way, so only complete reads are stored
+        if response.status_code == 200 and not kwargs.get('stream'):
+            self.cache.put(request.url, response.status_code, response.headers, response.content)
+
+        return response
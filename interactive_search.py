@@ -1,23 +1,71 @@
 #!/usr/bin/env python3
 """
 Interactive Product Search Tool
+
+Searches go to a running search daemon when there is one (see
+search_daemon.py), and are run in this process otherwise:
+
+    python interactive_search.py --serve &
+    python interactive_search.py "product name"
+    python interactive_search.py --stop
 """
 
+import argparse
 import sys
-from product_validator import search_with_default_settings
+
+import search_daemon
+
+# Pages scraped in earlier sessions answer repeat and similar searches offline
+PAGE_INDEX_PATH = ".cache/page_index.sqlite"
+
+_local_search = None
+
+def search(product_name: str, use_daemon: bool = True) -> str:
+    """Search through the daemon if one is running, otherwise in this process"""
+    global _local_search
+    if use_daemon:
+        result = search_daemon.search(product_name)
+        if result is not None:
+            return result
+    
+    if _local_search is None:
+        # The scraping stack is only imported when there is no daemon to ask
+        from product_validator import search_with_default_settings
+        from validator_pool import configure_shared_pool
+        
+        configure_shared_pool(page_index=PAGE_INDEX_PATH)
+        _local_search = search_with_default_settings
+    return _local_search(product_name, detail="full")
 
 def main():
     """Main function - handles both interactive and command line modes"""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('product', nargs='*', help='Product name to search for (interactive mode if omitted)')
+    parser.add_argument('--serve', action='store_true', help='Run the warm search daemon')
+    parser.add_argument('--idle-timeout', type=float, help='Seconds without a search after which the daemon exits')
+    parser.add_argument('--stop', action='store_true', help='Stop the running search daemon')
+    parser.add_argument('--no-daemon', action='store_true', help='Search in this process even if a daemon is running')
+    args = parser.parse_args()
+    
+    if args.serve:
+        search_daemon.serve(idle_timeout=args.idle_timeout, page_index=PAGE_INDEX_PATH)
+        return
+    
+    if args.stop:
+        print("Search daemon stopped" if search_daemon.stop() else "No search daemon running", file=sys.stderr)
+        return
+    
+    use_daemon = not args.no_daemon
     
     # Check if command line arguments were provided
-    if len(sys.argv) > 1:
+    if args.product:
         # Option 2: Command line arguments
-        product_name = " ".join(sys.argv[1:])
+        product_name = " ".join(args.product)
         print(f"Searching for: {product_name}")
         print("-" * 50)
         
         try:
-            result = search_with_default_settings(product_name)
+            result = search(product_name, use_daemon)
             print(result)
         except Exception as e:
             print(f"Error: {e}")
@@ -43,7 +91,7 @@ def main():
             print("-" * 50)
             
             try:
-                result = search_with_default_settings(product_name)
+                result = search(product_name, use_daemon)
                 print(result)
             except Exception as e:
                 print(f"Error: {e}")
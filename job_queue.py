@@ -0,0 +1,430 @@
+#!/usr/bin/env python3
+"""
+Durable SQLite job queue and multi-process workers for large product batches
+
+Products are enqueued as jobs in a SQLite file. Any number of worker
+processes, on this host or on hosts that share the file over a filesystem with
+working locks, claim jobs one at a time under a lease, run the scrape +
+validate pipeline and store the result in the same file. Leases are extended
+while a job runs; a worker that dies lets its lease expire and the job is
+claimed again. Failed jobs are retried with exponential backoff up to
+max_attempts, then marked failed.
+
+Workers share per-host politeness limits through a SharedHostRateLimiter kept
+in the queue file, so the request rate each store (and the search engine)
+sees stays the same however many workers run. A slot is taken for every
+request that goes to the network, retries included; pages the response cache
+answers take none.
+
+Usage:
+    python job_queue.py enqueue queue.sqlite products.txt --batch april
+    python job_queue.py work queue.sqlite --processes 8 --host-rate 1 --search-rate 0.5
+    python job_queue.py status queue.sqlite --batch april
+    python job_queue.py results queue.sqlite --batch april -o results.jsonl
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import socket
+import sqlite3
+import sys
+import threading
+import time
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, Optional
+
+from rate_limit import HostRateLimiter, SharedHostRateLimiter
+from validation_store import normalize_product_name
+
+JOB_STATUSES = ('queued', 'leased', 'done', 'failed')
+
+
+class Job(NamedTuple):
+    """A claimed product job"""
+    id: int
+    batch: str
+    product_name: str
+    target_sites: Optional[List[str]]
+    code_patterns: Optional[List[str]]
+    min_matches: int
+    attempts: int
+
+
+class JobQueue:
+    """SQLite-backed queue of product jobs with leases and retries"""
+
+    def __init__(self, path: str, lease_seconds: float = 300, max_attempts: int = 3, retry_delay: float = 30):
+        """
+        Args:
+            path: SQLite file holding the queue (parent directories are created)
+            lease_seconds: How long a claimed job stays with its worker without a heartbeat
+            max_attempts: Attempts before a job is marked failed
+            retry_delay: Seconds before the first retry; doubles with every further attempt
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max(1, max_attempts)
+        self.retry_delay = retry_delay
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY,
+                batch TEXT NOT NULL,
+                product_key TEXT NOT NULL,
+                product_name TEXT NOT NULL,
+                target_sites TEXT,
+                code_patterns TEXT,
+                min_matches INTEGER NOT NULL,
+                status TEXT NOT NULL DEFAULT 'queued',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                available_at REAL NOT NULL,
+                lease_owner TEXT,
+                lease_expires REAL,
+                result TEXT,
+                error TEXT,
+                updated_at REAL NOT NULL,
+                UNIQUE (batch, product_key)
+            );
+            CREATE INDEX IF NOT EXISTS jobs_claim ON jobs (status, available_at);
+        """)
+
+    def _transaction(self, work):
+        """Run work(conn) in an immediate transaction, so concurrent claims never see the same job"""
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                outcome = work(self._conn)
+                self._conn.execute('COMMIT')
+                return outcome
+            except BaseException:
+                self._conn.execute('ROLLBACK')
+                raise
+
+    def enqueue(self, products: Iterable[str], target_sites: Optional[List[str]] = None,
+                code_patterns: Optional[List[str]] = None, min_matches: int = 3, batch: str = 'default') -> int:
+        """
+        Add product jobs, skipping products already in the batch (by normalized name)
+
+        Args:
+            products: Product names
+            target_sites: Sites to search (the worker's defaults if None)
+            code_patterns: Code patterns (the worker's defaults if None)
+            min_matches: Minimum number of web matches required
+            batch: Name grouping the jobs for status and results
+
+        Returns:
+            Number of jobs added
+        """
+        now = time.time()
+        sites = json.dumps(target_sites) if target_sites is not None else None
+        patterns = json.dumps(code_patterns) if code_patterns is not None else None
+        rows = [
+            (batch, normalize_product_name(name), name, sites, patterns, min_matches, now, now)
+            for name in products
+        ]
+
+        def insert(conn):
+            before = conn.total_changes
+            conn.executemany(
+                'INSERT OR IGNORE INTO jobs (batch, product_key, product_name, target_sites, code_patterns, '
+                'min_matches, available_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)', rows
+            )
+            return conn.total_changes - before
+
+        return self._transaction(insert)
+
+    def claim(self, worker: str) -> Optional[Job]:
+        """Lease the next available job to a worker (expired leases are available again), or return None"""
+        def take(conn):
+            now = time.time()
+            # A job whose worker died on every attempt (one that crashes the process, say) stops here
+            conn.execute(
+                "UPDATE jobs SET status = 'failed', error = 'lease expired', lease_owner = NULL, lease_expires = NULL, "
+                "updated_at = ? WHERE status = 'leased' AND lease_expires < ? AND attempts >= ?",
+                (now, now, self.max_attempts)
+            )
+            row = conn.execute(
+                "SELECT id, batch, product_name, target_sites, code_patterns, min_matches, attempts FROM jobs "
+                "WHERE (status = 'queued' AND available_at <= ?) OR (status = 'leased' AND lease_expires < ?) "
+                "ORDER BY available_at, id LIMIT 1",
+                (now, now)
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = 'leased', lease_owner = ?, lease_expires = ?, attempts = attempts + 1, "
+                "updated_at = ? WHERE id = ?",
+                (worker, now + self.lease_seconds, now, row[0])
+            )
+            return row
+
+        row = self._transaction(take)
+        if row is None:
+            return None
+        job_id, batch, product_name, sites, patterns, min_matches, attempts = row
+        return Job(job_id, batch, product_name, json.loads(sites) if sites else None,
+                   json.loads(patterns) if patterns else None, min_matches, attempts + 1)
+
+    def heartbeat(self, job_id: int, worker: str) -> bool:
+        """Extend a job's lease; False if the worker no longer holds it"""
+        def extend(conn):
+            now = time.time()
+            return conn.execute(
+                "UPDATE jobs SET lease_expires = ?, updated_at = ? WHERE id = ? AND status = 'leased' AND lease_owner = ?",
+                (now + self.lease_seconds, now, job_id, worker)
+            ).rowcount == 1
+
+        return self._transaction(extend)
+
+    def complete(self, job_id: int, worker: str, result: Dict[str, Any]) -> bool:
+        """Store a job's result; False if the lease was lost (another worker has the job now)"""
+        def finish(conn):
+            return conn.execute(
+                "UPDATE jobs SET status = 'done', result = ?, error = NULL, lease_owner = NULL, lease_expires = NULL, "
+                "updated_at = ? WHERE id = ? AND status = 'leased' AND lease_owner = ?",
+                (json.dumps(result), time.time(), job_id, worker)
+            ).rowcount == 1
+
+        return self._transaction(finish)
+
+    def fail(self, job_id: int, worker: str, error: str) -> Optional[str]:
+        """
+        Record a failed attempt: the job is queued for a retry after a backoff, or
+        marked failed once it has had max_attempts. Returns the new status, or
+        None if the lease was lost.
+        """
+        def record(conn):
+            row = conn.execute(
+                "SELECT attempts FROM jobs WHERE id = ? AND status = 'leased' AND lease_owner = ?", (job_id, worker)
+            ).fetchone()
+            if row is None:
+                return None
+            now = time.time()
+            status = 'failed' if row[0] >= self.max_attempts else 'queued'
+            conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, available_at = ?, lease_owner = NULL, lease_expires = NULL, "
+                "updated_at = ? WHERE id = ?",
+                (status, error, now + self.retry_delay * 2 ** (row[0] - 1), now, job_id)
+            )
+            return status
+
+        return self._transaction(record)
+
+    def retry_failed(self, batch: Optional[str] = None) -> int:
+        """Queue failed jobs again with a fresh set of attempts, returning how many"""
+        def requeue(conn):
+            query = "UPDATE jobs SET status = 'queued', attempts = 0, available_at = ?, updated_at = ? WHERE status = 'failed'"
+            params = [time.time(), time.time()]
+            if batch is not None:
+                query += ' AND batch = ?'
+                params.append(batch)
+            return conn.execute(query, params).rowcount
+
+        return self._transaction(requeue)
+
+    def counts(self, batch: Optional[str] = None) -> Dict[str, int]:
+        """Return the number of jobs in each status"""
+        query = 'SELECT status, COUNT(*) FROM jobs'
+        params = ()
+        if batch is not None:
+            query += ' WHERE batch = ?'
+            params = (batch,)
+        with self._lock:
+            rows = dict(self._conn.execute(query + ' GROUP BY status', params).fetchall())
+        return {status: rows.get(status, 0) for status in JOB_STATUSES}
+
+    def results(self, batch: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+        """Yield finished jobs' results, and {'product_name', 'error'} for failed ones, in enqueue order"""
+        query = "SELECT product_name, status, result, error FROM jobs WHERE status IN ('done', 'failed')"
+        params = ()
+        if batch is not None:
+            query += ' AND batch = ?'
+            params = (batch,)
+        with self._lock:
+            rows = self._conn.execute(query + ' ORDER BY id', params).fetchall()
+        for product_name, status, result, error in rows:
+            yield json.loads(result) if status == 'done' else {'product_name': product_name, 'error': error}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def work(queue: JobQueue, validator, worker: str, until_empty: bool = True, poll_interval: float = 5,
+         max_jobs: Optional[int] = None) -> Dict[str, int]:
+    """
+    Claim and run jobs until the queue is empty (or forever, polling, if until_empty is False)
+
+    The lease is extended from a background thread while a job runs, and a
+    result is only stored while this worker still holds the lease. A result
+    whose web validation could not be done is retried like a failure; the
+    last attempt's result is stored as it is.
+
+    Returns counts of jobs done, retried, failed and lost.
+    """
+    summary = {'done': 0, 'retried': 0, 'failed': 0, 'lost': 0}
+    jobs_run = 0
+
+    while max_jobs is None or jobs_run < max_jobs:
+        job = queue.claim(worker)
+        if job is None:
+            if until_empty:
+                break
+            time.sleep(poll_interval)
+            continue
+        jobs_run += 1
+
+        finished = threading.Event()
+
+        def keep_leased(job_id=job.id):
+            while not finished.wait(queue.lease_seconds / 3):
+                if not queue.heartbeat(job_id, worker):
+                    return
+
+        heartbeat = threading.Thread(target=keep_leased, name='lease-heartbeat', daemon=True)
+        heartbeat.start()
+
+        print(f"[{worker}] Processing: {job.product_name} (attempt {job.attempts})")
+        try:
+            result = validator.process_product(
+                job.product_name,
+                job.target_sites if job.target_sites is not None else validator.default_sites,
+                job.code_patterns if job.code_patterns is not None else validator.default_code_patterns,
+                job.min_matches
+            )
+        except Exception as e:
+            status = queue.fail(job.id, worker, str(e))
+            summary['lost' if status is None else 'retried' if status == 'queued' else 'failed'] += 1
+        else:
+            validation = result.get('web_validation', {})
+            if validation.get('status') == 'error' and job.attempts < queue.max_attempts:
+                # The web search failed (not "no matches"): try again later rather than store an unknown
+                status = queue.fail(job.id, worker, validation.get('error') or validation.get('message', 'web validation failed'))
+                summary['lost' if status is None else 'retried'] += 1
+            else:
+                summary['done' if queue.complete(job.id, worker, result) else 'lost'] += 1
+        finally:
+            finished.set()
+            heartbeat.join()
+
+    return summary
+
+
+def _worker_process(options: Dict[str, Any]):
+    """Entry point of one worker process"""
+    # Imported here so that enqueue/status/results do not need the scraping stack
+    from product_validator import ProductValidator
+
+    worker = f"{socket.gethostname()}:{os.getpid()}"
+    limiter = SharedHostRateLimiter(options['queue'], rate=options['host_rate'], burst=options['host_burst'])
+    queue = JobQueue(options['queue'], lease_seconds=options['lease_seconds'], max_attempts=options['max_attempts'])
+    validator = ProductValidator(
+        async_fetch=options['async_fetch'],
+        response_cache=options['response_cache'],
+        validation_store=options['validation_store'],
+        page_archive=options['page_archive'],
+        batch_validation=options['batch_validation'],
+        rate_limiter=limiter
+    )
+    limiter.set_rate(HostRateLimiter.host_for(validator.web_search_url), options['search_rate'])
+
+    try:
+        summary = work(queue, validator, worker, until_empty=not options['forever'])
+        print(f"[{worker}] {summary['done']} done, {summary['retried']} retried, {summary['failed']} failed, "
+              f"{summary['lost']} lost", file=sys.stderr)
+    finally:
+        validator.close()
+        queue.close()
+        limiter.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    enqueue_parser = commands.add_parser('enqueue', help='Add products to the queue')
+    enqueue_parser.add_argument('queue', help='Queue SQLite file')
+    enqueue_parser.add_argument('input', help="File of product names or JSON lines ('-' for stdin)")
+    enqueue_parser.add_argument('--batch', default='default', help='Batch name')
+    enqueue_parser.add_argument('--field', help='JSON field holding the product name')
+    enqueue_parser.add_argument('--sites', help="Comma-separated list of URLs to search (the workers' defaults if omitted)")
+    enqueue_parser.add_argument('--patterns', help="Comma-separated list of code patterns (the workers' defaults if omitted)")
+    enqueue_parser.add_argument('--min-matches', type=int, default=3, help='Minimum number of web matches required')
+
+    work_parser = commands.add_parser('work', help='Run worker processes')
+    work_parser.add_argument('queue', help='Queue SQLite file')
+    work_parser.add_argument('--processes', type=int, default=4, help='Worker processes to start on this host')
+    work_parser.add_argument('--forever', action='store_true', help='Keep polling for jobs instead of exiting when the queue is empty')
+    work_parser.add_argument('--host-rate', type=float, default=1.0, help='Requests per second per store, across all workers')
+    work_parser.add_argument('--host-burst', type=int, default=1, help='Back-to-back requests allowed per store')
+    work_parser.add_argument('--search-rate', type=float, default=0.5, help='Web searches per second, across all workers')
+    work_parser.add_argument('--lease-seconds', type=float, default=300, help='Lease on a claimed job, renewed while it runs')
+    work_parser.add_argument('--max-attempts', type=int, default=3, help='Attempts before a job is marked failed')
+    work_parser.add_argument('--async-fetch', action='store_true', help='Search all sites concurrently')
+    work_parser.add_argument('--batch-validation', action='store_true', help='Validate several codes per web search')
+    work_parser.add_argument('--response-cache', help='SQLite file for the HTTP response cache')
+    work_parser.add_argument('--validation-store', help='SQLite file for remembered validation outcomes')
+    work_parser.add_argument('--page-archive', help='Directory to archive every fetched store page in')
+
+    status_parser = commands.add_parser('status', help='Show job counts')
+    status_parser.add_argument('queue', help='Queue SQLite file')
+    status_parser.add_argument('--batch', help='Only this batch')
+    status_parser.add_argument('--retry-failed', action='store_true', help='Queue failed jobs again')
+
+    results_parser = commands.add_parser('results', help='Write finished results as JSON lines')
+    results_parser.add_argument('queue', help='Queue SQLite file')
+    results_parser.add_argument('--batch', help='Only this batch')
+    results_parser.add_argument('-o', '--output', default='-', help="JSONL file to write ('-' for stdout)")
+
+    args = parser.parse_args()
+
+    if args.command == 'work':
+        options = dict(vars(args))
+        processes = [multiprocessing.Process(target=_worker_process, args=(options,), name=f'worker-{i}')
+                     for i in range(max(1, args.processes))]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        return
+
+    queue = JobQueue(args.queue)
+    try:
+        if args.command == 'enqueue':
+            from batch_runner import iter_products
+
+            input_stream = sys.stdin if args.input == '-' else open(args.input, 'r', encoding='utf-8')
+            try:
+                sites = [site.strip() for site in args.sites.split(',')] if args.sites else None
+                patterns = [pattern.strip() for pattern in args.patterns.split(',')] if args.patterns else None
+                added = queue.enqueue(iter_products(input_stream, args.field), sites, patterns, args.min_matches,
+                                      args.batch)
+            finally:
+                if input_stream is not sys.stdin:
+                    input_stream.close()
+            print(f"Enqueued {added} jobs in batch '{args.batch}'", file=sys.stderr)
+
+        elif args.command == 'status':
+            if args.retry_failed:
+                print(f"Requeued {queue.retry_failed(args.batch)} failed jobs", file=sys.stderr)
+            print(json.dumps(queue.counts(args.batch), indent=2))
+
+        elif args.command == 'results':
+            output = sys.stdout if args.output == '-' else open(args.output, 'w', encoding='utf-8')
+            try:
+                for result in queue.results(args.batch):
+                    output.write(json.dumps(result) + '\n')
+            finally:
+                if output is not sys.stdout:
+                    output.close()
+    finally:
+        queue.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,468 @@
+#!/usr/bin/env python3
+"""
+Local HTTP/JSON lookup service with single-flight coalescing and admission control
+
+Internal tools and agents that search for the same product at the same time
+each used to scrape on their own. This service runs the ProductValidator
+logic behind a small asyncio HTTP server and shares work between callers:
+
+    POST /search    {"product_name": ..., "target_sites": [...]?, "code_patterns": [...]?}
+    POST /validate  {"product_name": ..., "codes": [...], "min_matches": 3}
+    POST /batch     {"products": [...], "target_sites": [...]?, "code_patterns": [...]?, "min_matches": 3}
+    GET  /health    lookups running, queued and coalesced
+    GET  /metrics   the pool's metrics in Prometheus text format
+
+Concurrent requests for the same normalized product name (with the same
+sites and patterns) share one in-flight lookup, and so do validations of the
+same (product, code) pair: a /validate call waits for the codes another call
+is already checking and checks only the rest, in one web_search_validation
+call so batched validation still applies.
+
+At most `workers` lookups run at once, each on a validator checked out of a
+ValidatorPool whose validators share one per-host rate limiter. At most
+`max_queued` more wait for a worker; beyond that new lookups are refused with
+503 and Retry-After, so a burst of callers queues briefly or backs off
+instead of piling requests onto the stores. A batch with more new lookups
+than workers and queue hold together could never be admitted, so it gets 400.
+
+A lookup whose callers all went away still finishes, so the pages and
+validations it fetched are in the pool's response cache (and validation
+store, if any) for whoever asks next.
+The result itself is not kept once the lookup is done: a later caller starts
+a new lookup, which those caches make cheap.
+
+Usage:
+    python lookup_service.py --port 8765 --workers 4 --max-queued 32 --response-cache .cache/responses.sqlite
+    curl -s localhost:8765/search -d '{"product_name": "Space Marine Captain"}'
+"""
+
+import argparse
+import asyncio
+import functools
+import json
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+
+from product_validator import summarize_validation
+from rate_limit import HostRateLimiter
+from validation_store import normalize_code, normalize_product_name
+from validator_pool import ValidatorPool
+
+# Largest request body accepted
+MAX_BODY_BYTES = 1024 * 1024
+# Seconds a client may take to send a request's headers and body
+REQUEST_TIMEOUT = 30
+
+_REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+            413: 'Payload Too Large', 500: 'Internal Server Error', 503: 'Service Unavailable'}
+
+
+class Overloaded(Exception):
+    """Raised when a lookup would take the queue past its bound"""
+
+
+class BadRequest(ValueError):
+    """Raised for a request the service cannot act on"""
+
+
+def _string_list(value: Any, field: str) -> Optional[List[str]]:
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = value.split(',')
+    if not isinstance(value, list) or not all(isinstance(item, str) for item in value):
+        raise BadRequest(f"'{field}' must be a list of strings")
+    return [item.strip() for item in value if item.strip()]
+
+
+def _key_part(values: Optional[List[str]]) -> Optional[Tuple[str, ...]]:
+    # None (the validator's defaults) and [] (nothing) are different lookups
+    return tuple(values) if values is not None else None
+
+
+class LookupService:
+    """Runs validator lookups on a pool, coalescing identical in-flight lookups and bounding the queue"""
+
+    def __init__(self, pool: ValidatorPool, workers: Optional[int] = None, max_queued: int = 32):
+        """
+        Args:
+            pool: Validators to run lookups on
+            workers: Lookups run at once (the pool size if None)
+            max_queued: Lookups waiting for a worker before new ones are refused
+        """
+        self.pool = pool
+        self.workers = max(1, workers or pool.size)
+        self.max_queued = max(0, max_queued)
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='lookup')
+        self._inflight: Dict[Tuple, asyncio.Task] = {}
+        self._admitted = 0
+        self._running = 0
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self.counters = {'lookups': 0, 'coalesced': 0, 'rejected': 0, 'failed': 0}
+
+    def _call(self, method: str, *args) -> Any:
+        """Run one validator method on a pooled validator (on a worker thread)"""
+        with self.pool.validator() as validator:
+            return getattr(validator, method)(*args)
+
+    async def _run(self, func: Callable[[], Any]) -> Any:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.workers)
+        try:
+            async with self._semaphore:
+                self._running += 1
+                try:
+                    return await asyncio.get_running_loop().run_in_executor(self._executor, func)
+                finally:
+                    self._running -= 1
+        except Exception:
+            self.counters['failed'] += 1
+            raise
+        finally:
+            self._admitted -= 1
+
+    def _admit(self, count: int):
+        """Reserve room for count new lookups, or raise Overloaded"""
+        if self._admitted + count > self.workers + self.max_queued:
+            self.counters['rejected'] += 1
+            raise Overloaded(f"{self._admitted} lookups in progress; try again shortly")
+        self._admitted += count
+        self.counters['lookups'] += count
+
+    def _start(self, keys: List[Tuple], func: Callable[[], Any]) -> asyncio.Task:
+        """Start an admitted lookup and register it under every key it answers"""
+        task = asyncio.ensure_future(self._run(func))
+        for key in keys:
+            self._inflight[key] = task
+
+        def forget(_):
+            for key in keys:
+                if self._inflight.get(key) is task:
+                    del self._inflight[key]
+            # Nobody may be waiting any more; retrieving the exception keeps asyncio quiet
+            if not task.cancelled():
+                task.exception()
+
+        task.add_done_callback(forget)
+        return task
+
+    def _joined(self, key: Tuple) -> Optional[asyncio.Task]:
+        task = self._inflight.get(key)
+        if task is not None:
+            self.counters['coalesced'] += 1
+        return task
+
+    async def search(self, product_name: str, target_sites: Optional[List[str]] = None,
+                     code_patterns: Optional[List[str]] = None) -> Dict[str, Any]:
+        """search_with_defaults, shared with concurrent searches for the same product"""
+        key = ('search', normalize_product_name(product_name), _key_part(target_sites), _key_part(code_patterns))
+        task = self._joined(key)
+        if task is None:
+            self._admit(1)
+            task = self._start([key], functools.partial(self._call, 'search_with_defaults', product_name,
+                                                        target_sites, code_patterns))
+        # Shielded: one caller going away does not cancel the lookup for the others
+        return await asyncio.shield(task)
+
+    async def validate(self, product_name: str, codes: List[str], min_matches: int = 3) -> Dict[str, Any]:
+        """web_search_validation, sharing each (product, code) check with concurrent validations"""
+        product_key = normalize_product_name(product_name)
+        codes = list(dict.fromkeys(codes))
+        keys = {code: ('validate', product_key, normalize_code(code), min_matches) for code in codes}
+
+        tasks = {}
+        new_codes = []
+        for code in codes:
+            task = self._joined(keys[code])
+            if task is None:
+                new_codes.append(code)
+            else:
+                tasks[code] = task
+
+        if new_codes:
+            self._admit(1)
+            task = self._start([keys[code] for code in new_codes],
+                               functools.partial(self._call, 'web_search_validation', product_name, new_codes, min_matches))
+            tasks.update((code, task) for code in new_codes)
+
+        outcomes = {}
+        for task in set(tasks.values()):
+            outcomes[task] = await asyncio.shield(task)
+
+        result = {'product_name': product_name, 'codes_validated': {}}
+        for code in codes:
+            entries = outcomes[tasks[code]]['codes_validated']
+            # A joined lookup may have been asked with a differently written code
+            entry = entries.get(code) or next(
+                (value for other, value in entries.items() if normalize_code(other) == normalize_code(code)), None
+            )
+            if entry is None:
+                # Undecided rather than failed: the other codes' outcomes still stand
+                entry = {'matches_found': 0, 'is_validated': None, 'sample_sources': [], 'from_store': False,
+                         'error': "The shared validation returned no outcome for this code"}
+            result['codes_validated'][code] = entry
+        return summarize_validation(result)
+
+    async def batch(self, products: List[str], target_sites: Optional[List[str]] = None,
+                    code_patterns: Optional[List[str]] = None, min_matches: int = 3) -> List[Dict[str, Any]]:
+        """
+        process_product for every product, sharing lookups with concurrent batches
+
+        The batch is admitted as a whole, or refused if the queue has no room for
+        all of its new lookups.
+
+        Raises:
+            BadRequest: If the batch has more new lookups than workers and queue
+                together hold, so it could never be admitted
+            Overloaded: If there is no room for it right now
+        """
+        keys = [('process', normalize_product_name(name), _key_part(target_sites), _key_part(code_patterns), min_matches)
+                for name in products]
+
+        tasks = {}
+        pending = {}
+        for product_name, key in zip(products, keys):
+            if key in tasks or key in pending:
+                continue
+            task = self._joined(key)
+            if task is None:
+                pending[key] = product_name
+            else:
+                tasks[key] = task
+        capacity = self.workers + self.max_queued
+        if len(pending) > capacity:
+            # Retrying would never help, so this is not a 503
+            raise BadRequest(f"A batch may start at most {capacity} new lookups ({len(pending)} given); split it up")
+        self._admit(len(pending))
+
+        def process(product_name: str) -> Dict[str, Any]:
+            with self.pool.validator() as validator:
+                return validator.process_product(
+                    product_name,
+                    target_sites if target_sites is not None else validator.default_sites,
+                    code_patterns if code_patterns is not None else validator.default_code_patterns,
+                    min_matches
+                )
+
+        for key, product_name in pending.items():
+            tasks[key] = self._start([key], functools.partial(process, product_name))
+
+        outcomes = await asyncio.gather(*(asyncio.shield(tasks[key]) for key in keys), return_exceptions=True)
+        return [
+            {'product_name': name, 'error': str(outcome)} if isinstance(outcome, Exception) else outcome
+            for name, outcome in zip(products, outcomes)
+        ]
+
+    def stats(self) -> Dict[str, Any]:
+        """Lookups running, queued and in flight, and totals since start"""
+        return {
+            'workers': self.workers,
+            'max_queued': self.max_queued,
+            'running': self._running,
+            'queued': self._admitted - self._running,
+            'in_flight_keys': len(self._inflight),
+            **self.counters
+        }
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+
+
+class LookupServer:
+    """Minimal HTTP/1.1 JSON front end for a LookupService (keep-alive, Content-Length bodies only)"""
+
+    def __init__(self, service: LookupService, host: str = '127.0.0.1', port: int = 8765):
+        self.service = service
+        self.host = host
+        self.port = port
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self) -> 'LookupServer':
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        # Port 0 asks for any free port
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def serve_forever(self):
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                try:
+                    request = await asyncio.wait_for(self._read_request(reader), REQUEST_TIMEOUT)
+                except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+                    return
+                except BadRequest as e:
+                    # Without a usable Content-Length the rest of the stream cannot be framed
+                    await self._respond(writer, 400, {'error': str(e)}, False)
+                    return
+                if request is None:
+                    return
+                method, path, headers, body = request
+                if body is False:
+                    status, payload = 413, {'error': f"Request body over {MAX_BODY_BYTES} bytes"}
+                    keep_alive = False
+                else:
+                    status, payload = await self._dispatch(method, path, body)
+                    keep_alive = headers.get('connection', '').lower() != 'close'
+                await self._respond(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    return
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _read_request(reader: asyncio.StreamReader):
+        """
+        Return (method, path, headers, body), None at end of stream; body is False if too large
+
+        Raises:
+            BadRequest: If the Content-Length header is not a byte count
+        """
+        request_line = await reader.readline()
+        if not request_line.strip():
+            return None
+        parts = request_line.decode('latin-1').split()
+        if len(parts) < 2:
+            return None
+        method, path = parts[0].upper(), urlparse(parts[1]).path
+
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        try:
+            length = int(headers.get('content-length') or 0)
+        except ValueError:
+            length = -1
+        if length < 0:
+            raise BadRequest(f"Invalid Content-Length: {headers['content-length']!r}")
+        if length > MAX_BODY_BYTES:
+            return method, path, headers, False
+        body = await reader.readexactly(length) if length else b''
+        return method, path, headers, body
+
+    async def _respond(self, writer: asyncio.StreamWriter, status: int, payload: Any, keep_alive: bool):
+        if isinstance(payload, str):
+            body, content_type = payload.encode('utf-8'), 'text/plain; version=0.0.4'
+        else:
+            body, content_type = json.dumps(payload).encode('utf-8'), 'application/json'
+        head = [f"HTTP/1.1 {status} {_REASONS.get(status, '')}", f"Content-Type: {content_type}",
+                f"Content-Length: {len(body)}", f"Connection: {'keep-alive' if keep_alive else 'close'}"]
+        if status == 503:
+            head.append('Retry-After: 1')
+        writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1') + body)
+        await writer.drain()
+
+    async def _dispatch(self, method: str, path: str, body: bytes) -> Tuple[int, Any]:
+        routes = {'/search': 'POST', '/validate': 'POST', '/batch': 'POST', '/health': 'GET', '/metrics': 'GET'}
+        if path not in routes:
+            return 404, {'error': f"No endpoint {path}"}
+        if method != routes[path]:
+            return 405, {'error': f"{path} takes {routes[path]}"}
+
+        try:
+            if path == '/health':
+                return 200, self.service.stats()
+            if path == '/metrics':
+                return 200, self.service.pool.metrics.to_prometheus()
+
+            try:
+                request = json.loads(body or b'{}')
+            except ValueError as e:
+                raise BadRequest(f"Invalid JSON: {e}")
+            if not isinstance(request, dict):
+                raise BadRequest("The request body must be a JSON object")
+
+            sites = _string_list(request.get('target_sites'), 'target_sites')
+            patterns = _string_list(request.get('code_patterns'), 'code_patterns')
+            min_matches = request.get('min_matches', 3)
+            if not isinstance(min_matches, int):
+                raise BadRequest("'min_matches' must be an integer")
+
+            if path == '/batch':
+                products = _string_list(request.get('products'), 'products')
+                if not products:
+                    raise BadRequest("'products' is required")
+                return 200, await self.service.batch(products, sites, patterns, min_matches)
+
+            product_name = request.get('product_name')
+            if not isinstance(product_name, str) or not product_name.strip():
+                raise BadRequest("'product_name' is required")
+
+            if path == '/search':
+                return 200, await self.service.search(product_name, sites, patterns)
+
+            codes = _string_list(request.get('codes'), 'codes')
+            if not codes:
+                raise BadRequest("'codes' is required")
+            return 200, await self.service.validate(product_name, codes, min_matches)
+
+        except BadRequest as e:
+            return 400, {'error': str(e)}
+        except Overloaded as e:
+            return 503, {'error': str(e)}
+        except Exception as e:
+            return 500, {'error': str(e)}
+
+
+async def _serve(args):
+    pool = ValidatorPool(
+        size=args.workers,
+        response_cache=args.response_cache,
+        validation_store=args.validation_store,
+        page_index=args.page_index,
+        async_fetch=args.async_fetch,
+        batch_validation=args.batch_validation,
+        # One limiter for the whole pool, so the stores see the same rate however many lookups run
+        rate_limiter=HostRateLimiter(rate=args.host_rate, burst=args.host_burst)
+    )
+    service = LookupService(pool, args.workers, args.max_queued)
+    server = await LookupServer(service, args.host, args.port).start()
+    print(f"Lookup service listening on http://{args.host}:{server.port}", file=sys.stderr)
+    try:
+        await server.serve_forever()
+    finally:
+        await server.close()
+        service.close()
+        pool.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1', help='Address to listen on')
+    parser.add_argument('--port', type=int, default=8765, help='Port to listen on (0 for any free port)')
+    parser.add_argument('--workers', type=int, default=4, help='Lookups run at once (and validators in the pool)')
+    parser.add_argument('--max-queued', type=int, default=32, help='Lookups waiting for a worker before new ones get 503')
+    parser.add_argument('--host-rate', type=float, default=1.0, help='Requests per second per store, across all lookups')
+    parser.add_argument('--host-burst', type=int, default=2, help='Back-to-back requests allowed per store')
+    parser.add_argument('--async-fetch', action='store_true', help='Search all sites concurrently within a lookup')
+    parser.add_argument('--batch-validation', action='store_true', help='Validate several codes per web search')
+    parser.add_argument('--response-cache', help='SQLite file for the HTTP response cache (in memory if omitted)')
+    parser.add_argument('--validation-store', help='SQLite file for remembered validation outcomes (in memory if omitted)')
+    parser.add_argument('--page-index', help='SQLite file for the page index (in memory if omitted)')
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(_serve(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
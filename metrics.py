@@ -0,0 +1,237 @@
+"""
+Per-stage timing and per-host metrics for the validation pipeline
+
+Metrics keeps, for every (stage, host) pair, a latency histogram, and for
+every (counter, host) pair a running total. Stages are 'fetch', 'parse',
+'extract' and 'validate'; a 'validate' observation is one whole web search
+(its request and the parse of its results, which are also observed as 'fetch'
+and 'parse'). Counters include bytes downloaded, requests, errors and seconds
+spent sleeping for politeness.
+
+A snapshot can be exported as JSON or as a Prometheus textfile (for the node
+exporter's textfile collector). Metrics.scope() also collects what the current
+call records into a Metrics of its own, following the call across asyncio
+tasks and (via contextvars) worker threads, so other calls sharing the
+validator do not leak into it; that is what ProductValidator reports in the
+optional 'metrics' section of its results.
+"""
+
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+STAGES = ('fetch', 'parse', 'extract', 'validate')
+
+# Histogram bucket upper bounds in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float('inf'))
+
+PROMETHEUS_PREFIX = 'product_validator'
+
+# (metrics, scope) pairs open in the current context, innermost last
+_scopes: ContextVar[tuple] = ContextVar('metrics_scopes', default=())
+
+
+class Metrics:
+    """Thread-safe counters and latency histograms keyed by host"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[Tuple[str, str], float] = {}
+        self._histograms: Dict[Tuple[str, str], list] = {}
+
+    def inc(self, name: str, host: str = '', amount: float = 1):
+        """Add to a counter"""
+        with self._lock:
+            key = (name, host)
+            self._counters[key] = self._counters.get(key, 0) + amount
+        for owner, scope in _scopes.get():
+            if owner is self:
+                scope.inc(name, host, amount)
+
+    def observe(self, stage: str, host: str, seconds: float):
+        """Record how long one unit of work in a stage took"""
+        with self._lock:
+            histogram = self._histograms.get((stage, host))
+            if histogram is None:
+                # [bucket counts..., count, sum]
+                histogram = [0] * len(BUCKETS) + [0, 0.0]
+                self._histograms[(stage, host)] = histogram
+            for index, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    histogram[index] += 1
+                    break
+            histogram[-2] += 1
+            histogram[-1] += seconds
+        for owner, scope in _scopes.get():
+            if owner is self:
+                scope.observe(stage, host, seconds)
+
+    @contextmanager
+    def scope(self) -> Iterator['Metrics']:
+        """
+        Collect what the enclosed block records into a separate Metrics as well
+
+        Only records made in the block's context count: its own thread, asyncio
+        tasks it starts, and work handed to threads with the context copied.
+        """
+        scope = Metrics()
+        token = _scopes.set(_scopes.get() + ((self, scope),))
+        try:
+            yield scope
+        finally:
+            _scopes.reset(token)
+
+    @contextmanager
+    def timed(self, stage: str, host: str = '') -> Iterator[None]:
+        """Time the enclosed block as one observation of a stage"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, host, time.perf_counter() - start)
+
+    def sleep(self, seconds: float, host: str = ''):
+        """Sleep for politeness and account for it"""
+        if seconds > 0:
+            time.sleep(seconds)
+            self.inc('politeness_sleep_seconds', host, seconds)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        Return all metrics as plain data
+
+        {'counters': {name: {host: value}},
+         'stages': {stage: {host: {'count', 'sum_seconds', 'buckets'}}}}
+        """
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {key: list(value) for key, value in self._histograms.items()}
+
+        result = {'counters': {}, 'stages': {}}
+        for (name, host), value in counters.items():
+            result['counters'].setdefault(name, {})[host] = value
+        for (stage, host), histogram in histograms.items():
+            result['stages'].setdefault(stage, {})[host] = {
+                'count': histogram[-2],
+                'sum_seconds': histogram[-1],
+                'buckets': histogram[:len(BUCKETS)]
+            }
+        return result
+
+    @staticmethod
+    def delta(before: Dict[str, Any], after: Dict[str, Any]) -> Dict[str, Any]:
+        """Return what happened between two snapshots, dropping entries that did not change"""
+        result = {'counters': {}, 'stages': {}}
+
+        for name, hosts in after['counters'].items():
+            for host, value in hosts.items():
+                change = value - before['counters'].get(name, {}).get(host, 0)
+                if change:
+                    result['counters'].setdefault(name, {})[host] = change
+
+        for stage, hosts in after['stages'].items():
+            for host, histogram in hosts.items():
+                previous = before['stages'].get(stage, {}).get(host)
+                count = histogram['count'] - (previous['count'] if previous else 0)
+                if not count:
+                    continue
+                result['stages'].setdefault(stage, {})[host] = {
+                    'count': count,
+                    'sum_seconds': histogram['sum_seconds'] - (previous['sum_seconds'] if previous else 0.0),
+                    'buckets': [b - (previous['buckets'][i] if previous else 0) for i, b in enumerate(histogram['buckets'])]
+                }
+        return result
+
+    @staticmethod
+    def summarize(snapshot: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Condense a snapshot for a result dict
+
+        Per stage and host: request count, total and mean seconds. Also the
+        totals for work time (all stages but 'validate', which overlaps fetch
+        and parse) versus politeness sleep time.
+        """
+        stages = {}
+        work_seconds = 0.0
+        for stage, hosts in snapshot['stages'].items():
+            stages[stage] = {}
+            for host, histogram in hosts.items():
+                if stage != 'validate':
+                    work_seconds += histogram['sum_seconds']
+                stages[stage][host or '-'] = {
+                    'count': histogram['count'],
+                    'total_seconds': round(histogram['sum_seconds'], 4),
+                    'mean_seconds': round(histogram['sum_seconds'] / histogram['count'], 4)
+                }
+
+        counters = {
+            name: {host or '-': round(value, 4) if isinstance(value, float) else value for host, value in hosts.items()}
+            for name, hosts in snapshot['counters'].items()
+        }
+        sleep_seconds = sum(snapshot['counters'].get('politeness_sleep_seconds', {}).values())
+
+        return {
+            'stages': stages,
+            'counters': counters,
+            'work_seconds': round(work_seconds, 4),
+            'sleep_seconds': round(sleep_seconds, 4)
+        }
+
+    def to_prometheus(self, snapshot: Optional[Dict[str, Any]] = None) -> str:
+        """Render metrics in the Prometheus text exposition format"""
+        snapshot = snapshot if snapshot is not None else self.snapshot()
+        lines = []
+
+        histogram_name = f"{PROMETHEUS_PREFIX}_stage_seconds"
+        lines.append(f"# HELP {histogram_name} Time spent per pipeline stage")
+        lines.append(f"# TYPE {histogram_name} histogram")
+        for stage, hosts in sorted(snapshot['stages'].items()):
+            for host, histogram in sorted(hosts.items()):
+                labels = f'stage="{_escape(stage)}",host="{_escape(host)}"'
+                cumulative = 0
+                for bound, count in zip(BUCKETS, histogram['buckets']):
+                    cumulative += count
+                    le = '+Inf' if bound == float('inf') else repr(bound)
+                    lines.append(f'{histogram_name}_bucket{{{labels},le="{le}"}} {cumulative}')
+                lines.append(f"{histogram_name}_sum{{{labels}}} {histogram['sum_seconds']}")
+                lines.append(f"{histogram_name}_count{{{labels}}} {histogram['count']}")
+
+        for name, hosts in sorted(snapshot['counters'].items()):
+            metric = f"{PROMETHEUS_PREFIX}_{name}_total"
+            lines.append(f"# TYPE {metric} counter")
+            for host, value in sorted(hosts.items()):
+                lines.append(f'{metric}{{host="{_escape(host)}"}} {value}')
+
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: str):
+        """Write a Prometheus textfile atomically"""
+        _write_atomic(path, self.to_prometheus())
+
+    def write_json(self, path: str):
+        """Write the full snapshot as JSON atomically"""
+        _write_atomic(path, json.dumps(self.snapshot(), indent=2))
+
+    def write(self, path: str):
+        """Write a .prom textfile or a JSON dump, depending on the file extension"""
+        if path.endswith('.prom'):
+            self.write_prometheus(path)
+        else:
+            self.write_json(path)
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _write_atomic(path: str, content: str):
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        f.write(content)
+    os.replace(temp_path, path)
@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+"""
+Append-only archive of fetched store pages, and a replay command over it
+
+ProductValidator(page_archive="archive/") writes every store page it fetches
+(URL, status, headers, fetch time and the zlib-compressed body) to segment
+files in a directory. Segments are only ever appended to; each process opens
+its own and starts a new one once it reaches segment_bytes, so concurrent
+writers never share a file and a crash can at worst leave a partial record
+at the end of one segment (readers stop there).
+
+Replay re-extracts codes from the archived pages with a new pattern set, one
+process per core, each taking a few megabytes of a segment at a time, so the
+effect of a change to default_code_patterns can be seen without scraping the
+stores again:
+
+    python page_archive.py replay archive/ --patterns "regex:[0-9]{2}-[0-9]{3}" -o codes.jsonl
+    python page_archive.py replay archive/ --patterns "regex:..." --baseline-patterns "regex:..."
+
+Only the latest fetch of each URL is reported. With --baseline-patterns each
+page also lists the codes the new patterns add and remove.
+"""
+
+import argparse
+import json
+import os
+import struct
+import sys
+import threading
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from code_patterns import get_pattern_set
+from page_parsing import html_to_text
+
+SEGMENT_SUFFIX = '.pga'
+RECORD_MAGIC = b'PGA1'
+# Magic, header length, compressed body length
+_RECORD_PREFIX = struct.Struct('<4sII')
+
+# Bytes of segment handed to one replay task, so a few large segments still use every core
+REPLAY_CHUNK_BYTES = 4 * 1024 * 1024
+
+
+class ArchivedPage(NamedTuple):
+    """One archived response"""
+    url: str
+    status: int
+    headers: Dict[str, str]
+    fetched_at: float
+    complete: bool
+    body: bytes
+
+
+class PageArchive:
+    """Writer for a directory of append-only page archive segments"""
+
+    def __init__(self, directory: str, segment_bytes: int = 64 * 1024 * 1024, compression_level: int = 6):
+        """
+        Args:
+            directory: Where segment files are written (created if missing)
+            segment_bytes: Size after which the next record goes to a new segment
+            compression_level: zlib level for page bodies (1 fastest .. 9 smallest)
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.compression_level = compression_level
+        self._lock = threading.Lock()
+        self._file = None
+        self._written = 0
+
+    def _open_segment_locked(self):
+        if self._file is not None:
+            self._file.close()
+        # Time first so segments sort chronologically; pid and random bytes keep writers apart
+        name = f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{os.urandom(3).hex()}{SEGMENT_SUFFIX}"
+        self._file = open(os.path.join(self.directory, name), 'ab')
+        self._written = 0
+
+    def append(self, url: str, status: int, headers: Dict[str, str], body: bytes,
+               fetched_at: Optional[float] = None, complete: bool = True):
+        """
+        Archive one response
+
+        Args:
+            url: URL that was fetched
+            status: HTTP status code
+            headers: Response headers
+            body: Response body as received (decoded from any Content-Encoding)
+            fetched_at: Unix time of the fetch (now if None)
+            complete: False when only part of the body was read (streaming scans stop early)
+        """
+        header = json.dumps({
+            'url': url, 'status': status, 'headers': dict(headers),
+            'fetched_at': fetched_at if fetched_at is not None else time.time(), 'complete': complete
+        }).encode('utf-8')
+        compressed = zlib.compress(body, self.compression_level)
+        record = _RECORD_PREFIX.pack(RECORD_MAGIC, len(header), len(compressed)) + header + compressed
+
+        with self._lock:
+            if self._file is None or self._written >= self.segment_bytes:
+                self._open_segment_locked()
+            # One write per record, so a crash leaves at most one partial record at the end
+            self._file.write(record)
+            self._file.flush()
+            self._written += len(record)
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+def segment_paths(directory: str) -> List[str]:
+    """Return the archive's segment files, oldest first"""
+    return sorted(
+        os.path.join(directory, name) for name in os.listdir(directory) if name.endswith(SEGMENT_SUFFIX)
+    )
+
+
+def _record_offsets(path: str, chunk_bytes: int) -> Iterator[Tuple[int, int]]:
+    """Split a segment into (start, end) byte ranges of whole records, reading only the record prefixes"""
+    with open(path, 'rb') as f:
+        start = position = 0
+        while True:
+            prefix = f.read(_RECORD_PREFIX.size)
+            if len(prefix) < _RECORD_PREFIX.size:
+                break
+            magic, header_length, body_length = _RECORD_PREFIX.unpack(prefix)
+            if magic != RECORD_MAGIC:
+                break
+            position = f.seek(header_length + body_length, os.SEEK_CUR)
+            if position - start >= chunk_bytes:
+                yield start, position
+                start = position
+        if position > start:
+            yield start, position
+
+
+def read_segment(path: str, start: int = 0, end: Optional[int] = None) -> Iterator[ArchivedPage]:
+    """
+    Yield a segment's records in the order they were written, stopping at a partial or corrupt record
+
+    start and end select a byte range, which must begin at a record boundary.
+    """
+    with open(path, 'rb') as f:
+        f.seek(start)
+        while end is None or f.tell() < end:
+            prefix = f.read(_RECORD_PREFIX.size)
+            if len(prefix) < _RECORD_PREFIX.size:
+                return
+            magic, header_length, body_length = _RECORD_PREFIX.unpack(prefix)
+            if magic != RECORD_MAGIC:
+                return
+            header = f.read(header_length)
+            compressed = f.read(body_length)
+            if len(header) < header_length or len(compressed) < body_length:
+                return
+            try:
+                meta = json.loads(header)
+                body = zlib.decompress(compressed)
+            except (ValueError, zlib.error):
+                return
+            yield ArchivedPage(meta['url'], meta['status'], meta['headers'], meta['fetched_at'],
+                               meta.get('complete', True), body)
+
+
+def _replay_range(path: str, start: int, end: int, code_patterns: List[str], baseline_patterns: Optional[List[str]],
+                  since: float, url_prefix: str, backend: str) -> List[Dict[str, Any]]:
+    """Re-extract the codes of the pages in one byte range of a segment (runs in a worker process)"""
+    pattern_set = get_pattern_set(code_patterns)
+    baseline_set = get_pattern_set(baseline_patterns) if baseline_patterns else None
+
+    pages = []
+    for page in read_segment(path, start, end):
+        if page.status != 200 or page.fetched_at < since or not page.url.startswith(url_prefix):
+            continue
+        text = html_to_text(page.body, backend)
+        # The same extraction as ProductValidator._extract_codes_from_text
+        result = {'url': page.url, 'fetched_at': page.fetched_at, 'codes': pattern_set.extract(text)}
+        if baseline_set is not None:
+            before = set(baseline_set.extract(text))
+            result['added'] = [code for code in result['codes'] if code not in before]
+            result['removed'] = sorted(before - set(result['codes']))
+        pages.append(result)
+    return pages
+
+
+def replay(directory: str, code_patterns: List[str], baseline_patterns: Optional[List[str]] = None,
+           workers: Optional[int] = None, since: float = 0, url_prefix: str = '',
+           backend: str = 'lxml') -> List[Dict[str, Any]]:
+    """
+    Re-extract codes from every archived page with a new pattern set
+
+    Args:
+        directory: Archive directory
+        code_patterns: Patterns to extract with
+        baseline_patterns: Patterns to compare against (adds 'added'/'removed' to each page)
+        workers: Worker processes (one per CPU if None)
+        since: Skip pages fetched before this Unix time
+        url_prefix: Only pages whose URL starts with this
+        backend: HTML parsing backend ('lxml' or 'bs4')
+
+    Returns:
+        One dict per URL ('url', 'fetched_at', 'codes', ...) for its latest successful fetch
+    """
+    latest: Dict[str, Dict[str, Any]] = {}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(_replay_range, path, start, end, code_patterns, baseline_patterns, since, url_prefix, backend)
+            for path in segment_paths(directory)
+            for start, end in _record_offsets(path, REPLAY_CHUNK_BYTES)
+        ]
+        for future in futures:
+            for page in future.result():
+                current = latest.get(page['url'])
+                if current is None or page['fetched_at'] >= current['fetched_at']:
+                    latest[page['url']] = page
+    return sorted(latest.values(), key=lambda page: page['url'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    replay_parser = commands.add_parser('replay', help='Re-extract codes from archived pages with new patterns')
+    replay_parser.add_argument('archive', help='Archive directory')
+    replay_parser.add_argument('--patterns', required=True, help='Comma-separated list of code patterns')
+    replay_parser.add_argument('--baseline-patterns', help='Comma-separated patterns to diff against')
+    replay_parser.add_argument('--workers', type=int, help='Worker processes (defaults to the number of CPUs)')
+    replay_parser.add_argument('--since', type=float, default=0, help='Only pages fetched after this Unix time')
+    replay_parser.add_argument('--url-prefix', default='', help='Only pages whose URL starts with this')
+    replay_parser.add_argument('--parser', default='lxml', choices=('lxml', 'bs4'), help='HTML parsing backend')
+    replay_parser.add_argument('-o', '--output', default='-', help="JSONL file for per-page results ('-' for stdout)")
+    args = parser.parse_args()
+
+    patterns = [pattern.strip() for pattern in args.patterns.split(',')]
+    baseline = [pattern.strip() for pattern in args.baseline_patterns.split(',')] if args.baseline_patterns else None
+
+    start = time.perf_counter()
+    pages = replay(args.archive, patterns, baseline, args.workers, args.since, args.url_prefix, args.parser)
+    elapsed = time.perf_counter() - start
+
+    output = sys.stdout if args.output == '-' else open(args.output, 'w', encoding='utf-8')
+    try:
+        for page in pages:
+            output.write(json.dumps(page) + '\n')
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+    codes = {code for page in pages for code in page['codes']}
+    summary = f"Replayed {len(pages)} pages in {elapsed:.1f}s: {len(codes)} distinct codes"
+    if baseline is not None:
+        changed = sum(1 for page in pages if page['added'] or page['removed'])
+        summary += (f", {changed} pages changed, {sum(len(page['added']) for page in pages)} codes added, "
+                    f"{sum(len(page['removed']) for page in pages)} removed")
+    print(summary, file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
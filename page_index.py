@@ -0,0 +1,243 @@
+"""
+Local index of scraped store pages for offline name-to-code lookups
+
+Every store page ProductValidator fetches can be added to a SQLite file: the
+page's text goes into a full-text table, and every code found on it is kept
+with the text printed around it (which on a listing page holds the product's
+title). A later search for a similar product name is answered from the index
+by matching the name against those surrounding texts and ranking the codes
+with the same candidate scoring used before web validation, so that
+"Space Marine Intercessors" is answered from pages scraped for "Intercessors".
+
+The code contexts use SQLite FTS5's trigram tokenizer, which matches any
+substring of three or more characters. That makes lookups tolerant of plurals
+and partial words, and of extracted text that runs neighbouring elements
+together ('Add to basketIntercessors').
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Sequence
+
+from candidates import DEFAULT_MAX_CANDIDATES, CodeEvidence, normalize_gtin, rank_candidates
+from validation_store import normalize_product_name
+
+# Code sightings considered per lookup, best full-text matches first
+LOOKUP_ROWS = 500
+
+
+class PageIndex:
+    """SQLite full-text index of fetched pages and the codes found on them"""
+
+    def __init__(self, path: str, max_age: float = 7 * 24 * 3600):
+        """
+        Args:
+            path: SQLite file to keep the index in (parent directories are created)
+            max_age: Seconds a page is trusted for lookups after it was fetched
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+        self.path = path
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS pages (
+                id INTEGER PRIMARY KEY,
+                url TEXT NOT NULL UNIQUE,
+                site TEXT NOT NULL,
+                fetched_at REAL NOT NULL,
+                lastmod TEXT
+            );
+            CREATE VIRTUAL TABLE IF NOT EXISTS page_text USING fts5(
+                body, tokenize = 'unicode61 remove_diacritics 2'
+            );
+            CREATE TABLE IF NOT EXISTS codes (
+                id INTEGER PRIMARY KEY,
+                page_id INTEGER NOT NULL,
+                code TEXT NOT NULL,
+                pattern TEXT NOT NULL,
+                before TEXT NOT NULL,
+                after TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS codes_page ON codes (page_id);
+            CREATE VIRTUAL TABLE IF NOT EXISTS code_context USING fts5(
+                context, tokenize = 'trigram'
+            );
+        """)
+        # Indexes created before catalog crawls did not record sitemap lastmod
+        columns = {row[1] for row in self._conn.execute('PRAGMA table_info(pages)')}
+        if 'lastmod' not in columns:
+            self._conn.execute('ALTER TABLE pages ADD COLUMN lastmod TEXT')
+
+    def add_page(self, url: str, site: str, text: str, evidence: Sequence[CodeEvidence], lastmod: Optional[str] = None):
+        """
+        Index a fetched page, replacing what was indexed for the URL before
+
+        Args:
+            url: The page's URL
+            site: The site it was fetched from (as passed to the validator)
+            text: Visible text of the page
+            evidence: Codes found on the page with their surrounding text
+            lastmod: The page's last modification time as its sitemap or feed gave it, if known
+        """
+        with self._lock:
+            self._conn.execute('BEGIN')
+            try:
+                self._delete_page_locked(url)
+                page_id = self._conn.execute(
+                    'INSERT INTO pages (url, site, fetched_at, lastmod) VALUES (?, ?, ?, ?)',
+                    (url, site, time.time(), lastmod)
+                ).lastrowid
+                self._conn.execute('INSERT INTO page_text (rowid, body) VALUES (?, ?)', (page_id, text))
+                for item in evidence:
+                    code_id = self._conn.execute(
+                        'INSERT INTO codes (page_id, code, pattern, before, after) VALUES (?, ?, ?, ?, ?)',
+                        (page_id, item.code, item.pattern, item.before, item.after)
+                    ).lastrowid
+                    self._conn.execute('INSERT INTO code_context (rowid, context) VALUES (?, ?)',
+                                       (code_id, normalize_product_name(item.before)))
+                self._conn.execute('COMMIT')
+            except BaseException:
+                self._conn.execute('ROLLBACK')
+                raise
+
+    def _delete_page_locked(self, url: str):
+        row = self._conn.execute('SELECT id FROM pages WHERE url = ?', (url,)).fetchone()
+        if row is None:
+            return
+        page_id = row[0]
+        self._conn.execute('DELETE FROM code_context WHERE rowid IN (SELECT id FROM codes WHERE page_id = ?)', (page_id,))
+        self._conn.execute('DELETE FROM codes WHERE page_id = ?', (page_id,))
+        self._conn.execute('DELETE FROM page_text WHERE rowid = ?', (page_id,))
+        self._conn.execute('DELETE FROM pages WHERE id = ?', (page_id,))
+
+    @staticmethod
+    def _match_query(product_name: str) -> Optional[str]:
+        """FTS5 query matching any word of the name (trigram terms need three characters)"""
+        words = [word for word in normalize_product_name(product_name).split() if len(word) >= 3]
+        if not words:
+            return None
+        return ' OR '.join(f'"{word}"' for word in words)
+
+    def evidence_for(self, product_name: str, sites: Optional[Sequence[str]] = None,
+                     code_patterns: Optional[Sequence[str]] = None, max_age: float = None) -> List[CodeEvidence]:
+        """
+        Return indexed code sightings whose surrounding text mentions words of a product name
+
+        Args:
+            product_name: Name to look up
+            sites: Only sightings from these sites (all sites if None)
+            code_patterns: Only codes found by these patterns (all patterns if None)
+            max_age: Override the index's freshness limit (seconds)
+        """
+        query = self._match_query(product_name)
+        if query is None:
+            return []
+
+        limit = self.max_age if max_age is None else max_age
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT c.code, c.pattern, c.before, c.after, p.site, p.url '
+                'FROM code_context JOIN codes c ON c.id = code_context.rowid JOIN pages p ON p.id = c.page_id '
+                'WHERE code_context MATCH ? AND p.fetched_at >= ? '
+                'ORDER BY bm25(code_context) LIMIT ?',
+                (query, time.time() - limit, LOOKUP_ROWS)
+            ).fetchall()
+
+        site_set = set(sites) if sites is not None else None
+        pattern_set = set(code_patterns) if code_patterns is not None else None
+        return [
+            CodeEvidence(*row) for row in rows
+            if (site_set is None or row[4] in site_set) and (pattern_set is None or row[1] in pattern_set)
+        ]
+
+    def lookup(self, product_name: str, sites: Optional[Sequence[str]] = None,
+               code_patterns: Optional[Sequence[str]] = None, limit: Optional[int] = DEFAULT_MAX_CANDIDATES,
+               max_age: float = None) -> Optional[Dict[str, Any]]:
+        """
+        Answer a code search from the index when it covers the product well enough
+
+        Coverage is good enough when the best candidate was printed right after
+        the full product name on some indexed page (candidate reason
+        'exact_product_name'). Otherwise None is returned and the caller should
+        search the sites.
+
+        Returns:
+            {'product_name', 'found_codes', 'candidates', 'sources' (code -> page URLs)}
+        """
+        evidence = self.evidence_for(product_name, sites, code_patterns, max_age)
+        if not evidence:
+            return None
+
+        candidates, _ = rank_candidates(evidence, product_name, limit)
+        if not candidates or 'exact_product_name' not in candidates[0]['reasons']:
+            return None
+
+        # Only codes tied to this product's name, not its neighbours on the page
+        candidates = [candidate for candidate in candidates if 'exact_product_name' in candidate['reasons']]
+
+        sources: Dict[str, List[str]] = {}
+        for item in evidence:
+            key = normalize_gtin(item.code) or item.code
+            urls = sources.setdefault(key, [])
+            if item.page not in urls:
+                urls.append(item.page)
+
+        return {
+            'product_name': product_name,
+            'found_codes': [candidate['code'] for candidate in candidates],
+            'candidates': candidates,
+            'sources': {candidate['code']: sources.get(candidate['key'], []) for candidate in candidates}
+        }
+
+    def search_pages(self, query: str, limit: int = 10) -> List[Dict[str, Any]]:
+        """Return indexed pages whose text matches an FTS5 query, best first"""
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT p.url, p.site, p.fetched_at FROM page_text JOIN pages p ON p.id = page_text.rowid '
+                'WHERE page_text MATCH ? ORDER BY bm25(page_text) LIMIT ?',
+                (query, limit)
+            ).fetchall()
+        return [{'url': url, 'site': site, 'fetched_at': fetched_at} for url, site, fetched_at in rows]
+
+    def site_pages(self, site: str) -> Dict[str, Optional[str]]:
+        """Return the URLs indexed for a site, mapped to the lastmod recorded with them"""
+        with self._lock:
+            rows = self._conn.execute('SELECT url, lastmod FROM pages WHERE site = ?', (site,)).fetchall()
+        return dict(rows)
+
+    def touch(self, urls: Sequence[str]):
+        """Mark pages as fetched now, e.g. when their sitemap shows they have not changed"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute('BEGIN')
+            try:
+                self._conn.executemany('UPDATE pages SET fetched_at = ? WHERE url = ?', [(now, url) for url in urls])
+                self._conn.execute('COMMIT')
+            except BaseException:
+                self._conn.execute('ROLLBACK')
+                raise
+
+    def purge_stale(self) -> int:
+        """Delete pages older than max_age, returning how many were removed"""
+        with self._lock:
+            urls = [row[0] for row in self._conn.execute(
+                'SELECT url FROM pages WHERE fetched_at < ?', (time.time() - self.max_age,)
+            ).fetchall()]
+            self._conn.execute('BEGIN')
+            try:
+                for url in urls:
+                    self._delete_page_locked(url)
+                self._conn.execute('COMMIT')
+            except BaseException:
+                self._conn.execute('ROLLBACK')
+                raise
+        return len(urls)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
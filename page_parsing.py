@@ -0,0 +1,272 @@
+"""
+HTML parsing backends for scraped pages
+
+Two things are parsed out of fetched pages: the visible text of storefront
+pages (scanned for product codes) and the result list of DuckDuckGo's HTML
+search page. Both have a fast lxml path and the original BeautifulSoup
+html.parser path as a fallback:
+
+- 'lxml': text is collected by a parser target while lxml's C parser streams
+  through the document, so no tree is built. Search results use an lxml tree
+  with XPath class selectors.
+- 'bs4': BeautifulSoup(content, 'html.parser'), as the validator always did.
+
+PageParser picks a backend and can push heavy pages to a process pool so that
+parsing does not hold the GIL while other fetches are in flight.
+StreamingText turns a body that arrives in chunks into text as it arrives.
+"""
+
+import asyncio
+import codecs
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Union
+
+try:
+    from lxml import etree, html as lxml_html
+    HAVE_LXML = True
+except ImportError:
+    HAVE_LXML = False
+
+# Elements whose text BeautifulSoup's get_text() leaves out
+SKIPPED_TEXT_TAGS = frozenset(['script', 'style', 'template'])
+
+BACKENDS = ('lxml', 'bs4')
+
+
+class _TextCollector:
+    """lxml parser target that keeps visible text and the page title"""
+
+    def __init__(self):
+        self.parts: List[str] = []
+        self.title_parts: List[str] = []
+        self._skip_depth = 0
+        self._in_title = False
+
+    def start(self, tag, attrib):
+        if tag in SKIPPED_TEXT_TAGS:
+            self._skip_depth += 1
+        elif tag == 'title':
+            self._in_title = True
+
+    def end(self, tag):
+        if tag in SKIPPED_TEXT_TAGS:
+            self._skip_depth = max(0, self._skip_depth - 1)
+        elif tag == 'title':
+            self._in_title = False
+
+    def data(self, data):
+        if self._skip_depth:
+            return
+        self.parts.append(data)
+        if self._in_title:
+            self.title_parts.append(data)
+
+    def comment(self, text):
+        pass
+
+    def close(self):
+        return ''.join(self.parts)
+
+
+def _decode(content: Union[bytes, str]) -> Union[bytes, str]:
+    """Decode UTF-8 bodies up front; anything else is left for lxml's charset detection"""
+    if isinstance(content, bytes):
+        try:
+            return content.decode('utf-8')
+        except UnicodeDecodeError:
+            return content
+    return content
+
+
+def _lxml_text(content: Union[bytes, str]) -> _TextCollector:
+    collector = _TextCollector()
+    parser = etree.HTMLParser(target=collector, recover=True)
+    content = _decode(content)
+    # close() raises on a parser that was never fed; an empty body has no text anyway
+    if content:
+        parser.feed(content)
+        parser.close()
+    return collector
+
+
+def html_to_text(content: Union[bytes, str], backend: str = 'lxml') -> str:
+    """Return the visible text of an HTML page"""
+    if backend == 'lxml' and HAVE_LXML:
+        return ''.join(_lxml_text(content).parts)
+
+    from bs4 import BeautifulSoup
+    return BeautifulSoup(content, 'html.parser').get_text()
+
+
+def html_title(content: Union[bytes, str], backend: str = 'lxml') -> str:
+    """Return the text of an HTML page's <title>"""
+    if backend == 'lxml' and HAVE_LXML:
+        return ''.join(_lxml_text(content).title_parts).strip()
+
+    from bs4 import BeautifulSoup
+    title = BeautifulSoup(content, 'html.parser').title
+    return title.get_text().strip() if title else ''
+
+
+def _class_xpath(tag: str, class_name: str) -> str:
+    return f"{tag}[contains(concat(' ', normalize-space(@class), ' '), ' {class_name} ')]"
+
+
+_RESULT_XPATH = '//' + _class_xpath('div', 'result')
+_TITLE_XPATH = './/' + _class_xpath('a', 'result__a')
+_SNIPPET_XPATH = './/' + _class_xpath('div', 'result__snippet')
+
+
+def parse_search_results(content: Union[bytes, str], limit: int = 10, backend: str = 'lxml') -> List[Dict[str, str]]:
+    """
+    Return the title, URL and snippet of each result on a DuckDuckGo HTML results page
+
+    Args:
+        content: Body of the results page
+        limit: Maximum number of result blocks to look at
+        backend: 'lxml' or 'bs4'
+    """
+    matches = []
+
+    if backend == 'lxml' and HAVE_LXML:
+        content = _decode(content)
+        if not content:
+            return matches
+        document = lxml_html.fromstring(content)
+
+        for div in document.xpath(_RESULT_XPATH)[:limit]:
+            title_elem = div.xpath(_TITLE_XPATH)
+            snippet_elem = div.xpath(_SNIPPET_XPATH)
+
+            if title_elem and snippet_elem:
+                matches.append({
+                    'title': title_elem[0].text_content().strip(),
+                    'url': title_elem[0].get('href', ''),
+                    'snippet': snippet_elem[0].text_content().strip()
+                })
+        return matches
+
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(content, 'html.parser')
+
+    for div in soup.find_all('div', {'class': 'result'})[:limit]:
+        title_elem = div.find('a', {'class': 'result__a'})
+        snippet_elem = div.find('div', {'class': 'result__snippet'})
+
+        if title_elem and snippet_elem:
+            matches.append({
+                'title': title_elem.get_text().strip(),
+                'url': title_elem.get('href', ''),
+                'snippet': snippet_elem.get_text().strip()
+            })
+    return matches
+
+
+class StreamingText:
+    """
+    Visible text of an HTML page whose body arrives in chunks
+
+    With lxml, chunks are pushed into the parser as they arrive and feed()
+    returns whatever text they completed. The bs4 backend cannot parse
+    incrementally, so it buffers the chunks and returns all text from close().
+    """
+
+    def __init__(self, backend: str = 'lxml'):
+        self.backend = backend if backend != 'lxml' or HAVE_LXML else 'bs4'
+        # Bodies are decoded as UTF-8 as they stream; codes are ASCII either way
+        self._decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        self._chunks: List[bytes] = []
+        self._collector = None
+        self._parser = None
+        self._taken = 0
+        self._fed = False
+        if self.backend == 'lxml':
+            self._collector = _TextCollector()
+            self._parser = etree.HTMLParser(target=self._collector, recover=True)
+
+    def _take(self) -> str:
+        parts = self._collector.parts
+        text = ''.join(parts[self._taken:])
+        self._taken = len(parts)
+        return text
+
+    def feed(self, chunk: bytes) -> str:
+        """Add the next chunk of the body, returning the text it completed"""
+        if self._parser is None:
+            self._chunks.append(chunk)
+            return ''
+        decoded = self._decoder.decode(chunk)
+        if decoded:
+            self._parser.feed(decoded)
+            self._fed = True
+        return self._take()
+
+    def close(self) -> str:
+        """Finish the page, returning the text not yet returned by feed()"""
+        if self._parser is None:
+            return html_to_text(b''.join(self._chunks), 'bs4')
+        decoded = self._decoder.decode(b'', final=True)
+        if decoded:
+            self._parser.feed(decoded)
+            self._fed = True
+        if self._fed:
+            self._parser.close()
+        return self._take()
+
+
+class PageParser:
+    """Parsing backend chosen once per validator"""
+
+    def __init__(self, backend: str = 'lxml', process_pool_threshold: int = 512 * 1024, max_workers: Optional[int] = None):
+        """
+        Args:
+            backend: 'lxml' (falls back to 'bs4' when lxml is not installed) or 'bs4'
+            process_pool_threshold: Pages at least this many bytes are parsed in a process pool by text_async
+            max_workers: Size of the process pool (defaults to the number of CPUs)
+        """
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown parser backend '{backend}', expected one of {BACKENDS}")
+        if backend == 'lxml' and not HAVE_LXML:
+            backend = 'bs4'
+
+        self.backend = backend
+        self.process_pool_threshold = process_pool_threshold
+        self.max_workers = max_workers
+        self._process_pool: Optional[ProcessPoolExecutor] = None
+
+    def text(self, content: Union[bytes, str]) -> str:
+        """Return the visible text of a page"""
+        return html_to_text(content, self.backend)
+
+    def stream(self) -> StreamingText:
+        """Return an incremental text extractor for one page"""
+        return StreamingText(self.backend)
+
+    def search_results(self, content: Union[bytes, str], limit: int = 10) -> List[Dict[str, str]]:
+        """Return the results listed on a DuckDuckGo HTML results page"""
+        return parse_search_results(content, limit, self.backend)
+
+    async def text_async(self, content: Union[bytes, str], run_blocking=None) -> str:
+        """
+        Return the visible text of a page without blocking the event loop
+
+        Pages over the size threshold go to the process pool; smaller ones run
+        through run_blocking (an awaitable-returning callable such as
+        AsyncFetchEngine.run_blocking) or the loop's default executor.
+        """
+        loop = asyncio.get_running_loop()
+
+        if len(content) >= self.process_pool_threshold:
+            if self._process_pool is None:
+                self._process_pool = ProcessPoolExecutor(max_workers=self.max_workers)
+            return await loop.run_in_executor(self._process_pool, html_to_text, content, self.backend)
+
+        if run_blocking is not None:
+            return await run_blocking(html_to_text, content, self.backend)
+        return await loop.run_in_executor(None, html_to_text, content, self.backend)
+
+    def close(self):
+        """Shut down the process pool"""
+        if self._process_pool is not None:
+            self._process_pool.shutdown(wait=False)
+            self._process_pool = None
@@ -0,0 +1,197 @@
+"""
+Staged scrape -> validate pipeline for lists of products
+
+process_product runs one product at a time: every site is scraped, then the
+codes are validated, and only then does the next product start, so the network
+sits idle during politeness sleeps and validation never overlaps scraping.
+ProductPipeline gives each stage its own worker threads and connects the
+stages with bounded queues:
+
+    products -> [scrape workers] -> queue -> [validate workers] -> results
+
+Candidate pruning needs every sighting's surrounding text, so it runs at the
+end of each scrape (search_product_codes_on_sites ranks the codes it found);
+the validate workers only read the top candidates off the result.
+
+A full queue blocks the stage feeding it, so a slow stage holds back the ones
+before it instead of letting work pile up, and throughput is set by the
+slowest stage rather than by the sum of all stages. Each stage can also be
+given a rate (products per second entering it), e.g. to keep validation under
+a search engine's limits while scraping runs at full speed.
+
+Workers borrow ProductValidators from a ValidatorPool, so all stages share its
+caches, stores and metrics. Given a FetchPlan for the product list (see
+fetch_planner.py), the scrape workers download each store page once for the
+whole list.
+"""
+
+import queue
+import threading
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from fetch_planner import FetchPlan
+from rate_limit import TokenBucket
+from validator_pool import ValidatorPool
+
+STAGES = ('scrape', 'validate')
+
+# Tells a stage's workers that no more products are coming
+_DONE = object()
+
+
+class ProductPipeline:
+    """Runs products through scrape and validate stages concurrently"""
+
+    def __init__(self, pool: ValidatorPool, target_sites: List[str], code_patterns: List[str], min_matches: int = 3,
+                 scrape_workers: int = 4, validate_workers: int = 2, scrape_rate: float = 0, validate_rate: float = 0,
+                 queue_size: int = 16, ordered: bool = True, fetch_plan: Optional[FetchPlan] = None):
+        """
+        Args:
+            pool: Where workers borrow validators from (size it to validators_needed, the total number of workers)
+            target_sites: List of URLs to search
+            code_patterns: List of regex patterns or specific sequences to find
+            min_matches: Minimum number of web matches required
+            scrape_workers: Threads searching sites for codes (and ranking them)
+            validate_workers: Threads validating codes on the web
+            scrape_rate: Products per second entering the scrape stage (0 = unlimited)
+            validate_rate: Products per second entering the validate stage (0 = unlimited)
+            queue_size: Capacity of the queue in front of each stage
+            ordered: Yield results in input order (True) or as soon as each product finishes (False)
+            fetch_plan: Plan built for the products to be run, sharing store pages between their searches
+        """
+        self.pool = pool
+        self.target_sites = target_sites
+        self.code_patterns = code_patterns
+        self.min_matches = min_matches
+        self.workers = {'scrape': scrape_workers, 'validate': validate_workers}
+        self.rates = {'scrape': scrape_rate, 'validate': validate_rate}
+        self.queue_size = max(1, queue_size)
+        self.ordered = ordered
+        self.fetch_plan = fetch_plan
+
+    @property
+    def validators_needed(self) -> int:
+        """Validators the pool needs for every worker to hold one at once"""
+        return sum(max(1, workers) for workers in self.workers.values())
+
+    def _scrape(self, validator, item: Dict[str, Any]):
+        print(f"Processing: {item['product_name']}")
+        item['site_search'] = validator.search_product_codes_on_sites(item['product_name'], self.target_sites,
+                                                                      self.code_patterns, self.fetch_plan)
+
+    def _validate(self, validator, item: Dict[str, Any]):
+        codes = validator.codes_to_validate(item['site_search'])
+        item['web_validation'] = validator.validate_found_codes(item['product_name'], item['site_search'],
+                                                                codes, self.min_matches)
+
+    def run(self, products: Iterable[str]) -> Iterator[Dict[str, Any]]:
+        """
+        Yield one result per product, shaped like ProductValidator.process_product's
+
+        A product whose stage raised gets {'product_name', 'error'} instead.
+        Products are read from the iterable only as fast as the pipeline has
+        room for them, so it can be a stream of any length. If reading the
+        iterable raises, the products read before it are still yielded and
+        then the exception is re-raised here.
+        """
+        handlers = {'scrape': self._scrape, 'validate': self._validate}
+        inboxes = {stage: queue.Queue(self.queue_size) for stage in STAGES}
+        results: queue.Queue = queue.Queue()
+        outboxes = {'scrape': inboxes['validate'], 'validate': results}
+
+        # Caps products between the feeder and the consumer, which also bounds
+        # the reorder buffer when results are yielded in input order
+        in_flight = threading.Semaphore(self.queue_size * len(STAGES) + sum(self.workers.values()))
+        stopping = threading.Event()
+        feed_errors: List[BaseException] = []
+
+        def feed():
+            try:
+                for index, product_name in enumerate(products):
+                    in_flight.acquire()
+                    if stopping.is_set():
+                        break
+                    inboxes['scrape'].put({'index': index, 'product_name': product_name})
+            except BaseException as e:
+                feed_errors.append(e)
+            finally:
+                inboxes['scrape'].put(_DONE)
+
+        threads = [threading.Thread(target=feed, name='pipeline-feed', daemon=True)]
+        for stage in STAGES:
+            workers = max(1, self.workers[stage])
+            bucket = TokenBucket(self.rates[stage]) if self.rates[stage] > 0 else None
+            remaining = [workers]
+            lock = threading.Lock()
+            for number in range(workers):
+                threads.append(threading.Thread(
+                    target=self._work,
+                    args=(handlers[stage], bucket, inboxes[stage], outboxes[stage], remaining, lock),
+                    name=f'pipeline-{stage}-{number}', daemon=True
+                ))
+
+        for thread in threads:
+            thread.start()
+
+        buffered: Dict[int, Dict[str, Any]] = {}
+        next_index = 0
+        try:
+            while True:
+                item = results.get()
+                if item is _DONE:
+                    break
+                if not self.ordered:
+                    in_flight.release()
+                    yield self._result(item)
+                    continue
+
+                buffered[item['index']] = item
+                while next_index in buffered:
+                    in_flight.release()
+                    yield self._result(buffered.pop(next_index))
+                    next_index += 1
+
+            # Only reachable with gaps if the feeder itself failed part way
+            for index in sorted(buffered):
+                yield self._result(buffered[index])
+            if feed_errors:
+                raise feed_errors[0]
+        finally:
+            # Stop feeding if the caller abandoned the generator; queued products still drain
+            stopping.set()
+            in_flight.release()
+
+    def _work(self, handler, bucket: Optional[TokenBucket], inbox: queue.Queue, outbox: queue.Queue,
+              remaining: List[int], lock: threading.Lock):
+        while True:
+            item = inbox.get()
+            if item is _DONE:
+                # Let the other workers of this stage see it too; the last one out tells the next stage
+                inbox.put(_DONE)
+                with lock:
+                    remaining[0] -= 1
+                    last = remaining[0] == 0
+                if last:
+                    outbox.put(_DONE)
+                return
+
+            if 'error' not in item:
+                if bucket is not None:
+                    bucket.acquire()
+                try:
+                    with self.pool.validator() as validator:
+                        handler(validator, item)
+                except Exception as e:
+                    item['error'] = str(e)
+
+            outbox.put(item)
+
+    @staticmethod
+    def _result(item: Dict[str, Any]) -> Dict[str, Any]:
+        if 'error' in item:
+            return {'product_name': item['product_name'], 'error': item['error']}
+        return {
+            'product_name': item['product_name'],
+            'site_search': item['site_search'],
+            'web_validation': item['web_validation']
+        }
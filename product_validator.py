@@ -1,20 +1,115 @@
 import os
 import re
 import time
+import asyncio
+import functools
 import requests
-from bs4 import BeautifulSoup
-from swarm import Swarm, Agent
-from typing import List, Dict, Any
+from requests.adapters import HTTPAdapter
+from contextlib import ExitStack, contextmanager
+from typing import List, Dict, Any, Callable, Iterator, Optional, Sequence, Tuple, Union
 import json
-from urllib.parse import quote_plus, urljoin, urlparse
+from urllib.parse import quote_plus, urljoin
+
+from agent_results import compact_product, compact_search, compact_validation, get_details, summary_payload, to_json
+from candidates import DEFAULT_MAX_CANDIDATES, CodeEvidence, collect_evidence, rank_candidates
+from code_patterns import CodeMatch, StreamScanner, get_pattern_set
+from fetch_engine import AsyncFetchEngine, run_sync
+from fetch_planner import FetchPlan
+from host_health import RETRYABLE_STATUSES, HostHealth, HostUnavailable, parse_crawl_delay, parse_retry_after
+from http_cache import CachingAdapter, ResponseCache, build_cached_response
+from metrics import Metrics
+from page_archive import PageArchive
+from page_index import PageIndex
+from page_parsing import PageParser
+from pipeline import ProductPipeline
+from site_profiles import SEARCH_URL_TEMPLATES, SiteProfiles, expand_template, host_key
+from structured_data import scan_structured
+from validation_store import ValidationStore
+from validator_pool import shared_pool
+from rate_limit import HostRateLimiter
 
 class ProductValidator:
-    def __init__(self):
+    def __init__(self, async_fetch: bool = False, max_concurrency: int = 8, host_rate: float = 1.0, host_burst: int = 2,
+                 response_cache=None, validation_store=None, parser_backend: str = 'lxml', site_profiles=None,
+                 include_metrics: bool = False, metrics: Optional[Metrics] = None,
+                 pool_connections: int = 10, pool_maxsize: int = 10, stream_pages: bool = False,
+                 max_page_bytes: int = 2 * 1024 * 1024, stop_condition: Optional[Callable[[List[CodeMatch]], bool]] = None,
+                 prune_candidates: bool = True, max_candidates: Optional[int] = DEFAULT_MAX_CANDIDATES,
+                 page_index=None, batch_validation: bool = False, validation_batch_size: int = 4,
+                 structured_data: bool = True, site_selectors: Optional[Dict[str, List[str]]] = None,
+                 page_archive=None, rate_limiter: Optional[HostRateLimiter] = None,
+                 host_health: Optional[HostHealth] = None):
+        """
+        Args:
+            async_fetch: Search all sites and candidate URLs concurrently instead of one at a time
+            max_concurrency: Maximum number of requests in flight at once in async fetch mode
+            host_rate: Requests per second allowed to each host in async fetch mode
+            host_burst: Number of back-to-back requests allowed to a host before rate limiting applies
+            response_cache: Optional ResponseCache, or a path to its SQLite file, used for every page fetch
+            validation_store: Optional ValidationStore, or a path to its SQLite file, that remembers web validation outcomes
+            parser_backend: HTML parsing backend, 'lxml' (fast) or 'bs4' (BeautifulSoup html.parser)
+            site_profiles: Optional SiteProfiles, or a path to its JSON file, that learns which search URL works on each site
+            include_metrics: Add a 'metrics' section (per-stage timings, bytes, sleeps, errors by host) to result dicts
+            metrics: Metrics instance to record into (a new one if None)
+            pool_connections: Number of hosts whose keep-alive connections are kept
+            pool_maxsize: Keep-alive connections kept per host
+            stream_pages: Read store pages in chunks and scan each chunk as it arrives
+            max_page_bytes: Bytes read from a store page before the rest is skipped (streaming mode)
+            stop_condition: Called with the codes found so far on a page; once it returns True the rest
+                of the page is skipped (streaming mode), e.g. code_patterns.stop_after_matches(3, pattern)
+            prune_candidates: Drop implausible codes (bad check digits, dates, prices, page numbers) and rank
+                the rest, so process_product validates only the best max_candidates codes per product
+            max_candidates: Codes validated per product when pruning (all plausible ones if None)
+            page_index: Optional PageIndex, or a path to its SQLite file, that keeps every fetched store page
+                and answers search_with_defaults from earlier scrapes when it covers the product
+            batch_validation: Validate several codes per web search with an OR query, crediting each result
+                to the codes its title, snippet or URL mentions
+            validation_batch_size: Codes per batched validation query
+            structured_data: Take codes from a page's JSON-LD, microdata and meta tags when it has them,
+                scanning the full page text only when it does not
+            site_selectors: CSS selectors per site (keyed like default_sites) for the elements that hold
+                its codes; only their text is scanned, with the structured data
+            page_archive: Optional PageArchive, or a directory for one, that keeps every store page fetched
+                from the network so codes can be re-extracted later without refetching
+            rate_limiter: Politeness limiter shared with other validators or processes (e.g. a
+                SharedHostRateLimiter) used instead of host_rate/host_burst. Every request then waits
+                on it, sync-mode fetches and web searches included, in place of the fixed sleeps
+            host_health: HostHealth shared with other validators (a new one if None) that paces hosts by
+                their latency, 429/503s, Retry-After and robots.txt Crawl-delay, retries failed fetches
+                and skips hosts that keep failing
+        """
+        # Per-stage timings and per-host counters
+        self.metrics = metrics if metrics is not None else Metrics()
+        self.include_metrics = include_metrics
+        
         self.session = requests.Session()
         self.session.headers.update({
             'User-Agent': 'Mozilla/5.0 (compatible; ProductValidator/1.0; +https://github.com/)'
         })
         
+        # Stores opened here from a path are closed by close(); passed-in ones belong to the caller
+        self._owned_stores = []
+        
+        # Disk-backed response cache with ETag/Last-Modified revalidation
+        if isinstance(response_cache, str):
+            response_cache = ResponseCache(response_cache)
+            self._owned_stores.append(response_cache)
+        self.response_cache = response_cache
+        
+        # Keep-alive connection pools, one per host
+        if self.response_cache is not None:
+            adapter = CachingAdapter(self.response_cache, pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+        else:
+            adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        
+        # Remembered (product, code) validation outcomes
+        if isinstance(validation_store, str):
+            validation_store = ValidationStore(validation_store)
+            self._owned_stores.append(validation_store)
+        self.validation_store = validation_store
+        
         # Static links for wargaming/trading sites - left blank for user customization
         self.default_sites = [
             # Add your target websites here
@@ -23,6 +118,11 @@ class ProductValidator:
             "https://www.meeplemart.com/"
         ]
         
+        # Optional CSS selectors for the elements holding each site's codes, e.g.
+        # {"https://www.meeplemart.com/": [".product-sku", ".product-barcode"]}
+        self.site_selectors = {host_key(site): list(selectors) for site, selectors in (site_selectors or {}).items()}
+        self.structured_data = structured_data
+        
         # Static regex patterns for your specific SKU formats
         self.default_code_patterns = [
             "regex:[0-9]{2}-[0-9]{2}",              # XX-XX format
@@ -31,7 +131,79 @@ class ProductValidator:
             "regex:5011921[0-9]{6}"               # 13 digit barcode starting with 5011921
         ]
         
-    def search_product_codes_on_sites(self, product_name: str, target_sites: List[str], code_patterns: List[str]) -> Dict[str, Any]:
+        # Request settings
+        self.timeout = 10
+        self.request_delay = 1          # Seconds to sleep between site requests (sync mode)
+        self.max_search_urls = 3        # Search URLs tried per site
+        
+        # Web search used for validation ({query} is the URL-encoded query)
+        self.web_search_url = "https://duckduckgo.com/html/?q={query}"
+        self.web_search_delay = 2       # Seconds to sleep after each web search
+        
+        # Batched validation: several codes per query, reading up to
+        # web_search_pages result pages of web_search_page_size results
+        self.batch_validation = batch_validation
+        self.validation_batch_size = max(1, validation_batch_size)
+        self.web_search_pages = 2
+        self.web_search_page_size = 30
+        self.web_search_page_param = "&s={offset}"   # Appended to web_search_url for later pages
+        
+        # Async fetch mode: a global concurrency cap plus a token bucket per host
+        # takes the place of the fixed sleeps between requests. A limiter passed
+        # in does so in sync mode too.
+        self.async_fetch = async_fetch
+        self.rate_limit_every_request = rate_limiter is not None
+        self.rate_limiter = rate_limiter if rate_limiter is not None else HostRateLimiter(rate=host_rate, burst=host_burst)
+        # The engine waits for the host's token itself before calling _fetch, unless the cache has the page
+        self.fetch_engine = AsyncFetchEngine(functools.partial(self._fetch, wait=False), max_concurrency=max_concurrency,
+                                             rate_limiter=self.rate_limiter, is_cached=self._is_cached,
+                                             on_wait=lambda host, delay: self.metrics.inc('politeness_sleep_seconds', host, delay))
+        
+        # Adaptive per-host pacing, retries and circuit breakers, for every request
+        self.host_health = host_health if host_health is not None else HostHealth()
+        
+        # HTML parsing backend; heavy pages are parsed in a process pool in async fetch mode
+        self.page_parser = PageParser(parser_backend)
+        
+        # Streaming mode: pages are scanned chunk by chunk and abandoned once the
+        # byte budget is spent or the stop condition is met
+        self.stream_pages = stream_pages
+        self.stream_chunk_size = 64 * 1024
+        self.max_page_bytes = max_page_bytes
+        self.stop_condition = stop_condition
+        
+        # Candidate pruning between scraping and web validation
+        self.prune_candidates = prune_candidates
+        self.max_candidates = max_candidates
+        
+        # Local index of scraped pages for offline name-to-code lookups
+        if isinstance(page_index, str):
+            page_index = PageIndex(page_index)
+            self._owned_stores.append(page_index)
+        self.page_index = page_index
+        
+        # Compressed record of every store response, for replaying extraction
+        if isinstance(page_archive, str):
+            page_archive = PageArchive(page_archive)
+            self._owned_stores.append(page_archive)
+        self.page_archive = page_archive
+        
+        # Learned search URL template per site
+        if isinstance(site_profiles, str):
+            site_profiles = SiteProfiles(site_profiles)
+        self.site_profiles = site_profiles
+        
+    def close(self):
+        """Close connections, worker threads and processes, and any stores opened from a path"""
+        self.session.close()
+        self.fetch_engine.close()
+        self.page_parser.close()
+        for store in self._owned_stores:
+            store.close()
+        self._owned_stores = []
+    
+    def search_product_codes_on_sites(self, product_name: str, target_sites: List[str], code_patterns: List[str],
+                                      fetch_plan: Optional[FetchPlan] = None) -> Dict[str, Any]:
         """
         Search for product codes on specific sites
         
@@ -39,129 +211,704 @@ class ProductValidator:
             product_name: Name of the product to search for
             target_sites: List of URLs to search
             code_patterns: List of regex patterns or specific sequences to find
+            fetch_plan: Batch plan sharing pages with the other products' searches (ignored when streaming pages)
         """
+        if self.async_fetch:
+            return run_sync(self.search_product_codes_on_sites_async(product_name, target_sites, code_patterns, fetch_plan))
+        
         results = {
             'product_name': product_name,
             'found_codes': [],
             'site_results': {}
         }
-        
-        for site_url in target_sites:
-            try:
-                # Search for the product on the site
-                site_result = self._search_site_for_product(site_url, product_name, code_patterns)
-                results['site_results'][site_url] = site_result
-                
-                # Add any found codes to the main list
-                if site_result['codes_found']:
-                    results['found_codes'].extend(site_result['codes_found'])
+        with self._report_scope(results):
+            evidence = []
+            
+            for site_url in target_sites:
+                try:
+                    # Search for the product on the site
+                    site_result = self._search_site_for_product(site_url, product_name, code_patterns, fetch_plan)
+                    evidence.extend(site_result.pop('evidence', []))
+                    results['site_results'][site_url] = site_result
                     
-            except Exception as e:
-                results['site_results'][site_url] = {
-                    'error': f"Failed to search {site_url}: {str(e)}",
-                    'codes_found': []
-                }
+                    # Add any found codes to the main list
+                    if site_result['codes_found']:
+                        results['found_codes'].extend(site_result['codes_found'])
+                        
+                except Exception as e:
+                    results['site_results'][site_url] = {
+                        'status': 'error',
+                        'error': f"Failed to search {site_url}: {str(e)}",
+                        'codes_found': []
+                    }
                 
-        # Remove duplicate codes
-        results['found_codes'] = list(set(results['found_codes']))
+                finally:
+                    if fetch_plan is not None:
+                        fetch_plan.done(product_name, site_url)
+                    
+            # Remove duplicate codes
+            results['found_codes'] = list(set(results['found_codes']))
+            self._rank_found_codes(results, product_name, evidence)
+        
+        return results
+    
+    async def search_product_codes_on_sites_async(self, product_name: str, target_sites: List[str], code_patterns: List[str],
+                                                  fetch_plan: Optional[FetchPlan] = None) -> Dict[str, Any]:
+        """
+        Search for product codes on all sites concurrently
+        
+        Every candidate URL of every site is fetched at the same time, subject to
+        the fetch engine's global concurrency cap and per-host token buckets.
+        Returns the same structure as search_product_codes_on_sites.
+        """
+        results = {
+            'product_name': product_name,
+            'found_codes': [],
+            'site_results': {}
+        }
+        with self._report_scope(results):
+            evidence = []
+            
+            site_outcomes = await asyncio.gather(
+                *(self._search_site_for_product_async(site_url, product_name, code_patterns, fetch_plan)
+                  for site_url in target_sites),
+                return_exceptions=True
+            )
+            if fetch_plan is not None:
+                for site_url in target_sites:
+                    fetch_plan.done(product_name, site_url)
+            
+            for site_url, outcome in zip(target_sites, site_outcomes):
+                if isinstance(outcome, Exception):
+                    results['site_results'][site_url] = {
+                        'status': 'error',
+                        'error': f"Failed to search {site_url}: {str(outcome)}",
+                        'codes_found': []
+                    }
+                    continue
+                    
+                evidence.extend(outcome.pop('evidence', []))
+                results['site_results'][site_url] = outcome
+                results['found_codes'].extend(outcome['codes_found'])
+            
+            # Remove duplicate codes
+            results['found_codes'] = list(set(results['found_codes']))
+            self._rank_found_codes(results, product_name, evidence)
         
         return results
     
-    def _search_site_for_product(self, site_url: str, product_name: str, code_patterns: List[str]) -> Dict[str, Any]:
+    def _search_site_for_product(self, site_url: str, product_name: str, code_patterns: List[str],
+                                 fetch_plan: Optional[FetchPlan] = None) -> Dict[str, Any]:
         """Search a specific site for product and extract codes"""
         try:
+            host = HostRateLimiter.host_for(site_url)
+            try:
+                # A store that keeps failing is skipped until its cool-down passes
+                self.host_health.check(host)
+            except HostUnavailable as e:
+                self.metrics.inc('skipped_sites', host)
+                return self._site_result([], [], [], [e])
+            self._check_robots(site_url)
+            
             # Try different search approaches
-            search_urls = self._generate_search_urls(site_url, product_name)
+            search_plan, probing = self._search_plan(site_url, product_name)
             
             all_codes_found = []
             pages_searched = []
+            page_outcomes = []
+            evidence = []
+            errors = []
             
-            for search_url in search_urls[:3]:  # Limit to 3 search attempts per site
+            for template_name, search_url in search_plan:
                 try:
-                    response = self.session.get(search_url, timeout=10)
-                    response.raise_for_status()
-                    
-                    soup = BeautifulSoup(response.content, 'html.parser')
-                    text_content = soup.get_text()
-                    
-                    # Search for codes using patterns
-                    found_codes = self._extract_codes_from_text(text_content, code_patterns)
+                    if self.stream_pages:
+                        text_content, found_codes = self._stream_scan_page(search_url, code_patterns)
+                        fetched = True
+                    else:
+                        content, fetched = self._read_page(search_url, fetch_plan)
+                        
+                        # Search for codes using patterns
+                        text_content, found_codes = self._scan_page(content, code_patterns, host, site_url,
+                                                                    product_name, search_url, fetch_plan)
                     all_codes_found.extend(found_codes)
+                    page_evidence = collect_evidence(text_content, found_codes, site_url, search_url)
+                    evidence.extend(page_evidence)
+                    self._index_page(site_url, search_url, text_content, page_evidence)
                     
                     pages_searched.append(search_url)
+                    page_outcomes.append((template_name, text_content, len(found_codes)))
+                    
+                    # Add delay between requests (not after a page the store was not asked for)
+                    if fetched and not self.rate_limit_every_request:
+                        self.metrics.sleep(self.request_delay, host)
                     
-                    # Add delay between requests
-                    time.sleep(1)
+                except HostUnavailable as e:
+                    # The store's circuit opened part way: its other search URLs would be skipped too
+                    self.metrics.inc('skipped_sites', host)
+                    errors.append(e)
+                    page_outcomes.append((template_name, None, 0))
+                    break
                     
                 except Exception as e:
                     print(f"Error searching {search_url}: {e}")
+                    self.metrics.inc('errors', host)
+                    errors.append(e)
+                    page_outcomes.append((template_name, None, 0))
                     continue
             
+            self._learn_site_profile(site_url, product_name, page_outcomes, probing, errors)
+            
+            return self._site_result(all_codes_found, pages_searched, evidence, errors)
+            
+        except Exception as e:
             return {
-                'codes_found': list(set(all_codes_found)),
-                'pages_searched': pages_searched,
-                'total_codes': len(set(all_codes_found))
+                'status': 'error',
+                'error': str(e),
+                'codes_found': [],
+                'pages_searched': []
             }
+    
+    async def _search_site_for_product_async(self, site_url: str, product_name: str, code_patterns: List[str],
+                                             fetch_plan: Optional[FetchPlan] = None) -> Dict[str, Any]:
+        """Search a specific site for product, fetching all candidate URLs concurrently"""
+        try:
+            host = HostRateLimiter.host_for(site_url)
+            try:
+                # A store that keeps failing is skipped until its cool-down passes
+                self.host_health.check(host)
+            except HostUnavailable as e:
+                self.metrics.inc('skipped_sites', host)
+                return self._site_result([], [], [], [e])
+            await self.fetch_engine.run_limited(self._check_robots, site_url)
+            
+            search_plan, probing = self._search_plan(site_url, product_name)
+            
+            scanned_pages = await asyncio.gather(
+                *(self._fetch_and_scan_async(search_url, code_patterns, site_url, product_name, fetch_plan)
+                  for _, search_url in search_plan)
+            )
+            
+            all_codes_found = []
+            pages_searched = []
+            page_outcomes = []
+            evidence = []
+            errors = []
+            
+            # Keep pages in the same order the sync search would report them
+            for (template_name, search_url), scanned in zip(search_plan, scanned_pages):
+                if isinstance(scanned, Exception):
+                    errors.append(scanned)
+                    page_outcomes.append((template_name, None, 0))
+                    continue
+                text_content, found_codes = scanned
+                all_codes_found.extend(found_codes)
+                page_evidence = collect_evidence(text_content, found_codes, site_url, search_url)
+                evidence.extend(page_evidence)
+                self._index_page(site_url, search_url, text_content, page_evidence)
+                pages_searched.append(search_url)
+                page_outcomes.append((template_name, text_content, len(found_codes)))
+            
+            self._learn_site_profile(site_url, product_name, page_outcomes, probing, errors)
+            
+            return self._site_result(all_codes_found, pages_searched, evidence, errors)
             
         except Exception as e:
             return {
+                'status': 'error',
                 'error': str(e),
                 'codes_found': [],
                 'pages_searched': []
             }
     
-    def _generate_search_urls(self, site_url: str, product_name: str) -> List[str]:
-        """Generate different search URL possibilities for a site"""
-        search_urls = []
-        encoded_name = quote_plus(product_name)
+    async def _fetch_and_scan_async(self, search_url: str, code_patterns: List[str], site_url: Optional[str] = None,
+                                    product_name: Optional[str] = None,
+                                    fetch_plan: Optional[FetchPlan] = None) -> Union[Tuple[str, List[CodeMatch]], Exception]:
+        """Fetch one search URL and extract its text and codes, returning the exception if the fetch failed"""
+        host = HostRateLimiter.host_for(search_url)
+        try:
+            if self.stream_pages:
+                # Chunks are read and scanned on the fetch worker thread
+                return await self.fetch_engine.fetch(
+                    search_url, functools.partial(self._stream_scan_page, code_patterns=code_patterns, wait=False)
+                )
+            
+            if fetch_plan is not None:
+                # Only the search that downloads a shared page waits for the host's token
+                content, _ = await self.fetch_engine.run_limited(self._read_page, search_url, fetch_plan, True)
+            else:
+                content = (await self.fetch_engine.fetch(search_url)).content
+            
+            structured = await self.fetch_engine.run_blocking(
+                self._scan_structured, content, code_patterns, host, site_url, product_name
+            )
+            if structured is not None:
+                return structured
+            
+            scan_key = tuple(code_patterns)
+            if fetch_plan is not None:
+                scanned = fetch_plan.scanned(search_url, scan_key)
+                if scanned is not None:
+                    return scanned
+            
+            with self.metrics.timed('parse', host):
+                text_content = await self.page_parser.text_async(content, self.fetch_engine.run_blocking)
+            with self.metrics.timed('extract', host):
+                found_codes = await self.fetch_engine.run_blocking(get_pattern_set(code_patterns).find_all, text_content)
+            
+            if fetch_plan is not None:
+                fetch_plan.keep_scan(search_url, scan_key, (text_content, found_codes))
+            return text_content, found_codes
+        except HostUnavailable as e:
+            self.metrics.inc('skipped_sites', host)
+            return e
+        except Exception as e:
+            print(f"Error searching {search_url}: {e}")
+            self.metrics.inc('errors', host)
+            return e
+    
+    def _search_plan(self, site_url: str, product_name: str) -> Tuple[List[Tuple[str, str]], bool]:
+        """
+        Return the (template name, URL) pairs to fetch for a site, and whether they probe every template
         
-        # Add the base site URL
-        search_urls.append(site_url)
+        Without site profiles this is the first max_search_urls guesses, as always.
+        """
+        if self.site_profiles is not None:
+            return self.site_profiles.search_plan(site_url, product_name)
         
-        # Try common search patterns
-        base_domain = f"{urlparse(site_url).scheme}://{urlparse(site_url).netloc}"
+        names = [name for name, _ in SEARCH_URL_TEMPLATES]
+        search_urls = self._generate_search_urls(site_url, product_name)
+        return list(zip(names, search_urls))[:self.max_search_urls], False
+    
+    def _learn_site_profile(self, site_url: str, product_name: str, page_outcomes: List[Tuple[str, Optional[str], int]],
+                            probing: bool, errors: Sequence[Exception] = ()):
+        """Feed the pages fetched for a site back into its search profile"""
+        if self.site_profiles is None:
+            return
+        # A store that could not be reached at all says nothing about its search templates
+        if all(text is None for _, text, _ in page_outcomes) and any(
+                isinstance(e, (HostUnavailable, requests.ConnectionError, requests.Timeout)) for e in errors):
+            return
+        self.site_profiles.learn(site_url, product_name, page_outcomes, probing)
+    
+    def _wait_for_host(self, url: str, host: str):
+        """Wait for the host's rate limiter token"""
+        delay = self.rate_limiter.wait(url)
+        if delay > 0:
+            self.metrics.inc('politeness_sleep_seconds', host, delay)
+    
+    def _read_page(self, url: str, fetch_plan: Optional[FetchPlan] = None,
+                   wait_for_token: bool = False) -> Tuple[bytes, bool]:
+        """
+        Return a page's body and whether this call downloaded it from the store
         
-        search_patterns = [
-            f"{site_url}?search={encoded_name}",
-            f"{site_url}?q={encoded_name}",
-            f"{base_domain}/search?q={encoded_name}",
-            f"{base_domain}/search/{encoded_name}",
-            f"{site_url}/{encoded_name}",
-        ]
+        False means the page cost the store nothing: it came from the response
+        cache or was shared through the fetch plan. wait_for_token=True waits
+        for the host's rate limiter token before a download (async mode, where
+        the engine's own wait is bypassed).
+        """
+        def download(page_url: str) -> requests.Response:
+            return self._fetch(page_url, wait=True if wait_for_token else None)
         
-        search_urls.extend(search_patterns)
+        if fetch_plan is None:
+            response, fetched = download(url), True
+        else:
+            response, fetched = fetch_plan.page(url, download)
+            if not fetched:
+                self.metrics.inc('shared_pages', HostRateLimiter.host_for(url))
+        return response.content, fetched and not getattr(response, 'from_cache', False)
+    
+    def _fetch(self, url: str, archive: bool = True, wait: Optional[bool] = None) -> requests.Response:
+        """
+        Fetch a URL with the shared session, raising for HTTP errors
         
-        return search_urls
+        archive=False keeps the response out of the page archive. wait says
+        whether to take the host's rate limiter token once the request turns
+        out to need the network: None when every request goes through the
+        limiter, False for callers that already took it.
+        """
+        host = HostRateLimiter.host_for(url)
+        response, fetch_seconds = self._get(url, host, wait=self._waits(wait))
+        self.metrics.observe('fetch', host, fetch_seconds)
+        
+        if getattr(response, 'from_cache', False):
+            self.metrics.inc('cache_hits', host)
+        elif getattr(response, 'revalidated', False):
+            # A 304: the store was asked, but the body is the stored one
+            self.metrics.inc('revalidated', host)
+        else:
+            self.metrics.inc('bytes_downloaded', host, len(response.content))
+            if archive:
+                self._archive_response(url, response, response.content)
+        
+        response.raise_for_status()
+        return response
     
-    def _extract_codes_from_text(self, text: str, code_patterns: List[str]) -> List[str]:
-        """Extract codes from text using provided patterns"""
-        found_codes = []
+    def _waits(self, wait: Optional[bool]) -> bool:
+        """Whether a fetch takes the host's rate limiter token itself (see _fetch)"""
+        return self.rate_limit_every_request if wait is None else wait
+    
+    def _get(self, url: str, host: str, stream: bool = False, wait: bool = False) -> Tuple[requests.Response, float]:
+        """
+        GET a URL under the host's health policy, returning the response and how long its request took
+        
+        A fresh response-cache entry is returned straight away: it neither
+        waits for nor counts against the host. Otherwise the rate limiter
+        token (with wait=True), the host's pacing interval and any Retry-After
+        hold are waited out first, and connection errors and retryable
+        statuses are retried with jittered backoff. Retries take a token too
+        whenever the limiter paces this validator's requests (a caller passing
+        wait=False took only the first).
+        Raises HostUnavailable while the host's circuit is open.
+        """
+        start = time.perf_counter()
+        cached = self._cached_response(url)
+        if cached is not None:
+            return cached, time.perf_counter() - start
         
-        for pattern in code_patterns:
+        # Every send takes a token once the limiter paces this fetch, retries included,
+        # so a shared limiter's per-host rate holds while a store is failing
+        paced = wait or self.rate_limit_every_request or self.async_fetch
+        attempt = 0
+        while True:
+            if wait if attempt == 0 else paced:
+                self._wait_for_host(url, host)
+            self.metrics.sleep(self.host_health.before_request(host), host)
+            self.metrics.inc('requests', host)
+            
+            start = time.perf_counter()
             try:
-                if pattern.startswith('regex:'):
-                    # Use as regex pattern
-                    regex_pattern = pattern[6:]  # Remove 'regex:' prefix
-                    matches = re.findall(regex_pattern, text, re.IGNORECASE)
-                    found_codes.extend(matches)
-                else:
-                    # Use as literal string search
-                    if pattern.lower() in text.lower():
-                        # Try to extract the code with some context
-                        # Look for alphanumeric codes near the pattern
-                        context_pattern = f"{re.escape(pattern)}.{{0,50}}([A-Z0-9]{{4,15}})"
-                        matches = re.findall(context_pattern, text, re.IGNORECASE)
-                        found_codes.extend(matches)
-                        
-                        # Also look for codes before the pattern
-                        reverse_pattern = f"([A-Z0-9]{{4,15}}).{{0,50}}{re.escape(pattern)}"
-                        matches = re.findall(reverse_pattern, text, re.IGNORECASE)
-                        found_codes.extend(matches)
-            except Exception as e:
-                print(f"Error processing pattern '{pattern}': {e}")
-                continue
+                response = self.session.get(url, timeout=self.timeout, stream=stream)
+            except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError) as e:
+                # A timeout has already cost the full timeout: it counts toward the circuit but is not retried
+                delay = None if isinstance(e, requests.Timeout) else self.host_health.retry_delay(attempt)
+                self.host_health.record(host, error=True, final=delay is None)
+                if delay is None:
+                    raise
+            except Exception:
+                # Too many redirects, a bad URL, a decode error: nothing about the host's
+                # health, but a probe request must still be resolved or the host stays skipped
+                self.host_health.record(host)
+                raise
+            else:
+                elapsed = time.perf_counter() - start
+                if getattr(response, 'from_cache', False):
+                    self.host_health.record(host)
+                    return response, elapsed
+                
+                retry_after = parse_retry_after(response.headers.get('Retry-After'))
+                delay = None
+                if response.status_code in RETRYABLE_STATUSES:
+                    delay = self.host_health.retry_delay(attempt, retry_after)
+                self.host_health.record(host, response.status_code, elapsed, retry_after, final=delay is None)
+                if delay is None:
+                    return response, elapsed
+                response.close()
+            
+            self.metrics.inc('retries', host)
+            if delay > 0:
+                time.sleep(delay)
+                self.metrics.inc('retry_sleep_seconds', host, delay)
+            attempt += 1
+    
+    def _cached_response(self, url: str, count: bool = True) -> Optional[requests.Response]:
+        """
+        Return the response cache's fresh entry for a URL, or None if the request must go to the network
+        
+        count=False only looks: the entry is not counted as a hit.
+        """
+        if self.response_cache is None:
+            return None
+        # The caching adapter stores responses under the prepared (normalized) URL
+        request = self.session.prepare_request(requests.Request('GET', url))
+        entry = self.response_cache.get(request.url)
+        if entry is None or not entry.is_fresh():
+            return None
+        if count:
+            self.response_cache.count('hits')
+        return build_cached_response(entry, request)
+    
+    def _is_cached(self, url: str) -> bool:
+        """Whether a GET of the URL would be answered by the response cache"""
+        return self._cached_response(url, count=False) is not None
+    
+    def _check_robots(self, site_url: str):
+        """Read a store's robots.txt, once per host, and pace the host by its Crawl-delay"""
+        host = HostRateLimiter.host_for(site_url)
+        if not self.host_health.should_check_robots(host):
+            return
+        try:
+            response = self._fetch(urljoin(site_url, '/robots.txt'), archive=False)
+        except Exception:
+            return
+        self.note_robots(site_url, response.text)
+    
+    def note_robots(self, site_url: str, robots_txt: str):
+        """Pace a store by the Crawl-delay in its robots.txt (for callers that read robots.txt themselves)"""
+        delay = parse_crawl_delay(robots_txt, self.session.headers.get('User-Agent', ''))
+        if delay is not None:
+            self.host_health.set_crawl_delay(HostRateLimiter.host_for(site_url), delay)
+    
+    def _archive_response(self, url: str, response: requests.Response, body: bytes, complete: bool = True):
+        """Add a fetched response to the page archive, if there is one"""
+        if self.page_archive is None:
+            return
+        try:
+            self.page_archive.append(url, response.status_code, response.headers, body, complete=complete)
+        except Exception as e:
+            print(f"Error archiving {url}: {e}")
+    
+    def _stream_scan_page(self, url: str, code_patterns: List[str], wait: Optional[bool] = None) -> Tuple[str, List[CodeMatch]]:
+        """
+        Fetch a page in chunks, scanning each chunk as it arrives
+        
+        Reading stops after max_page_bytes or once stop_condition is met, so
+        the text and codes returned cover the part of the page that was read.
+        wait is as for _fetch.
+        """
+        host = HostRateLimiter.host_for(url)
+        response, fetch_seconds = self._get(url, host, stream=True, wait=self._waits(wait))
+        parse_seconds = extract_seconds = 0.0
+        received = 0
+        
+        try:
+            response.raise_for_status()
+            
+            stream = self.page_parser.stream()
+            scanner = StreamScanner(code_patterns)
+            text_parts = []
+            chunks = response.iter_content(self.stream_chunk_size)
+            # The bytes read are archived too, marked incomplete if the rest was skipped
+            raw_chunks = [] if self.page_archive is not None else None
+            complete = False
+            
+            while True:
+                start = time.perf_counter()
+                chunk = next(chunks, None)
+                fetch_seconds += time.perf_counter() - start
+                if chunk is None:
+                    complete = True
+                    break
+                
+                chunk = chunk[:self.max_page_bytes - received]
+                received += len(chunk)
+                if raw_chunks is not None:
+                    raw_chunks.append(chunk)
+                
+                start = time.perf_counter()
+                text = stream.feed(chunk)
+                parse_seconds += time.perf_counter() - start
+                
+                start = time.perf_counter()
+                scanner.feed(text)
+                extract_seconds += time.perf_counter() - start
+                text_parts.append(text)
+                
+                if received >= self.max_page_bytes:
+                    self.metrics.inc('truncated_pages', host)
+                    break
+                if self.stop_condition is not None and self.stop_condition(scanner.matches):
+                    self.metrics.inc('early_stops', host)
+                    break
+            
+            stored = getattr(response, 'from_cache', False) or getattr(response, 'revalidated', False)
+            if raw_chunks is not None and not stored:
+                self._archive_response(url, response, b''.join(raw_chunks), complete)
+            
+            start = time.perf_counter()
+            text = stream.close()
+            parse_seconds += time.perf_counter() - start
+            
+            start = time.perf_counter()
+            scanner.feed(text)
+            scanner.finish()
+            extract_seconds += time.perf_counter() - start
+            text_parts.append(text)
+        finally:
+            # Closing an unfinished body drops its connection rather than reading the rest
+            response.close()
+            self.metrics.observe('fetch', host, fetch_seconds)
+            if getattr(response, 'from_cache', False):
+                self.metrics.inc('cache_hits', host)
+            elif getattr(response, 'revalidated', False):
+                self.metrics.inc('revalidated', host)
+            else:
+                self.metrics.inc('bytes_downloaded', host, received)
+        
+        self.metrics.observe('parse', host, parse_seconds)
+        self.metrics.observe('extract', host, extract_seconds)
+        return ''.join(text_parts), scanner.find_all()
+    
+    @contextmanager
+    def _report_scope(self, results: Dict[str, Any]) -> Iterator[None]:
+        """
+        Report the cache hits/misses and metrics of the enclosed search in its result dict
+        
+        They are counted for this call alone, so searches running at the same
+        time on validators sharing the cache and metrics do not leak into it.
+        """
+        with ExitStack() as stack:
+            cache_counts = stack.enter_context(self.response_cache.scope()) if self.response_cache is not None else None
+            call_metrics = stack.enter_context(self.metrics.scope()) if self.include_metrics else None
+            yield
+            if cache_counts is not None:
+                results['cache'] = dict(cache_counts)
+            if call_metrics is not None:
+                results['metrics'] = Metrics.summarize(call_metrics.snapshot())
+    
+    def _scan_structured(self, content: bytes, code_patterns: List[str], host: str = '', site_url: Optional[str] = None,
+                         product_name: Optional[str] = None) -> Optional[Tuple[str, List[CodeMatch]]]:
+        """Scan a page's structured data and selected elements, or return None if the full text must be scanned"""
+        selectors = self.site_selectors.get(host_key(site_url)) if site_url else None
+        if not self.structured_data and not selectors:
+            return None
+        
+        with self.metrics.timed('extract', host):
+            scanned = scan_structured(content, get_pattern_set(code_patterns), selectors, product_name, self.structured_data)
         
-        return found_codes
+        self.metrics.inc('structured_pages' if scanned is not None else 'full_text_pages', host)
+        return scanned
+    
+    def _scan_page(self, content: bytes, code_patterns: List[str], host: str = '', site_url: Optional[str] = None,
+                   product_name: Optional[str] = None, url: Optional[str] = None,
+                   fetch_plan: Optional[FetchPlan] = None) -> Tuple[str, List[CodeMatch]]:
+        """
+        Return the text of an HTML page and the codes (with the patterns that matched them) found in it
+        
+        With a fetch plan, the full-text scan of a shared page is done once for every product reading it.
+        """
+        structured = self._scan_structured(content, code_patterns, host, site_url, product_name)
+        if structured is not None:
+            return structured
+        
+        scan_key = tuple(code_patterns)
+        if fetch_plan is not None:
+            scanned = fetch_plan.scanned(url, scan_key)
+            if scanned is not None:
+                return scanned
+        
+        with self.metrics.timed('parse', host):
+            text_content = self.page_parser.text(content)
+        
+        with self.metrics.timed('extract', host):
+            found_codes = get_pattern_set(code_patterns).find_all(text_content)
+        
+        if fetch_plan is not None:
+            fetch_plan.keep_scan(url, scan_key, (text_content, found_codes))
+        return text_content, found_codes
+    
+    def _site_result(self, all_codes_found: List[CodeMatch], pages_searched: List[str],
+                     evidence: List[CodeEvidence], errors: Sequence[Exception] = ()) -> Dict[str, Any]:
+        """
+        Build the per-site result entry (the caller pops 'evidence' off once candidates are ranked)
+        
+        'status' tells an empty store apart from one that could not be searched:
+        'ok' (codes found), 'empty' (pages read, no codes), 'skipped' (the host's
+        circuit is open) or 'error' (every fetch failed; 'error' has the last message).
+        """
+        matched_patterns = {}
+        for match in all_codes_found:
+            matched_patterns.setdefault(match.code, match.pattern)
+        
+        if matched_patterns:
+            status = 'ok'
+        elif pages_searched or not errors:
+            status = 'empty'
+        elif all(isinstance(e, HostUnavailable) for e in errors):
+            status = 'skipped'
+        else:
+            status = 'error'
+        
+        result = {
+            'status': status,
+            'codes_found': list(matched_patterns),
+            'pages_searched': pages_searched,
+            'total_codes': len(matched_patterns),
+            'matched_patterns': matched_patterns,
+            'evidence': evidence
+        }
+        if status in ('skipped', 'error'):
+            result['error'] = str(errors[-1])
+        return result
+    
+    def _rank_found_codes(self, results: Dict[str, Any], product_name: str, evidence: List[CodeEvidence]):
+        """Add the ranked 'candidates' and the 'pruned_codes' (code -> reason) to a search result"""
+        if not self.prune_candidates:
+            return
+        candidates, pruned = rank_candidates(evidence, product_name, self.max_candidates)
+        results['candidates'] = candidates
+        results['pruned_codes'] = pruned
+    
+    def _index_page(self, site_url: str, page_url: str, text_content: str, page_evidence: List[CodeEvidence]):
+        """Add a fetched page to the page index, if there is one"""
+        if self.page_index is None:
+            return
+        try:
+            self.page_index.add_page(page_url, site_url, text_content, page_evidence)
+        except Exception as e:
+            print(f"Error indexing {page_url}: {e}")
+    
+    def fetch(self, url: str, wait: Optional[bool] = None) -> requests.Response:
+        """
+        Fetch a URL through the validator's session, response cache and metrics, raising for HTTP errors
+        
+        wait=True takes the host's rate limiter token if the request goes to the network.
+        """
+        return self._fetch(url, wait=wait)
+    
+    def index_catalog_page(self, site_url: str, page_url: str, code_patterns: List[str],
+                           lastmod: Optional[str] = None, wait: Optional[bool] = None) -> List[str]:
+        """
+        Fetch a product page found by a catalog crawl and add it to the page index
+        
+        Unlike the search path, errors are raised so the crawler can count them.
+        Returns the distinct codes found on the page. wait is as for fetch.
+        """
+        if self.page_index is None:
+            raise ValueError("Catalog pages can only be indexed by a validator with a page_index")
+        
+        host = HostRateLimiter.host_for(page_url)
+        response = self._fetch(page_url, wait=wait)
+        text_content, found_codes = self._scan_page(response.content, code_patterns, host, site_url)
+        page_evidence = collect_evidence(text_content, found_codes, site_url, page_url)
+        self.page_index.add_page(page_url, site_url, text_content, page_evidence, lastmod)
+        return list(dict.fromkeys(match.code for match in found_codes))
+    
+    def search_index(self, product_name: str, target_sites: Optional[List[str]] = None,
+                     code_patterns: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
+        """
+        Answer a code search from the page index, or return None if it does not cover the product
+        
+        The result has the same keys as search_product_codes_on_sites (with no
+        site_results) plus 'sources' (code -> page URLs) and 'from_index'.
+        """
+        if self.page_index is None:
+            return None
+        
+        with self.metrics.timed('index'):
+            indexed = self.page_index.lookup(product_name, target_sites, code_patterns, self.max_candidates)
+        if indexed is None:
+            self.metrics.inc('index_misses')
+            return None
+        
+        self.metrics.inc('index_hits')
+        indexed['site_results'] = {}
+        indexed['from_index'] = True
+        return indexed
+    
+    def codes_to_validate(self, site_search_result: Dict[str, Any]) -> List[str]:
+        """Return the codes from a site search that are worth a web validation query"""
+        if 'candidates' in site_search_result:
+            return [candidate['code'] for candidate in site_search_result['candidates']]
+        return site_search_result['found_codes']
+    
+    def _generate_search_urls(self, site_url: str, product_name: str) -> List[str]:
+        """Generate different search URL possibilities for a site"""
+        # The base site URL first, then common search patterns
+        return [expand_template(template, site_url, product_name) for _, template in SEARCH_URL_TEMPLATES]
+    
+    def _extract_codes_from_text(self, text: str, code_patterns: List[str]) -> List[str]:
+        """Extract codes from text using provided patterns"""
+        return get_pattern_set(code_patterns).extract(text)
     
     def web_search_validation(self, product_name: str, product_codes: List[str], min_matches: int = 3) -> Dict[str, Any]:
         """
@@ -178,62 +925,226 @@ class ProductValidator:
             'overall_validation': False
         }
         
-        validated_codes = []
+        with self._report_scope(validation_results):
+            # Answer from the validation store when it has a fresh outcome
+            stored_outcomes = {}
+            if self.validation_store is not None:
+                for code in product_codes:
+                    stored = self.validation_store.get(product_name, code)
+                    if stored is not None:
+                        stored_outcomes[code] = stored
+            
+            to_search = [code for code in dict.fromkeys(product_codes) if code not in stored_outcomes]
+            if self.batch_validation:
+                searched_outcomes = self._search_codes_batched(product_name, to_search, min_matches)
+            else:
+                searched_outcomes = {code: self._search_code(product_name, code) for code in to_search}
+            
+            # Failed searches are not remembered, so they are retried next time
+            if self.validation_store is not None:
+                for code, (matches_found, sample_sources, error) in searched_outcomes.items():
+                    if error is None:
+                        self.validation_store.put(product_name, code, matches_found, sample_sources)
+            
+            for code in product_codes:
+                stored = stored_outcomes.get(code)
+                error = None
+                if stored is not None:
+                    matches_found = stored['matches_found']
+                    sample_sources = stored['sample_sources']
+                else:
+                    matches_found, sample_sources, error = searched_outcomes[code]
+                
+                # A failed search says nothing about a code it found too few matches for
+                is_validated = matches_found >= min_matches
+                if error is not None and not is_validated:
+                    is_validated = None
+                
+                validation_results['codes_validated'][code] = {
+                    'matches_found': matches_found,
+                    'is_validated': is_validated,
+                    'sample_sources': sample_sources,
+                    'from_store': stored is not None
+                }
+                if error is not None:
+                    validation_results['codes_validated'][code]['error'] = error
+            
+            summarize_validation(validation_results)
+        
+        return validation_results
+    
+    def _search_code(self, product_name: str, code: str) -> Tuple[int, List[Dict[str, str]], Optional[str]]:
+        """Validate one code with its own query, returning (matches found, sample sources, error)"""
+        search_query = f'"{product_name}" "{code}"'
+        matches, error = self._search_web(search_query)
+        return len(matches), matches[:5], error  # Keep top 5 sources
+    
+    def _search_codes_batched(self, product_name: str, codes: List[str],
+                              min_matches: int) -> Dict[str, Tuple[int, List[Dict[str, str]], Optional[str]]]:
+        """
+        Validate codes several at a time with OR queries
         
-        for code in product_codes:
-            search_query = f'"{product_name}" "{code}"'
-            matches = self._search_web_for_matches(search_query)
+        Each result is credited to the codes its title, snippet or URL
+        mentions. A code is settled by the batch when it has min_matches
+        credited results, or when it would stay short even if every result that
+        mentions no code at all were its own; anything in between is ambiguous
+        and gets a single-code query.
+        """
+        outcomes = {}
+        for start in range(0, len(codes), self.validation_batch_size):
+            group = codes[start:start + self.validation_batch_size]
+            if len(group) == 1:
+                outcomes[group[0]] = self._search_code(product_name, group[0])
+                continue
             
-            validation_results['codes_validated'][code] = {
-                'matches_found': len(matches),
-                'is_validated': len(matches) >= min_matches,
-                'sample_sources': matches[:5]  # Keep top 5 sources
-            }
+            search_query = f'"{product_name}" (' + ' OR '.join(f'"{code}"' for code in group) + ')'
+            results, error = self._search_web_pages(search_query)
             
-            if len(matches) >= min_matches:
-                validated_codes.append(code)
+            credited = {code: [] for code in group}
+            unattributed = 0
+            patterns = {code: re.compile(r'(?<![0-9a-z])' + re.escape(code) + r'(?![0-9a-z])', re.IGNORECASE) for code in group}
+            for result in results:
+                text = f"{result.get('title', '')} {result.get('snippet', '')} {result.get('url', '')}"
+                mentioned = [code for code in group if patterns[code].search(text)]
+                for code in mentioned:
+                    credited[code].append(result)
+                if not mentioned:
+                    unattributed += 1
+            
+            for code in group:
+                count = len(credited[code])
+                if error is None and count < min_matches <= count + unattributed:
+                    self.metrics.inc('validation_fallbacks', HostRateLimiter.host_for(self.web_search_url))
+                    outcomes[code] = self._search_code(product_name, code)
+                else:
+                    outcomes[code] = (count, credited[code][:5], error)
         
-        validation_results['overall_validation'] = len(validated_codes) > 0
-        validation_results['validated_codes'] = validated_codes
+        return outcomes
+    
+    def _search_web_pages(self, query: str) -> Tuple[List[Dict[str, str]], Optional[str]]:
+        """Search the web reading up to web_search_pages result pages, returning the results and any error"""
+        results = []
+        seen_urls = set()
         
-        return validation_results
+        for page in range(self.web_search_pages):
+            page_results, error = self._search_web(query, offset=page * self.web_search_page_size,
+                                                   limit=self.web_search_page_size)
+            if error is not None:
+                return results, error
+            
+            new_results = [result for result in page_results if result.get('url') not in seen_urls]
+            seen_urls.update(result.get('url') for result in new_results)
+            results.extend(new_results)
+            
+            # A short page (or one that only repeats earlier results) is the last one
+            if len(page_results) < self.web_search_page_size or not new_results:
+                break
+        
+        return results, None
     
     def _search_web_for_matches(self, query: str) -> List[Dict[str, str]]:
         """
         Search the web for matches (using DuckDuckGo as example)
         Note: In production, you'd want to use proper search APIs
+        
+        Raises RuntimeError if the search failed, so that it is not mistaken for a search with no matches.
+        """
+        matches, error = self._search_web(query)
+        if error is not None:
+            raise RuntimeError(f"Web search failed: {error}")
+        return matches
+    
+    def _search_web(self, query: str, offset: int = 0, limit: int = 10) -> Tuple[List[Dict[str, str]], Optional[str]]:
+        """
+        Search the web for matches, returning the matches and an error message if the search failed
+        
+        offset skips that many results (a later result page); limit caps the results read from the page.
         """
         matches = []
+        error = None
         
         try:
             # Using DuckDuckGo for web search
-            search_url = f"https://duckduckgo.com/html/?q={quote_plus(query)}"
-            
-            response = self.session.get(search_url, timeout=10)
-            response.raise_for_status()
+            search_url = self.web_search_url.format(query=quote_plus(query))
+            if offset:
+                search_url += self.web_search_page_param.format(offset=offset)
+            host = HostRateLimiter.host_for(search_url)
             
-            soup = BeautifulSoup(response.content, 'html.parser')
-            
-            # Extract search results
-            result_divs = soup.find_all('div', {'class': 'result'})
-            
-            for div in result_divs[:10]:  # Limit to top 10 results
-                title_elem = div.find('a', {'class': 'result__a'})
-                snippet_elem = div.find('div', {'class': 'result__snippet'})
+            # The validate stage is the whole search; its fetch and parse are also timed on their own
+            with self.metrics.timed('validate', host):
+                response = self._fetch(search_url, archive=False)
                 
-                if title_elem and snippet_elem:
-                    matches.append({
-                        'title': title_elem.get_text().strip(),
-                        'url': title_elem.get('href', ''),
-                        'snippet': snippet_elem.get_text().strip()
-                    })
+                # Extract search results (top 10 unless asked for more)
+                with self.metrics.timed('parse', host):
+                    matches = self.page_parser.search_results(response.content, limit=limit)
             
-            time.sleep(2)  # Be respectful with requests
+            # Be respectful with requests (a cached result page was not one)
+            if not self.rate_limit_every_request and not getattr(response, 'from_cache', False):
+                self.metrics.sleep(self.web_search_delay, host)
             
         except Exception as e:
             print(f"Web search error: {e}")
+            self.metrics.inc('errors', HostRateLimiter.host_for(self.web_search_url))
+            error = str(e)
         
-        return matches
+        return matches, error
+    
+    def process_product(self, product_name: str, target_sites: List[str], code_patterns: List[str], min_matches: int = 3) -> Dict[str, Any]:
+        """
+        Run one product through the complete pipeline: search sites for codes, then validate them on the web
+        
+        Args:
+            product_name: Name of the product
+            target_sites: List of URLs to search
+            code_patterns: List of regex patterns or specific sequences to find
+            min_matches: Minimum number of web matches required
+        """
+        # Step 1: Search sites for codes
+        site_search_result = self.search_product_codes_on_sites(product_name, target_sites, code_patterns)
+        
+        # Step 2: Validate the plausible codes on the web
+        codes = self.codes_to_validate(site_search_result)
+        validation_result = self.validate_found_codes(product_name, site_search_result, codes, min_matches)
+        
+        # Combine results
+        return {
+            'product_name': product_name,
+            'site_search': site_search_result,
+            'web_validation': validation_result
+        }
+    
+    def validate_found_codes(self, product_name: str, site_search_result: Dict[str, Any], codes: List[str],
+                             min_matches: int = 3) -> Dict[str, Any]:
+        """
+        Validate the codes picked from a site search on the web (step 2 of process_product)
+        
+        Args:
+            product_name: Name of the product
+            site_search_result: What search_product_codes_on_sites returned for it
+            codes: The codes to validate, usually codes_to_validate(site_search_result)
+            min_matches: Minimum number of web matches required
+        """
+        if codes:
+            return self.web_search_validation(product_name, codes, min_matches)
+        
+        # No codes because no store could be searched is not the same as stores without the product
+        site_statuses = [site.get('status') for site in site_search_result.get('site_results', {}).values()]
+        if site_statuses and all(status in ('skipped', 'error') for status in site_statuses):
+            return {
+                'product_name': product_name,
+                'codes_validated': {},
+                'overall_validation': None,
+                'status': 'error',
+                'message': 'No target site could be searched'
+            }
+        
+        return {
+            'product_name': product_name,
+            'codes_validated': {},
+            'overall_validation': False,
+            'status': 'not_validated',
+            'message': 'No codes found on target sites' if not site_search_result['found_codes'] else 'No plausible codes found on target sites'
+        }
     
     def search_with_defaults(self, product_name: str, target_sites: List[str] = None, code_patterns: List[str] = None) -> Dict[str, Any]:
         """
@@ -247,11 +1158,41 @@ class ProductValidator:
         sites_to_use = target_sites if target_sites is not None else self.default_sites
         patterns_to_use = code_patterns if code_patterns is not None else self.default_code_patterns
         
+        # Earlier scrapes may already cover the product
+        indexed = self.search_index(product_name, sites_to_use, patterns_to_use)
+        if indexed is not None:
+            return indexed
+        
         return self.search_product_codes_on_sites(product_name, sites_to_use, patterns_to_use)
         
 
+def summarize_validation(validation_results: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Fill in a validation result's overall fields from its 'codes_validated' entries
+    
+    'overall_validation' is True if any code validated, False if every code was
+    checked and none did, and None if that is unknown because a web search
+    failed ('status' is then 'error').
+    """
+    entries = validation_results['codes_validated']
+    validated_codes = [code for code, entry in entries.items() if entry['is_validated']]
+    errored_codes = [code for code, entry in entries.items() if entry['is_validated'] is None]
+    
+    if validated_codes:
+        validation_results['overall_validation'] = True
+        validation_results['status'] = 'validated'
+    elif errored_codes:
+        validation_results['overall_validation'] = None
+        validation_results['status'] = 'error'
+        validation_results['error'] = f"Web search failed for {len(errored_codes)} of {len(entries)} codes"
+    else:
+        validation_results['overall_validation'] = False
+        validation_results['status'] = 'not_validated'
+    validation_results['validated_codes'] = validated_codes
+    return validation_results
+
 # Agent Functions
-def search_sites_for_codes(product_name: str, target_sites: str, code_patterns: str) -> str:
+def search_sites_for_codes(product_name: str, target_sites: str, code_patterns: str, detail: str = "summary") -> str:
     """
     Search target sites for product codes
     
@@ -259,18 +1200,22 @@ def search_sites_for_codes(product_name: str, target_sites: str, code_patterns:
         product_name: Name of the product to search for
         target_sites: Comma-separated list of URLs to search
         code_patterns: Comma-separated list of patterns to search for
+        detail: "summary" (the default) for a compact result with a handle for get_result_details, or "full"
     """
-    validator = ProductValidator()
-    
     # Parse inputs
     sites_list = [site.strip() for site in target_sites.split(',')]
     patterns_list = [pattern.strip() for pattern in code_patterns.split(',')]
     
-    result = validator.search_product_codes_on_sites(product_name, sites_list, patterns_list)
+    with shared_pool().validator() as validator:
+        result = validator.search_index(product_name, sites_list, patterns_list)
+        if result is None:
+            result = validator.search_product_codes_on_sites(product_name, sites_list, patterns_list)
     
-    return json.dumps(result, indent=2)
+    if detail == "full":
+        return json.dumps(result, indent=2)
+    return summary_payload(result, compact_search(result))
 
-def validate_codes_on_web(product_name: str, product_codes: str, min_matches: int = 3) -> str:
+def validate_codes_on_web(product_name: str, product_codes: str, min_matches: int = 3, detail: str = "summary") -> str:
     """
     Validate product codes by searching the web for matches
     
@@ -278,17 +1223,20 @@ def validate_codes_on_web(product_name: str, product_codes: str, min_matches: in
         product_name: Name of the product
         product_codes: Comma-separated list of codes to validate
         min_matches: Minimum number of web matches required
+        detail: "summary" (the default) for a compact result with a handle for get_result_details, or "full"
     """
-    validator = ProductValidator()
-    
     # Parse codes
     codes_list = [code.strip() for code in product_codes.split(',')]
     
-    result = validator.web_search_validation(product_name, codes_list, min_matches)
+    with shared_pool().validator() as validator:
+        result = validator.web_search_validation(product_name, codes_list, min_matches)
     
-    return json.dumps(result, indent=2)
+    if detail == "full":
+        return json.dumps(result, indent=2)
+    return summary_payload(result, compact_validation(result))
 
-def process_product_list(product_list: str, target_sites: str, code_patterns: str, min_matches: int = 3) -> str:
+def process_product_list(product_list: str, target_sites: str, code_patterns: str, min_matches: int = 3,
+                         detail: str = "summary") -> str:
     """
     Process a list of products through the complete validation pipeline
     
@@ -297,49 +1245,32 @@ def process_product_list(product_list: str, target_sites: str, code_patterns: st
         target_sites: Comma-separated list of URLs to search
         code_patterns: Comma-separated list of patterns to search for
         min_matches: Minimum number of web matches required
+        detail: "summary" (the default) for a compact result with a handle for get_result_details, or "full"
     """
-    validator = ProductValidator()
-    
     # Parse inputs
     products = [product.strip() for product in product_list.split('\n') if product.strip()]
     sites_list = [site.strip() for site in target_sites.split(',')]
     patterns_list = [pattern.strip() for pattern in code_patterns.split(',')]
     
-    results = []
+    # Every store page the list needs is downloaded once, however many products read it
+    pool = shared_pool()
+    with pool.validator() as validator:
+        fetch_plan = FetchPlan.build(validator, products, sites_list)
     
-    for product_name in products:
-        print(f"Processing: {product_name}")
-        
-        # Step 1: Search sites for codes
-        site_search_result = validator.search_product_codes_on_sites(product_name, sites_list, patterns_list)
-        
-        # Step 2: Validate found codes on the web
-        if site_search_result['found_codes']:
-            validation_result = validator.web_search_validation(
-                product_name, 
-                site_search_result['found_codes'], 
-                min_matches
-            )
-        else:
-            validation_result = {
-                'product_name': product_name,
-                'codes_validated': {},
-                'overall_validation': False,
-                'message': 'No codes found on target sites'
-            }
-        
-        # Combine results
-        combined_result = {
-            'product_name': product_name,
-            'site_search': site_search_result,
-            'web_validation': validation_result
-        }
-        
-        results.append(combined_result)
+    # Scraping, pruning and validation of different products overlap; results keep the input order.
+    # Every worker needs a validator of its own for the stages to actually overlap
+    pipeline = ProductPipeline(pool, sites_list, patterns_list, min_matches, fetch_plan=fetch_plan)
+    pool.reserve(pipeline.validators_needed)
+    results = list(pipeline.run(products))
+    fetch_plan.record(pool.metrics)
     
-    return json.dumps(results, indent=2)
+    if detail == "full":
+        return json.dumps(results, indent=2)
+    # Product i's full result is at path "i" of the handle
+    return summary_payload(results, {'products': [compact_product(result) for result in results]})
 
-def search_with_default_settings(product_name: str, additional_sites: str = "", additional_patterns: str = "") -> str:
+def search_with_default_settings(product_name: str, additional_sites: str = "", additional_patterns: str = "",
+                                 detail: str = "summary") -> str:
     """
     Search for product codes using built-in default sites and patterns
     
@@ -347,62 +1278,107 @@ def search_with_default_settings(product_name: str, additional_sites: str = "",
         product_name: Name of the product to search for
         additional_sites: Optional comma-separated additional sites to add to defaults
         additional_patterns: Optional comma-separated additional patterns to add to defaults
+        detail: "summary" (the default) for a compact result with a handle for get_result_details, or "full"
     """
-    validator = ProductValidator()
-    
-    # Use defaults, but add any additional sites/patterns if provided
-    sites_to_use = validator.default_sites.copy()
-    patterns_to_use = validator.default_code_patterns.copy()
-    
-    # Parse and add additional inputs
-    if additional_sites.strip():
-        extra_sites = [site.strip() for site in additional_sites.split(',') if site.strip()]
-        sites_to_use.extend(extra_sites)
+    with shared_pool().validator() as validator:
+        # Use defaults, but add any additional sites/patterns if provided
+        sites_to_use = validator.default_sites.copy()
+        patterns_to_use = validator.default_code_patterns.copy()
         
-    if additional_patterns.strip():
-        extra_patterns = [pattern.strip() for pattern in additional_patterns.split(',') if pattern.strip()]
-        patterns_to_use.extend(extra_patterns)
+        # Parse and add additional inputs
+        if additional_sites.strip():
+            extra_sites = [site.strip() for site in additional_sites.split(',') if site.strip()]
+            sites_to_use.extend(extra_sites)
+            
+        if additional_patterns.strip():
+            extra_patterns = [pattern.strip() for pattern in additional_patterns.split(',') if pattern.strip()]
+            patterns_to_use.extend(extra_patterns)
+        
+        result = validator.search_with_defaults(product_name, sites_to_use, patterns_to_use)
     
-    result = validator.search_product_codes_on_sites(product_name, sites_to_use, patterns_to_use)
+    if detail == "full":
+        return json.dumps(result, indent=2)
+    return summary_payload(result, compact_search(result))
+
+def get_result_details(handle: str, path: str = "", offset: int = 0, limit: int = 10) -> str:
+    """
+    Read part of a full result that a summary's handle points at, one page at a time
     
-    return json.dumps(result, indent=2)
+    Args:
+        handle: The handle from a summary result, e.g. "r3"
+        path: Keys and list indexes separated by '/', e.g. "site_results", "codes_validated/10-13/sample_sources"
+            or, for a product list, "0/web_validation" (empty for the top level)
+        offset: Index of the first item of the page
+        limit: Number of items per page
+    """
+    try:
+        return to_json(get_details(handle, path, max(0, offset), max(1, limit)))
+    except KeyError as e:
+        return to_json({'error': e.args[0]})
+
+# The agents are built on first access (module __getattr__), so that importing
+# the scraping core does not pull in swarm and the OpenAI client
+AGENT_NAMES = ('site_scraper_agent', 'web_validator_agent', 'product_processor_agent')
 
-# Create the agents
-site_scraper_agent = Agent(
-    name="Site Scraper",
-    instructions="""You are a site scraping specialist. You search specific websites for products and extract product codes based on provided patterns. You can:
+def _build_agents() -> Dict[str, Any]:
+    """Create the Swarm agents"""
+    from swarm import Agent
+    
+    site_scraper_agent = Agent(
+        name="Site Scraper",
+        instructions="""You are a site scraping specialist. You search specific websites for products and extract product codes based on provided patterns. You can:
     - Search multiple sites for product information
     - Extract codes using regex patterns or text sequences
     - Handle different site structures and search methods
     - Return structured results with found codes
-    - Use built-in default settings for common SKU patterns (XX-XX, XXX-XX, etc.) and barcodes starting with 501192191""",
-    functions=[search_sites_for_codes, search_with_default_settings]
-)
+    - Use built-in default settings for common SKU patterns (XX-XX, XXX-XX, etc.) and barcodes starting with 501192191
+    - Tool results are compact summaries with a handle; use get_result_details with it when you need pages searched, match sources or other details""",
+        functions=[search_sites_for_codes, search_with_default_settings, get_result_details]
+    )
 
-web_validator_agent = Agent(
-    name="Web Validator", 
-    instructions="""You validate product codes by searching the web for matches. You can:
+    web_validator_agent = Agent(
+        name="Web Validator", 
+        instructions="""You validate product codes by searching the web for matches. You can:
     - Search the web for product name + code combinations
     - Count the number of matches found
     - Determine if codes meet minimum validation thresholds
-    - Provide source information for validation""",
-    functions=[validate_codes_on_web]
-)
+    - Provide source information for validation
+    - Tool results are compact summaries with a handle; use get_result_details with it when you need pages searched, match sources or other details""",
+        functions=[validate_codes_on_web, get_result_details]
+    )
 
-product_processor_agent = Agent(
-    name="Product Processor",
-    instructions="""You are a product processing orchestrator. You manage the complete product validation pipeline by:
+    product_processor_agent = Agent(
+        name="Product Processor",
+        instructions="""You are a product processing orchestrator. You manage the complete product validation pipeline by:
     - Processing lists of product names
     - Coordinating site scraping and web validation
     - Providing comprehensive reports on product code validation
     - Managing the workflow between different validation steps
-    - Using built-in default SKU patterns and barcode formats when no specific patterns are provided""",
-    functions=[process_product_list, search_sites_for_codes, search_with_default_settings, validate_codes_on_web]
-)
+    - Using built-in default SKU patterns and barcode formats when no specific patterns are provided
+    - Tool results are compact summaries with a handle; use get_result_details with it when you need pages searched, match sources or other details""",
+        functions=[process_product_list, search_sites_for_codes, search_with_default_settings, validate_codes_on_web,
+                   get_result_details]
+    )
+    
+    return {
+        'site_scraper_agent': site_scraper_agent,
+        'web_validator_agent': web_validator_agent,
+        'product_processor_agent': product_processor_agent
+    }
+
+def __getattr__(name: str) -> Any:
+    if name in AGENT_NAMES:
+        agents = _build_agents()
+        globals().update(agents)
+        return agents[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 if __name__ == "__main__":
+    from swarm import Swarm
+    
     # Example usage
     client = Swarm()
+    product_processor_agent = _build_agents()['product_processor_agent']
     
     # Set your OpenAI API key
     # os.environ["OPENAI_API_KEY"] = "your-api-key-here"
@@ -0,0 +1,172 @@
+"""
+Politeness rate limiting for outbound requests
+"""
+
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Tuple
+from urllib.parse import urlparse
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket
+
+    Callers reserve a token and are told how long to wait before using it, so
+    the same bucket can be shared by blocking threads and asyncio tasks.
+    Reservations may drive the balance negative, which queues callers in order.
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        """
+        Args:
+            rate: Tokens added per second (<= 0 disables limiting)
+            burst: Maximum number of tokens that can be saved up
+        """
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """Take one token and return the number of seconds to wait before using it"""
+        if self.rate <= 0:
+            return 0.0
+
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+    def acquire(self) -> float:
+        """Block until a token is available, returning the time spent waiting"""
+        delay = self.reserve()
+        if delay > 0:
+            time.sleep(delay)
+        return delay
+
+    async def acquire_async(self) -> float:
+        """Await a token without blocking the event loop"""
+        delay = self.reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        return delay
+
+
+class HostRateLimiter:
+    """One token bucket per host, created on first use"""
+
+    def __init__(self, rate: float = 1.0, burst: int = 1):
+        """
+        Args:
+            rate: Default requests per second allowed for each host
+            burst: Default burst size for each host
+        """
+        self.rate = rate
+        self.burst = burst
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def host_for(url: str) -> str:
+        """Return the host key used for rate limiting a URL"""
+        return urlparse(url).netloc.lower()
+
+    def set_rate(self, host: str, rate: float, burst: int = None):
+        """Override the rate for a single host"""
+        with self._lock:
+            self._buckets[host] = TokenBucket(rate, burst if burst is not None else self.burst)
+
+    def bucket(self, host: str) -> TokenBucket:
+        """Return the bucket for a host"""
+        with self._lock:
+            bucket = self._buckets.get(host)
+            if bucket is None:
+                bucket = TokenBucket(self.rate, self.burst)
+                self._buckets[host] = bucket
+            return bucket
+
+    def reserve(self, host: str) -> float:
+        """Reserve a request slot for a host and return the wait in seconds"""
+        return self.bucket(host).reserve()
+
+    def wait(self, url: str) -> float:
+        """Block until a request to this URL's host is allowed"""
+        delay = self.reserve(self.host_for(url))
+        if delay > 0:
+            time.sleep(delay)
+        return delay
+
+    async def wait_async(self, url: str) -> float:
+        """Await until a request to this URL's host is allowed"""
+        delay = self.reserve(self.host_for(url))
+        if delay > 0:
+            await asyncio.sleep(delay)
+        return delay
+
+
+class SharedHostRateLimiter(HostRateLimiter):
+    """
+    Per-host rate limits shared by every process using the same SQLite file
+
+    Each host has a theoretical arrival time (GCRA): a request is allowed once
+    the clock is within burst - 1 intervals of it, and each request pushes it
+    one interval further. The arrival times live in the database, updated
+    inside an immediate transaction, so workers in different processes (or on
+    hosts sharing the file over a filesystem with working locks) queue behind
+    each other instead of each sending at the full rate. Wall-clock time is
+    used, since it is the one clock the processes share.
+    """
+
+    def __init__(self, path: str, rate: float = 1.0, burst: int = 1):
+        """
+        Args:
+            path: SQLite file holding the per-host state (may be shared with a JobQueue)
+            rate: Default requests per second allowed for each host, across all processes
+            burst: Default burst size for each host
+        """
+        super().__init__(rate, burst)
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._rates: Dict[str, Tuple[float, int]] = {}
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('CREATE TABLE IF NOT EXISTS host_slots (host TEXT PRIMARY KEY, tat REAL NOT NULL)')
+
+    def set_rate(self, host: str, rate: float, burst: int = None):
+        """Override the rate for a single host (in this process; give every process the same overrides)"""
+        with self._lock:
+            self._rates[host] = (rate, burst if burst is not None else self.burst)
+
+    def reserve(self, host: str) -> float:
+        """Reserve a request slot for a host and return the wait in seconds"""
+        rate, burst = self._rates.get(host, (self.rate, self.burst))
+        if rate <= 0:
+            return 0.0
+        interval = 1.0 / rate
+
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                row = self._conn.execute('SELECT tat FROM host_slots WHERE host = ?', (host,)).fetchone()
+                now = time.time()
+                tat = max(row[0], now) if row is not None else now
+                allowed = max(now, tat - (max(1, burst) - 1) * interval)
+                self._conn.execute('INSERT OR REPLACE INTO host_slots (host, tat) VALUES (?, ?)', (host, tat + interval))
+                self._conn.execute('COMMIT')
+            except BaseException:
+                self._conn.execute('ROLLBACK')
+                raise
+        return allowed - now
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
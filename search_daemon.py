@@ -0,0 +1,193 @@
+"""
+Warm search daemon for interactive_search.py
+
+A one-shot `python interactive_search.py "product"` has to import the
+scraping stack, open a fresh HTTP session and start with empty in-memory
+caches every time. The daemon does that once and then answers searches over a
+Unix socket, keeping the shared ValidatorPool (its keep-alive connections,
+response cache, validation store, page index and host health) warm between
+runs:
+
+    python interactive_search.py --serve &      # or --serve --idle-timeout 1800
+    python interactive_search.py "Space Marine Captain"
+    python interactive_search.py --stop
+
+The protocol is one JSON object per connection in each direction, newline
+terminated: {"command": "search", "product_name": ..., "additional_sites":
+..., "additional_patterns": ...} is answered with {"result": <the JSON string
+search_with_default_settings returns>} or {"error": ...}; "ping" and "stop"
+are answered with {"ok": true, "pid": ...}.
+
+The client half only imports the standard library, so a CLI that finds the
+daemon running never loads requests or the parsers.
+"""
+
+import importlib
+import json
+import os
+import signal
+import socket
+import socketserver
+import sys
+import threading
+import time
+from typing import Any, Dict, Optional
+
+DEFAULT_SOCKET_PATH = os.path.join(".cache", "search.sock")
+
+# Longest request line accepted (a product name plus extra sites and patterns)
+MAX_REQUEST_BYTES = 64 * 1024
+
+
+class _SearchHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        self.server.touch()
+        try:
+            request = json.loads(self.rfile.readline(MAX_REQUEST_BYTES))
+            reply = self.server.dispatch(request)
+        except Exception as e:
+            reply = {'error': str(e)}
+        self.wfile.write(json.dumps(reply).encode('utf-8') + b'\n')
+        self.server.touch()
+
+
+class SearchServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Unix socket server answering searches from the process-wide validator pool"""
+
+    daemon_threads = True
+
+    def __init__(self, socket_path: str):
+        super().__init__(socket_path, _SearchHandler)
+        # Only the user running the daemon may talk to it
+        os.chmod(socket_path, 0o600)
+        self.socket_path = socket_path
+        self.last_request = time.monotonic()
+        self.searches = 0
+
+    def touch(self):
+        self.last_request = time.monotonic()
+
+    def dispatch(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        command = request.get('command', 'search')
+        if command == 'ping':
+            return {'ok': True, 'pid': os.getpid(), 'searches': self.searches}
+        if command == 'stop':
+            # shutdown() waits for serve_forever to return, so it cannot run on the serving thread
+            threading.Thread(target=self.shutdown, name='search-daemon-stop').start()
+            return {'ok': True, 'pid': os.getpid()}
+        if command == 'search':
+            from product_validator import search_with_default_settings
+
+            product_name = str(request.get('product_name') or '').strip()
+            if not product_name:
+                return {'error': 'product_name is required'}
+            result = search_with_default_settings(product_name, request.get('additional_sites') or '',
+                                                  request.get('additional_patterns') or '', detail="full")
+            self.searches += 1
+            return {'result': result}
+        return {'error': f"Unknown command: {command}"}
+
+
+def request(message: Dict[str, Any], socket_path: str = DEFAULT_SOCKET_PATH,
+            timeout: Optional[float] = 600) -> Optional[Dict[str, Any]]:
+    """Send one request to the daemon and return its reply, or None if no daemon is listening"""
+    if not hasattr(socket, 'AF_UNIX'):
+        return None
+
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    client.settimeout(timeout)
+    try:
+        try:
+            client.connect(socket_path)
+        except (FileNotFoundError, ConnectionRefusedError):
+            return None
+        client.sendall(json.dumps(message).encode('utf-8') + b'\n')
+        chunks = []
+        while True:
+            chunk = client.recv(65536)
+            if not chunk:
+                break
+            chunks.append(chunk)
+    finally:
+        client.close()
+    return json.loads(b''.join(chunks))
+
+
+def search(product_name: str, additional_sites: str = "", additional_patterns: str = "",
+           socket_path: str = DEFAULT_SOCKET_PATH) -> Optional[str]:
+    """
+    Run search_with_default_settings in the daemon
+
+    Returns:
+        The result JSON string, or None if no daemon is running (search in-process instead)
+
+    Raises:
+        RuntimeError: If the daemon answered with an error
+    """
+    reply = request({'command': 'search', 'product_name': product_name, 'additional_sites': additional_sites,
+                     'additional_patterns': additional_patterns}, socket_path)
+    if reply is None:
+        return None
+    if 'error' in reply:
+        raise RuntimeError(reply['error'])
+    return reply['result']
+
+
+def is_running(socket_path: str = DEFAULT_SOCKET_PATH) -> bool:
+    """Whether a daemon is answering on the socket"""
+    try:
+        return request({'command': 'ping'}, socket_path, timeout=5) is not None
+    except (OSError, ValueError):
+        return False
+
+
+def stop(socket_path: str = DEFAULT_SOCKET_PATH) -> bool:
+    """Ask the daemon to exit; False if none was running"""
+    return request({'command': 'stop'}, socket_path, timeout=5) is not None
+
+
+def serve(socket_path: str = DEFAULT_SOCKET_PATH, idle_timeout: Optional[float] = None, **pool_kwargs):
+    """
+    Run the daemon until it is stopped, signalled or idle for idle_timeout seconds
+
+    Args:
+        socket_path: Unix socket to listen on (a stale one left by a dead daemon is replaced)
+        idle_timeout: Exit after this many seconds without a request (never if None)
+        pool_kwargs: Passed to configure_shared_pool (page_index, response_cache, ...)
+    """
+    if is_running(socket_path):
+        raise RuntimeError(f"A search daemon is already listening on {socket_path}")
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+    os.makedirs(os.path.dirname(os.path.abspath(socket_path)), exist_ok=True)
+
+    # Pay for the imports and the pool before the first request, not during it
+    from validator_pool import close_shared_pool, configure_shared_pool
+    # Loaded for its import cost only; requests use it through the pool
+    importlib.import_module('product_validator')
+
+    configure_shared_pool(**pool_kwargs)
+    server = SearchServer(socket_path)
+
+    if idle_timeout:
+        def watch_idle():
+            while True:
+                time.sleep(min(idle_timeout, 5))
+                if time.monotonic() - server.last_request >= idle_timeout:
+                    server.shutdown()
+                    return
+
+        threading.Thread(target=watch_idle, name='search-daemon-idle', daemon=True).start()
+
+    # SIGTERM unwinds serve_forever like Ctrl-C, so the socket file is removed either way
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    print(f"Search daemon {os.getpid()} listening on {socket_path}", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        close_shared_pool()
@@ -0,0 +1,189 @@
+"""
+Learned per-site search profiles
+
+ProductValidator guesses several search URL templates for every site. The
+first time a host is searched with a SiteProfiles store attached, every
+template is fetched once and scored; the best one is saved to a JSON file and
+later searches on that host fetch only that template. A profile is re-probed
+when it gets old or when its template stops working.
+"""
+
+import json
+import os
+import re
+import threading
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+from urllib.parse import quote_plus, urlparse
+
+from validation_store import normalize_product_name
+
+# (name, template) pairs, in the order the validator has always tried them.
+# {site_url} is the site as configured, {base} its scheme://host, {query} the
+# URL-encoded product name.
+SEARCH_URL_TEMPLATES = [
+    ('homepage', '{site_url}'),
+    ('search_param', '{site_url}?search={query}'),
+    ('q_param', '{site_url}?q={query}'),
+    ('search_path_q', '{base}/search?q={query}'),
+    ('search_path', '{base}/search/{query}'),
+    ('name_path', '{site_url}/{query}'),
+]
+
+# Pages whose word sets overlap the homepage's this much ignored the query
+SAME_AS_HOMEPAGE = 0.95
+
+_WORD = re.compile(r'[0-9a-z]+')
+
+
+def host_key(site_url: str) -> str:
+    """Return the key a site's profile is stored under"""
+    return urlparse(site_url).netloc.lower()
+
+
+def expand_template(template: str, site_url: str, product_name: str) -> str:
+    """Fill in a search URL template for a site and product"""
+    parsed = urlparse(site_url)
+    return template.format(
+        site_url=site_url,
+        base=f"{parsed.scheme}://{parsed.netloc}",
+        query=quote_plus(product_name)
+    )
+
+
+def _word_set(text: str) -> set:
+    return set(_WORD.findall(text.lower()))
+
+
+def _overlap(a: set, b: set) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def score_pages(product_name: str, pages: Sequence[Tuple[str, Optional[str], int]]) -> Dict[str, float]:
+    """
+    Score how well each template's page looks like real search results
+
+    Args:
+        product_name: The product that was searched for
+        pages: (template name, page text or None if the fetch failed, code matches on the page)
+
+    A failed fetch scores -1. A page that is the homepage in disguise (the
+    site ignored the query) scores 0. Otherwise the score is code pattern hits
+    plus product-name word hits per KB of text, so dense result pages beat
+    large pages that mention the product once.
+    """
+    tokens = [token for token in normalize_product_name(product_name).split() if len(token) >= 3]
+    homepage_words = None
+    for name, text, _ in pages:
+        if name == 'homepage' and text is not None:
+            homepage_words = _word_set(text)
+
+    scores = {}
+    for name, text, code_hits in pages:
+        if text is None:
+            scores[name] = -1.0
+            continue
+
+        if name != 'homepage' and homepage_words is not None and _overlap(_word_set(text), homepage_words) >= SAME_AS_HOMEPAGE:
+            scores[name] = 0.0
+            continue
+
+        lowered = text.lower()
+        token_hits = sum(lowered.count(token) for token in tokens)
+        kilobytes = max(1.0, len(text) / 1024)
+        scores[name] = (code_hits + token_hits) / kilobytes
+
+    return scores
+
+
+class SiteProfiles:
+    """JSON-file store of the best search URL template for each host"""
+
+    def __init__(self, path: str, max_age: float = 30 * 24 * 3600):
+        """
+        Args:
+            path: JSON file the profiles are kept in
+            max_age: Seconds before a host is probed again
+        """
+        self.path = path
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._profiles: Dict[str, Dict] = {}
+
+        if os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    self._profiles = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"Ignoring unreadable site profiles {path}: {e}")
+
+    def template_for(self, site_url: str) -> Optional[str]:
+        """Return the learned template name for a site, or None if it needs probing"""
+        with self._lock:
+            profile = self._profiles.get(host_key(site_url))
+        if not profile or time.time() - profile['probed_at'] > self.max_age:
+            return None
+        return profile['template']
+
+    def search_plan(self, site_url: str, product_name: str) -> Tuple[List[Tuple[str, str]], bool]:
+        """
+        Return the (template name, URL) pairs to fetch for a site, and whether this is a probe
+
+        A profiled host gets its one learned template. An unprofiled host gets
+        every template so that it can be probed.
+        """
+        learned = self.template_for(site_url)
+        if learned is not None:
+            template = dict(SEARCH_URL_TEMPLATES)[learned]
+            return [(learned, expand_template(template, site_url, product_name))], False
+
+        return [(name, expand_template(template, site_url, product_name)) for name, template in SEARCH_URL_TEMPLATES], True
+
+    def learn(self, site_url: str, product_name: str, pages: Sequence[Tuple[str, Optional[str], int]], probing: bool):
+        """
+        Update a site's profile from the pages fetched for one search
+
+        Args:
+            site_url: The site that was searched
+            product_name: The product that was searched for
+            pages: (template name, page text or None if the fetch failed, code matches on the page)
+            probing: Whether the pages came from a full probe of every template
+        """
+        if not probing:
+            # The learned template failed outright: probe again next time
+            if pages and all(text is None for _, text, _ in pages):
+                self.forget(site_url)
+            return
+
+        scores = score_pages(product_name, pages)
+        working = {name: score for name, score in scores.items() if score >= 0}
+        if not working:
+            return
+
+        # Any search template that returned its own results beats the homepage
+        searches = {name: score for name, score in working.items() if name != 'homepage' and score > 0}
+        best = max(searches, key=searches.get) if searches else 'homepage'
+
+        with self._lock:
+            self._profiles[host_key(site_url)] = {
+                'template': best,
+                'probed_at': time.time(),
+                'scores': scores
+            }
+            self._save_locked()
+
+    def forget(self, site_url: str):
+        """Drop a site's profile so that it is probed again"""
+        with self._lock:
+            if self._profiles.pop(host_key(site_url), None) is not None:
+                self._save_locked()
+
+    def _save_locked(self):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        temp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(self._profiles, f, indent=2)
+        os.replace(temp_path, self.path)
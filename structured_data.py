@@ -0,0 +1,205 @@
+"""
+Product codes from a page's structured data, before any full-text scan
+
+Product pages (and some listings) publish their codes for search engines:
+JSON-LD blocks with 'gtin13', 'sku' and 'mpn', microdata attributes such as
+itemprop="sku", and meta tags such as product:retailer_item_id. Those blocks
+are found with regular expressions over the raw HTML, without building a DOM
+or extracting the page's text, and each code comes with the product name
+printed in the same block.
+
+scan_structured turns what it finds into a short synthetic text of
+'<name> <FIELD>: <code>' lines plus CodeMatches into it, the same shape as a
+full-text scan, so evidence collection, candidate ranking and the page index
+treat it like any other page. Codes in the navigation, footer and
+'you may also like' tiles never reach the candidates.
+
+Sites can also be given CSS selectors for the elements that hold their codes.
+Only the selected elements' text is scanned (this one does parse the page,
+with BeautifulSoup).
+"""
+
+import html
+import importlib.util
+import json
+import re
+from typing import List, NamedTuple, Optional, Sequence, Tuple, Union
+
+from code_patterns import CodeMatch, CodePatternSet
+from validation_store import normalize_product_name
+
+# BeautifulSoup's parser for selected elements: lxml when it is installed
+SOUP_PARSER = 'lxml' if importlib.util.find_spec('lxml') is not None else 'html.parser'
+
+# Schema.org properties that hold product identifiers
+CODE_FIELDS = ('gtin', 'gtin8', 'gtin12', 'gtin13', 'gtin14', 'isbn', 'sku', 'mpn', 'productID')
+
+# Meta tag names/properties (after any 'product:' or 'og:' prefix) that hold product identifiers
+META_FIELDS = frozenset(['gtin', 'gtin8', 'gtin12', 'gtin13', 'gtin14', 'ean', 'upc', 'isbn', 'sku', 'mpn',
+                         'retailer_item_id', 'retailer_part_no'])
+
+_CODE_FIELD_SET = frozenset(field.lower() for field in CODE_FIELDS)
+
+_JSON_LD = re.compile(r'<script\b[^>]*\btype\s*=\s*["\']?application/ld\+json["\']?[^>]*>(.*?)</script\s*>',
+                      re.IGNORECASE | re.DOTALL)
+_META_TAG = re.compile(r'<meta\b([^>]*)>', re.IGNORECASE)
+# A tag carrying itemprop, and the text right after it (the value when there is no content attribute)
+_ITEMPROP_TAG = re.compile(r'<[a-zA-Z][\w-]*\b([^>]*\bitemprop\s*=[^>]*)>([^<]*)', re.IGNORECASE)
+_ATTRIBUTE = re.compile(r'([\w:-]+)\s*=\s*(?:"([^"]*)"|\'([^\']*)\'|([^\s"\'>]+))')
+
+
+class StructuredCode(NamedTuple):
+    """A product code published in a page's structured data"""
+    code: str
+    field: str
+    name: str
+    source: str
+
+
+def _text(content: Union[bytes, str]) -> str:
+    if isinstance(content, bytes):
+        return content.decode('utf-8', errors='replace')
+    return content
+
+
+def _attributes(fragment: str) -> dict:
+    return {
+        match.group(1).lower(): html.unescape(next(value for value in match.groups()[1:] if value is not None))
+        for match in _ATTRIBUTE.finditer(fragment)
+    }
+
+
+def _walk_json_ld(node, name: str, found: List[StructuredCode]):
+    if isinstance(node, list):
+        for item in node:
+            _walk_json_ld(item, name, found)
+        return
+    if not isinstance(node, dict):
+        return
+
+    # Offers and variants inherit the name of the product they belong to
+    if isinstance(node.get('name'), str) and node.get('@type') != 'Offer':
+        name = node['name'].strip()
+
+    for key, value in node.items():
+        if key.lower() in _CODE_FIELD_SET and isinstance(value, (str, int)) and str(value).strip():
+            found.append(StructuredCode(str(value).strip(), key, name, 'json-ld'))
+        elif isinstance(value, (dict, list)):
+            _walk_json_ld(value, name, found)
+
+
+def extract_structured_codes(content: Union[bytes, str]) -> List[StructuredCode]:
+    """Return the codes in a page's JSON-LD, microdata and meta tags, each once, in page order"""
+    page = _text(content)
+    found: List[StructuredCode] = []
+
+    for block in _JSON_LD.findall(page):
+        try:
+            data = json.loads(block.strip(), strict=False)
+        except ValueError:
+            continue
+        _walk_json_ld(data, '', found)
+
+    name = ''
+    for match in _ITEMPROP_TAG.finditer(page):
+        attributes = _attributes(match.group(1))
+        value = (attributes['content'] if 'content' in attributes else html.unescape(match.group(2))).strip()
+        for prop in attributes.get('itemprop', '').split():
+            if prop == 'name' and value:
+                name = value
+            elif prop.lower() in _CODE_FIELD_SET and value:
+                found.append(StructuredCode(value, prop, name, 'microdata'))
+
+    meta_name = ''
+    meta_codes = []
+    for match in _META_TAG.finditer(page):
+        attributes = _attributes(match.group(1))
+        key = (attributes.get('property') or attributes.get('name') or '').lower()
+        value = attributes.get('content', '').strip()
+        if not key or not value:
+            continue
+        if key == 'og:title':
+            meta_name = value
+        elif key.split(':')[-1] in META_FIELDS:
+            meta_codes.append((value, key.split(':')[-1]))
+    found.extend(StructuredCode(value, field, meta_name, 'meta') for value, field in meta_codes)
+
+    seen = set()
+    unique = []
+    for item in found:
+        key = (item.code, item.name)
+        if key not in seen:
+            seen.add(key)
+            unique.append(item)
+    return unique
+
+
+def select_text(content: Union[bytes, str], selectors: Sequence[str]) -> str:
+    """Return the text of the elements matching any of the CSS selectors, one element per line"""
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(content, SOUP_PARSER)
+    parts = []
+    for selector in selectors:
+        parts.extend(element.get_text(' ', strip=True) for element in soup.select(selector))
+    return '\n'.join(part for part in parts if part)
+
+
+def _mentions(name: str, product_name: str) -> bool:
+    """Whether a structured block's name has at least half the words of the product searched for"""
+    tokens = [token for token in normalize_product_name(product_name).split() if len(token) >= 3]
+    if not tokens:
+        return True
+    normalized = normalize_product_name(name)
+    return sum(token in normalized for token in tokens) / len(tokens) >= 0.5
+
+
+def scan_structured(content: Union[bytes, str], pattern_set: CodePatternSet, selectors: Optional[Sequence[str]] = None,
+                    product_name: Optional[str] = None,
+                    structured_data: bool = True) -> Optional[Tuple[str, List[CodeMatch]]]:
+    """
+    Scan a page's structured data (and selected elements) for codes the patterns accept
+
+    Args:
+        content: The page's HTML
+        pattern_set: Compiled code patterns
+        selectors: CSS selectors for the elements holding the site's codes
+        product_name: The product searched for, if any. Only structured codes
+            whose block names that product are then kept, so a listing's other
+            products (or a featured item on a search page) do not contribute
+            theirs; codes in unnamed blocks cannot be told apart and are dropped.
+        structured_data: Read JSON-LD, microdata and meta tags (False scans the selected elements only)
+
+    Returns:
+        (text, matches) like a full-text scan, where text holds one
+        '<name> <FIELD>: <code>' line per structured code followed by the
+        selected elements' text; None when nothing matched, so the caller
+        falls back to scanning the whole page.
+    """
+    lines = []
+    matches: List[CodeMatch] = []
+    offset = 0
+
+    def add(line: str, prefix: int, found: List[CodeMatch]):
+        nonlocal offset
+        shift = offset + prefix
+        matches.extend(match._replace(start=match.start + shift, end=match.end + shift) for match in found)
+        lines.append(line)
+        offset += len(line) + 1
+
+    structured = extract_structured_codes(content) if structured_data else []
+    if product_name:
+        structured = [item for item in structured if _mentions(item.name, product_name)]
+
+    for item in structured:
+        label = f"{item.name} {item.field.upper()}: " if item.name else f"{item.field.upper()}: "
+        add(label + item.code, len(label), pattern_set.find_all(item.code))
+
+    if selectors:
+        selected = select_text(content, selectors)
+        if selected:
+            add(selected, 0, pattern_set.find_all(selected))
+
+    if not matches:
+        return None
+    return '\n'.join(lines), matches
@@ -0,0 +1,108 @@
+"""
+Persistent store of web validation outcomes
+
+Each (product, code) pair that web_search_validation has looked up is kept in a
+SQLite file with its match count, sample sources and the time it was checked.
+Product names are normalized so that trivial differences in case, spacing and
+punctuation share one entry. Whether a code counts as validated depends on the
+caller's min_matches, so only the raw match count is stored.
+"""
+
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from typing import Any, Dict, List, Optional
+
+_NON_ALNUM = re.compile(r'[^0-9a-z]+')
+
+
+def normalize_product_name(product_name: str) -> str:
+    """Return the key used for a product name: lowercase words separated by single spaces"""
+    text = unicodedata.normalize('NFKC', product_name).lower()
+    return _NON_ALNUM.sub(' ', text).strip()
+
+
+def normalize_code(code: str) -> str:
+    """Return the key used for a product code"""
+    return code.strip().upper()
+
+
+class ValidationStore:
+    """SQLite-backed (product, code) -> validation outcome store"""
+
+    def __init__(self, path: str, max_age: float = 7 * 24 * 3600):
+        """
+        Args:
+            path: SQLite file to keep outcomes in (parent directories are created)
+            max_age: Seconds an outcome is trusted before it is looked up again
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+        self.path = path
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS validations (
+                product TEXT NOT NULL,
+                code TEXT NOT NULL,
+                matches_found INTEGER NOT NULL,
+                sample_sources TEXT NOT NULL,
+                checked_at REAL NOT NULL,
+                PRIMARY KEY (product, code)
+            )
+        """)
+
+    def get(self, product_name: str, code: str, max_age: float = None) -> Optional[Dict[str, Any]]:
+        """
+        Return the stored outcome for a product and code if it is fresh enough
+
+        Args:
+            product_name: Product name as given by the caller
+            code: Product code as given by the caller
+            max_age: Override the store's freshness limit (seconds)
+        """
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT matches_found, sample_sources, checked_at FROM validations WHERE product = ? AND code = ?',
+                (normalize_product_name(product_name), normalize_code(code))
+            ).fetchone()
+
+        if row is None:
+            return None
+
+        matches_found, sample_sources, checked_at = row
+        limit = self.max_age if max_age is None else max_age
+        if time.time() - checked_at > limit:
+            return None
+
+        return {
+            'matches_found': matches_found,
+            'sample_sources': json.loads(sample_sources),
+            'checked_at': checked_at
+        }
+
+    def put(self, product_name: str, code: str, matches_found: int, sample_sources: List[Dict[str, str]]):
+        """Record the outcome of a web lookup"""
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO validations (product, code, matches_found, sample_sources, checked_at) '
+                'VALUES (?, ?, ?, ?, ?)',
+                (normalize_product_name(product_name), normalize_code(code), matches_found,
+                 json.dumps(sample_sources), time.time())
+            )
+
+    def purge_stale(self) -> int:
+        """Delete outcomes older than max_age, returning how many were removed"""
+        with self._lock:
+            cursor = self._conn.execute('DELETE FROM validations WHERE checked_at < ?', (time.time() - self.max_age,))
+            return cursor.rowcount
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
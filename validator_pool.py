@@ -0,0 +1,210 @@
+"""
+Long-lived ProductValidators shared by the agent tool functions
+
+Every tool call used to build a fresh ProductValidator, and with it a fresh
+requests.Session, so each call paid for new TCP and TLS handshakes to the
+same stores. ValidatorPool keeps a handful of validators alive for the life
+of the process. Each has keep-alive connection pools sized per host, and all
+of them share one response cache, validation store, page index, site profile
+store and Metrics, so what one call learns is available to the next.
+
+A validator is checked out by one caller at a time, so nothing inside it
+needs to be thread-safe beyond the shared stores (which are).
+"""
+
+import atexit
+import queue
+import threading
+from contextlib import contextmanager
+from typing import Iterator, List, Optional
+
+from host_health import HostHealth
+from http_cache import ResponseCache
+from metrics import Metrics
+from page_index import PageIndex
+from site_profiles import SiteProfiles
+from validation_store import ValidationStore
+
+# Response cache size when no path is given and pages are kept in memory
+MEMORY_CACHE_BYTES = 64 * 1024 * 1024
+
+
+class ValidatorPool:
+    """Thread-safe pool of ProductValidators that share caches and stores"""
+
+    def __init__(self, size: int = 4, response_cache=None, validation_store=None, site_profiles=None,
+                 page_index=None, metrics: Optional[Metrics] = None, host_health: Optional[HostHealth] = None,
+                 pool_connections: int = 32, pool_maxsize: Optional[int] = None, **validator_kwargs):
+        """
+        Args:
+            size: Maximum number of validators; callers beyond that wait for one to be returned
+            response_cache: ResponseCache or path shared by every validator (in memory if None)
+            validation_store: ValidationStore or path shared by every validator (in memory if None)
+            site_profiles: SiteProfiles or path shared by every validator (no profiling if None)
+            page_index: PageIndex or path shared by every validator (in memory if None)
+            metrics: Metrics shared by every validator (a new one if None)
+            host_health: HostHealth shared by every validator (a new one if None), so a failing
+                store is paced and skipped by all of them at once
+            pool_connections: Number of hosts each validator keeps connections to
+            pool_maxsize: Keep-alive connections per host (defaults to max_concurrency, so
+                concurrent fetches to one host in async mode reuse their connections)
+            validator_kwargs: Passed to every ProductValidator (async_fetch, host_rate, parser_backend, ...)
+        """
+        self.size = max(1, size)
+        # Stores opened here are closed by close(); passed-in ones belong to the caller
+        self._owned_stores = []
+
+        if response_cache is None:
+            response_cache = ResponseCache(':memory:', max_bytes=MEMORY_CACHE_BYTES)
+            self._owned_stores.append(response_cache)
+        elif isinstance(response_cache, str):
+            response_cache = ResponseCache(response_cache)
+            self._owned_stores.append(response_cache)
+        self.response_cache = response_cache
+
+        if validation_store is None or isinstance(validation_store, str):
+            validation_store = ValidationStore(validation_store or ':memory:')
+            self._owned_stores.append(validation_store)
+        self.validation_store = validation_store
+
+        if isinstance(site_profiles, str):
+            site_profiles = SiteProfiles(site_profiles)
+        self.site_profiles = site_profiles
+
+        if page_index is None or isinstance(page_index, str):
+            page_index = PageIndex(page_index or ':memory:')
+            self._owned_stores.append(page_index)
+        self.page_index = page_index
+
+        self.metrics = metrics if metrics is not None else Metrics()
+        self.host_health = host_health if host_health is not None else HostHealth()
+
+        self.validator_kwargs = dict(validator_kwargs)
+        self.validator_kwargs['pool_connections'] = pool_connections
+        self.validator_kwargs['pool_maxsize'] = pool_maxsize or self.validator_kwargs.get('max_concurrency', 8)
+
+        self._lock = threading.Lock()
+        # LIFO so the most recently used validator, whose connections are warmest, goes out first
+        self._idle = queue.LifoQueue()
+        self._validators: List = []
+        self._closed = False
+
+    def _create(self):
+        # Imported here because product_validator imports this module for its agent functions
+        from product_validator import ProductValidator
+
+        return ProductValidator(
+            response_cache=self.response_cache,
+            validation_store=self.validation_store,
+            site_profiles=self.site_profiles,
+            page_index=self.page_index,
+            metrics=self.metrics,
+            host_health=self.host_health,
+            **self.validator_kwargs
+        )
+
+    def acquire(self, timeout: Optional[float] = None):
+        """
+        Check out a validator, creating one if the pool is not full yet
+
+        Raises:
+            RuntimeError: If the pool has been closed
+            queue.Empty: If no validator was returned within timeout seconds
+        """
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("ValidatorPool is closed")
+            try:
+                return self._idle.get_nowait()
+            except queue.Empty:
+                pass
+            if len(self._validators) < self.size:
+                validator = self._create()
+                self._validators.append(validator)
+                return validator
+
+        return self._idle.get(timeout=timeout)
+
+    def reserve(self, size: int):
+        """Let the pool grow to at least size validators (they are still created on demand)"""
+        with self._lock:
+            self.size = max(self.size, size)
+
+    def release(self, validator):
+        """Return a validator to the pool"""
+        with self._lock:
+            if self._closed:
+                return
+        self._idle.put(validator)
+
+    @contextmanager
+    def validator(self, timeout: Optional[float] = None) -> Iterator:
+        """Check out a validator for the duration of a with block"""
+        validator = self.acquire(timeout)
+        try:
+            yield validator
+        finally:
+            self.release(validator)
+
+    def close(self):
+        """Close every validator's connections and workers, and any stores the pool opened"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            validators, self._validators = self._validators, []
+
+        for validator in validators:
+            validator.close()
+        for store in self._owned_stores:
+            store.close()
+        self._owned_stores = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+_shared_pool: Optional[ValidatorPool] = None
+_shared_lock = threading.Lock()
+
+
+def configure_shared_pool(**kwargs) -> ValidatorPool:
+    """
+    Replace the pool the agent functions use, e.g. to put its caches on disk:
+
+        configure_shared_pool(response_cache=".cache/responses.sqlite",
+                              validation_store=".cache/validations.sqlite")
+
+    Takes the same arguments as ValidatorPool. The previous pool is closed.
+    """
+    global _shared_pool
+    pool = ValidatorPool(**kwargs)
+    with _shared_lock:
+        previous, _shared_pool = _shared_pool, pool
+    if previous is not None:
+        previous.close()
+    return pool
+
+
+def shared_pool() -> ValidatorPool:
+    """Return the process-wide pool, creating it with defaults on first use"""
+    global _shared_pool
+    with _shared_lock:
+        if _shared_pool is None:
+            _shared_pool = ValidatorPool()
+        return _shared_pool
+
+
+def close_shared_pool():
+    """Close the process-wide pool (registered to run at interpreter exit)"""
+    global _shared_pool
+    with _shared_lock:
+        pool, _shared_pool = _shared_pool, None
+    if pool is not None:
+        pool.close()
+
+
+atexit.register(close_shared_pool)